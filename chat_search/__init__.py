@@ -8,8 +8,16 @@ including basic keyword search, ML-based search, and utilities for processing se
 
 from .search_core import (
     calculate_relevance_score,
+    compile_keywords,
     extract_messages,
-    get_message_context
+    iter_messages,
+    get_message_context,
+    keyword_candidate_indices,
+    index_candidate_indices,
+    build_keyword_index,
+    extend_keyword_index,
+    finalize_keyword_index,
+    Filters
 )
 
 from .search_utils import (
@@ -22,18 +30,35 @@ from .search_cli import (
     search_interactive_handler
 )
 
-from .search_ml import (
-    analyze_sentiment,
-    extract_topics,
-    semantic_search,
-    extract_entities,
-    cluster_messages
-)
+# Las funciones de ML se importan al primer acceso: la búsqueda por palabras clave
+# no necesita cargar search_ml ni sus dependencias
+_ML_EXPORTS = frozenset({
+    'analyze_sentiment',
+    'extract_topics',
+    'semantic_search',
+    'extract_entities',
+    'cluster_messages'
+})
+
+
+def __getattr__(name):
+    if name in _ML_EXPORTS:
+        from . import search_ml
+        return getattr(search_ml, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     'calculate_relevance_score',
+    'compile_keywords',
     'extract_messages',
+    'iter_messages',
     'get_message_context',
+    'keyword_candidate_indices',
+    'index_candidate_indices',
+    'build_keyword_index',
+    'extend_keyword_index',
+    'finalize_keyword_index',
+    'Filters',
     'print_results',
     'save_results_to_file',
     'search_command_handler',
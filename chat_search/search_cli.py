@@ -139,6 +139,6 @@ def search_interactive_handler(tool):
     save_option = input("Do you want to save these results to a file? (y/n): ")
     if save_option.lower() == 'y':
         filename = input("Enter filename to save results: ")
-        save_results_to_file(results, filename, contacts=tool.contacts)
+        save_results_to_file(results, filename, contacts=tool.contacts, background=True)
 
     return results
@@ -6,10 +6,324 @@ This module contains the core search functionality for WhatsApp chat data,
 including relevance scoring, message extraction, and context retrieval.
 """
 
+import itertools
+import multiprocessing
+import os
 import re
+import sqlite3
 from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple, Optional
 
-def calculate_relevance_score(message, keywords):
+import numpy as np
+
+# Autómata Aho-Corasick opcional para el prefiltro de palabras clave; con pocas subcadenas
+# la alternancia de expresiones regulares es igual de rápida
+_AHOCORASICK_MIN_NEEDLES = 8
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# Número mínimo de mensajes (en total) para extraerlos en paralelo: por debajo, arrancar
+# el pool cuesta más de lo que ahorra, por muchos chats que haya
+_PARALLEL_MIN_MESSAGES = 20000
+
+# Estado compartido con los procesos del pool de extract_messages
+_POOL_STATE = None
+
+# True en un proceso que ya es trabajador de un pool (p. ej. las búsquedas por categoría de la
+# herramienta unificada): ahí la extracción y la puntuación no abren otro pool, porque el
+# proceso padre ya reparte el trabajo entre los núcleos
+_IN_WORKER_PROCESS = False
+
+def mark_worker_process():
+    """
+    Marca el proceso actual como trabajador de un pool, para que las búsquedas que
+    ejecute corran en serie en lugar de abrir pools anidados.
+    """
+    global _IN_WORKER_PROCESS
+    _IN_WORKER_PROCESS = True
+
+def in_worker_process():
+    """
+    Indica si el proceso actual se marcó con mark_worker_process.
+
+    Retorna:
+    - True si las búsquedas de este proceso deben correr en serie
+    """
+    return _IN_WORKER_PROCESS
+
+# Expresión para contar palabras en un mensaje
+_WORD_RE = re.compile(r'\b\w+\b')
+_SINGLE_WORD_RE = re.compile(r'\w+')
+
+@lru_cache(maxsize=128)
+def _compile_keyword_patterns(keywords):
+    """
+    Compila una sola vez las expresiones regulares de un conjunto de palabras clave.
+
+    Parámetros:
+    - keywords: Tupla de palabras clave
+
+    Retorna:
+    - combined: Expresión con la alternancia de todas las palabras clave, o None si alguna
+      no es una sola palabra (sus coincidencias podrían solaparse con las de otra)
+    - patterns: Diccionario palabra clave en minúsculas -> expresión compilada individual
+    """
+    patterns = {}
+    for keyword in keywords:
+        keyword_lower = keyword.lower().strip()
+        if keyword_lower and keyword_lower not in patterns:
+            patterns[keyword_lower] = re.compile(r'\b' + re.escape(keyword_lower) + r'\b')
+
+    combined = None
+    if patterns and all(_SINGLE_WORD_RE.fullmatch(k) for k in patterns):
+        # Palabras completas: cada coincidencia es exactamente una palabra clave, sin solapamientos
+        alternation = '|'.join(re.escape(k) for k in sorted(patterns, key=len, reverse=True))
+        combined = re.compile(r'\b(?:' + alternation + r')\b')
+    return combined, patterns
+
+@lru_cache(maxsize=128)
+def _keyword_plan(keywords):
+    """
+    Especializa el cálculo de relevancia para una tupla concreta de palabras clave:
+    todo lo que depende solo de las palabras clave se calcula una vez por búsqueda
+    y no en cada mensaje.
+
+    Parámetros:
+    - keywords: Tupla de palabras clave
+
+    Retorna:
+    - combined: Expresión combinada de _compile_keyword_patterns (o None)
+    - plan: Tupla de (keyword, keyword_lower, pattern, partials) por cada palabra clave
+      no vacía, donde partials son los fragmentos para coincidencias parciales
+    """
+    combined, patterns = _compile_keyword_patterns(keywords)
+    plan = []
+    for keyword in keywords:
+        keyword_lower = keyword.lower().strip()
+        if not keyword.strip() or not keyword_lower:  # Ignorar palabras clave vacías
+            continue
+
+        # Fragmentos para coincidencias parciales (al menos 70% de la palabra), solo palabras largas
+        partials = ()
+        if len(keyword_lower) > 4:
+            min_match_length = max(4, int(len(keyword_lower) * 0.7))
+            partials = tuple(keyword_lower[i:i+min_match_length]
+                             for i in range(len(keyword_lower) - min_match_length + 1))
+
+        plan.append((keyword, keyword_lower, patterns[keyword_lower], partials))
+    return combined, tuple(plan)
+
+def compile_keywords(keywords):
+    """
+    Precompila una vez por búsqueda las expresiones y fragmentos de un conjunto de palabras clave,
+    para pasarlos a calculate_relevance_score en cada mensaje.
+
+    Parámetros:
+    - keywords: Lista de palabras clave a buscar
+
+    Retorna:
+    - plan: Resultado de _keyword_plan (expresión combinada y plan por palabra clave)
+    """
+    return _keyword_plan(tuple(keywords))
+
+def _keyword_needles(keywords):
+    """
+    Obtiene las subcadenas mínimas que un mensaje debe contener para que
+    calculate_relevance_score pueda asignarle una puntuación mayor que cero.
+
+    Parámetros:
+    - keywords: Lista de palabras clave a buscar
+
+    Retorna:
+    - needles: Lista ordenada de subcadenas en minúsculas
+    """
+    needles = set()
+    for keyword, keyword_lower, pattern, partials in _keyword_plan(tuple(keywords))[1]:
+        # Toda coincidencia (exacta o parcial) de una palabra larga contiene alguno de sus fragmentos
+        needles.update(partials or (keyword_lower,))
+    return sorted(needles)
+
+@lru_cache(maxsize=128)
+def _needle_pattern(needles):
+    """
+    Compila la alternancia de las subcadenas del prefiltro (las más largas primero).
+
+    Parámetros:
+    - needles: Tupla de subcadenas en minúsculas
+
+    Retorna:
+    - pattern: Expresión compilada que coincide con cualquiera de las subcadenas
+    """
+    return re.compile('|'.join(re.escape(needle) for needle in sorted(needles, key=len, reverse=True)))
+
+@lru_cache(maxsize=128)
+def _needle_automaton(needles):
+    """
+    Construye un autómata Aho-Corasick con las subcadenas del prefiltro, que las busca
+    todas a la vez en una sola pasada lineal sobre el texto.
+
+    Parámetros:
+    - needles: Tupla de subcadenas en minúsculas
+
+    Retorna:
+    - automaton: ahocorasick.Automaton listo para buscar
+    """
+    automaton = ahocorasick.Automaton()
+    for needle in needles:
+        automaton.add_word(needle, needle)
+    automaton.make_automaton()
+    return automaton
+
+def _needle_hits(needles, text):
+    """
+    Recorre el texto una vez y devuelve una posición dentro de cada coincidencia de las subcadenas.
+    Usa el autómata Aho-Corasick si está instalado y hay bastantes subcadenas y, si no,
+    la alternancia de expresiones regulares.
+
+    Parámetros:
+    - needles: Tupla de subcadenas en minúsculas
+    - text: Texto en el que buscar
+
+    Retorna:
+    - hits: Arreglo de NumPy con las posiciones
+    """
+    if AHOCORASICK_AVAILABLE and len(needles) >= _AHOCORASICK_MIN_NEEDLES:
+        # iter() devuelve la posición del último carácter de cada coincidencia
+        return np.fromiter((end for end, _ in _needle_automaton(needles).iter(text)), dtype=np.intp)
+    return np.fromiter((match.start() for match in _needle_pattern(needles).finditer(text)),
+                       dtype=np.intp)
+
+def build_keyword_index(texts=()):
+    """
+    Construye un índice SQLite FTS5 en memoria (tokenizador trigram) sobre los textos en minúsculas.
+    Permite buscar subcadenas de 3 o más caracteres sin recorrer todos los mensajes.
+    Para construirlo por partes mientras se recorren los mensajes, se crea vacío, se amplía con
+    extend_keyword_index y se cierra con finalize_keyword_index.
+
+    Parámetros:
+    - texts: Lista con el texto en minúsculas de cada mensaje; el rowid de cada fila es su índice en la lista
+
+    Retorna:
+    - index: Conexión SQLite con la tabla msgs_fts, o None si FTS5/trigram no está disponible
+    """
+    try:
+        index = sqlite3.connect(':memory:', check_same_thread=False)
+        index.execute(
+            "CREATE VIRTUAL TABLE msgs_fts USING fts5("
+            "text, tokenize='trigram case_sensitive 1', content='')"
+        )
+    except sqlite3.Error:
+        return None
+    if texts:
+        index = finalize_keyword_index(extend_keyword_index(index, texts))
+    return index
+
+def extend_keyword_index(index, texts, start=0):
+    """
+    Añade un lote de textos a un índice de build_keyword_index.
+
+    Parámetros:
+    - index: Índice de build_keyword_index
+    - texts: Lista con el texto en minúsculas de cada mensaje del lote
+    - start: Índice del primer mensaje del lote en el conjunto completo (rowid de su fila)
+
+    Retorna:
+    - index: El mismo índice, o None si no se pudo ampliar (la conexión se cierra)
+    """
+    try:
+        index.executemany(
+            "INSERT INTO msgs_fts(rowid, text) VALUES (?, ?)",
+            enumerate(texts, start)
+        )
+        return index
+    except sqlite3.Error:
+        index.close()
+        return None
+
+def finalize_keyword_index(index):
+    """
+    Termina un índice construido por lotes: confirma las filas y fusiona sus segmentos
+    para que las consultas posteriores recorran un solo árbol.
+
+    Parámetros:
+    - index: Índice de build_keyword_index ampliado con extend_keyword_index
+
+    Retorna:
+    - index: El mismo índice, o None si no se pudo terminar (la conexión se cierra)
+    """
+    try:
+        index.execute("INSERT INTO msgs_fts(msgs_fts) VALUES ('optimize')")
+        index.commit()
+        return index
+    except sqlite3.Error:
+        index.close()
+        return None
+
+def index_candidate_indices(index, keywords):
+    """
+    Consulta en un índice de build_keyword_index los mensajes que pueden coincidir con las
+    palabras clave, sin necesitar sus textos.
+
+    Parámetros:
+    - index: Índice de build_keyword_index
+    - keywords: Lista de palabras clave a buscar
+
+    Retorna:
+    - indices: Arreglo ordenado de NumPy con los índices candidatos, o None si alguna subcadena
+      es demasiado corta para el índice (trigram requiere al menos 3 caracteres)
+    """
+    needles = _keyword_needles(keywords)
+    if not needles:
+        return np.empty(0, dtype=np.intp)
+    if not all(len(needle) >= 3 for needle in needles):
+        return None
+
+    query = ' OR '.join('"' + needle.replace('"', '""') + '"' for needle in needles)
+    rows = index.execute("SELECT rowid FROM msgs_fts WHERE msgs_fts MATCH ?", (query,))
+    return np.sort(np.fromiter((row[0] for row in rows), dtype=np.intp))
+
+def keyword_candidate_indices(texts, keywords, chunk_size=4096, index=None):
+    """
+    Prefiltra por lotes los mensajes que pueden coincidir con las palabras clave, recorriendo
+    cada lote como un único texto y asignando las coincidencias a su mensaje con NumPy.
+    Es un superconjunto exacto de los mensajes con puntuación mayor que cero, así que
+    solo estos necesitan pasar por calculate_relevance_score.
+
+    Parámetros:
+    - texts: Lista con el texto en minúsculas de cada mensaje extraído (columna 'message')
+    - keywords: Lista de palabras clave a buscar
+    - chunk_size: Número de mensajes por lote (limita la memoria del texto unido)
+    - index: Índice de build_keyword_index sobre los mismos textos (opcional)
+
+    Retorna:
+    - indices: Arreglo de NumPy con los índices de los mensajes candidatos
+    """
+    needles = _keyword_needles(keywords)
+    if not needles or not texts:
+        return np.empty(0, dtype=np.intp)
+
+    if index is not None:
+        indices = index_candidate_indices(index, keywords)
+        if indices is not None:
+            return indices
+
+    # Cada lote se une en un solo texto separado por '\0' y se recorre una vez buscando todas
+    # las subcadenas; las posiciones encontradas se asignan a su mensaje con los desplazamientos
+    needles = tuple(needles)
+    found = []
+    for start in range(0, len(texts), chunk_size):
+        chunk = texts[start:start+chunk_size]
+        hits = _needle_hits(needles, '\0'.join(chunk))
+        ends = np.cumsum(np.fromiter(map(len, chunk), dtype=np.intp, count=len(chunk)) + 1) - 1
+        if hits.size:
+            found.append(np.unique(np.searchsorted(ends, hits)) + start)
+    return np.concatenate(found) if found else np.empty(0, dtype=np.intp)
+
+def calculate_relevance_score(message, keywords, message_lower=None, plan=None):
     """
     Calcula una puntuación de relevancia para un mensaje basado en palabras clave.
     Versión mejorada con soporte para coincidencias parciales, proximidad de palabras clave,
@@ -18,6 +332,8 @@ def calculate_relevance_score(message, keywords):
     Parámetros:
     - message: Contenido del mensaje
     - keywords: Lista de palabras clave a buscar
+    - message_lower: Mensaje ya convertido a minúsculas (opcional, evita repetir la conversión)
+    - plan: Resultado de compile_keywords(keywords) (opcional, evita buscarlo en cada mensaje)
 
     Retorna:
     - score: Puntuación de relevancia (0-100)
@@ -28,40 +344,36 @@ def calculate_relevance_score(message, keywords):
     if not message or not keywords:
         return 0, [], {}, {}
 
-    message_lower = message.lower()
+    if message_lower is None:
+        message_lower = message.lower()
     matched_keywords = []
     partial_matches = []
     keyword_positions = {}
 
+    # Encontrar todas las palabras clave en una sola pasada cuando es posible
+    combined, plan = plan if plan is not None else _keyword_plan(tuple(keywords))
+    hit_positions = None
+    if combined is not None:
+        hit_positions = {}
+        for match in combined.finditer(message_lower):
+            hit_positions.setdefault(match.group(), []).append(match.start())
+
     # Contar ocurrencias de cada palabra clave (palabras completas y coincidencias parciales)
     keyword_counts = {}
-    for keyword in keywords:
-        if not keyword.strip():  # Ignorar palabras clave vacías
-            continue
-
-        keyword_lower = keyword.lower().strip()
-        if not keyword_lower:  # Ignorar después de strip si está vacío
-            continue
-
-        # 1. Buscar palabras completas usando expresiones regulares
-        pattern = r'\b' + re.escape(keyword_lower) + r'\b'
-        matches = re.findall(pattern, message_lower)
-        count = len(matches)
-
-        # 2. Encontrar posiciones de las palabras clave para análisis de proximidad
-        positions = []
-        for match in re.finditer(pattern, message_lower):
-            positions.append(match.start())
+    for keyword, keyword_lower, pattern, partials in plan:
+        # 1. Buscar palabras completas y sus posiciones (para análisis de proximidad)
+        if hit_positions is not None:
+            positions = hit_positions.get(keyword_lower, [])
+        else:
+            positions = [match.start() for match in pattern.finditer(message_lower)]
+        count = len(positions)
 
         if positions:
             keyword_positions[keyword_lower] = positions
 
-        # 3. Buscar coincidencias parciales si no hay coincidencias exactas
-        if count == 0 and len(keyword_lower) > 4:  # Solo para palabras clave más largas
-            # Buscar coincidencias parciales (al menos 70% de la palabra)
-            min_match_length = max(4, int(len(keyword_lower) * 0.7))
-            for i in range(len(keyword_lower) - min_match_length + 1):
-                partial = keyword_lower[i:i+min_match_length]
+        # 2. Buscar coincidencias parciales si no hay coincidencias exactas
+        if count == 0 and partials:  # Solo para palabras clave más largas
+            for partial in partials:
                 if partial in message_lower:
                     partial_matches.append(keyword)
                     # Dar menos peso a las coincidencias parciales (50%)
@@ -85,7 +397,7 @@ def calculate_relevance_score(message, keywords):
         return 0, [], {}, {}
 
     # Contar palabras totales en el mensaje
-    total_words = len(re.findall(r'\b\w+\b', message_lower))
+    total_words = len(_WORD_RE.findall(message_lower))
 
     # Contar palabras clave totales
     total_keywords = sum(keyword_counts.values())
@@ -102,7 +414,7 @@ def calculate_relevance_score(message, keywords):
     # Ajustar por densidad de palabras clave (mensajes con mayor proporción de palabras clave son más relevantes)
     density_score = min(100, keyword_density * 100)
 
-    # 4. Calcular factor de proximidad (palabras clave cercanas entre sí son más relevantes)
+    # 3. Calcular factor de proximidad (palabras clave cercanas entre sí son más relevantes)
     proximity_factor = 1.0
     if len(keyword_positions) > 1:
         # Calcular la distancia mínima entre palabras clave diferentes
@@ -125,7 +437,7 @@ def calculate_relevance_score(message, keywords):
             top_proximities = sorted(min_distances, reverse=True)[:min(3, len(min_distances))]
             proximity_factor = 1.0 + (sum(top_proximities) / len(top_proximities)) * 0.5  # Hasta 50% de bonificación
 
-    # 5. Calcular factor de posición (palabras clave al principio del mensaje son más relevantes)
+    # 4. Calcular factor de posición (palabras clave al principio del mensaje son más relevantes)
     position_factor = 1.0
     if keyword_positions:
         # Encontrar la posición de la primera palabra clave
@@ -192,11 +504,11 @@ def get_message_context(data, chat_id, msg_id, contacts=None, context_size=2):
         chat_data = data.get(chat_id, {})
         messages = chat_data.get('messages', {})
 
-        # Encontrar el índice del mensaje actual
-        message_ids = list(messages.keys())
-        if msg_id not in message_ids:
+        # Encontrar el índice del mensaje actual (sin recorrer la lista dos veces)
+        if msg_id not in messages:
             return context
 
+        message_ids = list(messages)
         current_index = message_ids.index(msg_id)
 
         # Obtener mensajes anteriores
@@ -388,6 +700,235 @@ def get_message_context(data, chat_id, msg_id, contacts=None, context_size=2):
 
     return context
 
+def _extract_chat_messages(chat_id, chat_data, data, contacts, filters):
+    """
+    Extrae los mensajes de un solo chat aplicando los filtros de extract_messages.
+
+    Parámetros:
+    - chat_id: Identificador del chat
+    - chat_data: Datos del chat
+    - data: Datos de WhatsApp completos (para el resolvedor de contactos)
+    - contacts: Diccionario de contactos (opcional)
+    - filters: Tupla (start_timestamp, end_timestamp, chat_filter, sender_filter, phone_filter)
+
+    Retorna:
+    - messages: Lista de mensajes extraídos del chat
+    """
+    start_timestamp, end_timestamp, chat_filter, sender_filter, phone_filter = filters
+    chat_messages = []
+
+    # Extraer el número de teléfono limpio del chat_id para buscar en contactos
+    chat_phone_raw = chat_id.partition('@')[0]
+
+    # Obtener nombre del chat
+    chat_name = None
+
+    # Primero intentar buscar directamente en los contactos
+    if contacts and chat_phone_raw in contacts:
+        contact_info = contacts[chat_phone_raw]
+        if contact_info.get('display_name'):
+            chat_name = contact_info.get('display_name')
+
+    # Si no se encontró nombre en los contactos, usar el nombre guardado en los datos
+    if not chat_name:
+        chat_name = chat_data.get('name', chat_id)
+
+        # Si el nombre sigue siendo el chat_id, intentar formatear el número
+        if chat_name == chat_id:
+            chat_name = format_phone_number(chat_id, contacts)
+
+    # Aplicar filtro de chat si se proporciona
+    if chat_filter and chat_filter.lower() not in chat_name.lower():
+        return []
+
+    # Obtener mensajes
+    messages = chat_data.get('messages', {})
+
+    # Iterar a través de los mensajes
+    for msg_id, message in messages.items():
+        # Obtener marca de tiempo
+        msg_timestamp = message.get('timestamp', 0)
+        # Si no hay timestamp, intentar con time
+        if not msg_timestamp and message.get('time'):
+            # Convertir time a timestamp si es posible
+            try:
+                # Asumimos que time es una cadena con formato HH:MM
+                # y que el mensaje es de hoy
+                time_str = message.get('time', '')
+                if time_str:
+                    today = datetime.now().strftime('%Y-%m-%d')
+                    datetime_str = f"{today} {time_str}"
+                    msg_timestamp = datetime.strptime(datetime_str, '%Y-%m-%d %H:%M').timestamp()
+            except Exception:
+                # Si hay algún error, usar 0 como timestamp
+                pass
+
+        # Aplicar filtros de fecha (antes de buscar el contenido: descarta el mensaje con un solo acceso)
+        if start_timestamp and msg_timestamp < start_timestamp:
+            continue
+        if end_timestamp and msg_timestamp > end_timestamp:
+            continue
+
+        # Obtener contenido del mensaje
+        msg_content = message.get('content', '')
+        # Si no hay contenido, intentar con data o caption
+        if not msg_content:
+            msg_content = message.get('data', '')
+        if not msg_content and message.get('caption'):
+            msg_content = message.get('caption', '')
+        if not msg_content:
+            continue
+
+        # Obtener información del remitente
+        sender_name = message.get('sender', 'Desconocido')
+        sender_id = message.get('sender_id', '')
+        from_me = message.get('from_me', False)
+
+        # Verificar si hay un remitente resuelto previamente
+        if message.get('resolved_sender') and message.get('resolution_confidence', 0) > 50:
+            sender_name = message['resolved_sender']
+
+        # Si no hay sender_id pero hay sender, usar sender como sender_id
+        if not sender_id and sender_name and sender_name != 'Desconocido':
+            sender_id = sender_name
+
+        # Si el sender_id es "None" o "Desconocido" como string, intentar inferirlo del contexto
+        if sender_id == "None" or sender_id == "Desconocido":
+            # En chats individuales, el remitente probablemente es el chat_id
+            if '-' not in chat_id:  # No es un grupo
+                sender_id = chat_id
+
+        # Aplicar filtro de teléfono si se proporciona (solo depende del sender_id, así que se
+        # descarta el mensaje antes de consultar contactos y el resolvedor)
+        if phone_filter and (not sender_id or phone_filter not in sender_id):
+            continue
+
+        # Extraer número de teléfono limpio del sender_id
+        sender_phone_raw = sender_id.partition('@')[0] if sender_id else sender_id
+
+        # Buscar nombre del remitente en los contactos
+        contact_name = None
+        if contacts and sender_phone_raw and sender_phone_raw in contacts:
+            contact_info = contacts[sender_phone_raw]
+            if contact_info.get('display_name'):
+                contact_name = contact_info.get('display_name')
+                sender_name = contact_name
+
+        # Intentar usar el resolvedor avanzado si está disponible
+        try:
+            from contact_resolver import get_resolver
+            resolver = get_resolver(contacts_data=contacts, chat_data=data)
+            if resolver and sender_id:
+                contact_info = resolver.resolve_contact(
+                    sender_id,
+                    context={"chat_id": chat_id, "message_id": msg_id}
+                )
+                if contact_info['confidence'] > 50:
+                    sender_name = contact_info['display_name']
+                    formatted_phone = contact_info['phone']
+                    contact_name = sender_name
+                else:
+                    # Formatear número de teléfono
+                    formatted_phone = format_phone_number(sender_id, contacts) if sender_id else "Desconocido"
+            else:
+                # Formatear número de teléfono
+                formatted_phone = format_phone_number(sender_id, contacts) if sender_id else "Desconocido"
+        except Exception:
+            # Si hay error con el resolvedor, usar el método tradicional
+            formatted_phone = format_phone_number(sender_id, contacts) if sender_id else "Desconocido"
+
+        # Determinar qué mostrar para el remitente
+        if from_me:
+            sender_display = "Yo"
+        elif contact_name:
+            # Si tenemos un nombre de contacto, usarlo
+            sender_display = contact_name
+        elif not sender_name or sender_name == "Desconocido":
+            if sender_id and sender_id != "None" and sender_id != "Desconocido":
+                sender_display = formatted_phone
+            else:
+                # Para chats individuales, usar el nombre del chat como último recurso
+                if '-' not in chat_id and chat_name and chat_name != chat_id:
+                    sender_display = chat_name
+                else:
+                    sender_display = "Desconocido"
+        else:
+            sender_display = sender_name
+
+        # Aplicar filtro de remitente si se proporciona
+        if sender_filter:
+            if from_me and sender_filter.lower() in "yo":
+                pass  # Permitir coincidencia con "yo" para mensajes propios
+            elif not from_me and sender_filter.lower() not in sender_display.lower():
+                continue
+
+        # Formatear marca de tiempo como fecha legible
+        date_str = datetime.fromtimestamp(msg_timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+        # Añadir mensaje a la lista
+        chat_messages.append({
+            'chat_id': chat_id,
+            'chat_phone': chat_phone_raw,
+            'chat_name': chat_name,
+            'msg_id': msg_id,
+            'sender': sender_display,
+            'sender_id': sender_id,
+            'sender_phone': sender_phone_raw,
+            'phone': formatted_phone,
+            'contact_name': contact_name,
+            'from_me': from_me,
+            'date': date_str,
+            'timestamp': msg_timestamp,
+            'message': msg_content
+        })
+
+    return chat_messages
+
+def _extract_chat_worker(item):
+    """Extrae un chat dentro de un proceso del pool (los datos compartidos se heredan por fork)"""
+    data, contacts, filters = _POOL_STATE
+    return _extract_chat_messages(item[0], item[1], data, contacts, filters)
+
+class Filters(NamedTuple):
+    """
+    Filtros de extracción de mensajes que reciben los modos de análisis.
+    Es inmutable y hashable, así que puede formar parte de una clave de caché directamente.
+    """
+    chat: Optional[str] = None
+    sender: Optional[str] = None
+    phone: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+    @classmethod
+    def coerce(cls, filters):
+        """
+        Convierte None, un diccionario de filtros o un Filters en Filters.
+
+        Parámetros:
+        - filters: Filtros a convertir (las claves desconocidas de un diccionario se ignoran)
+
+        Retorna:
+        - filters: Instancia de Filters
+        """
+        if isinstance(filters, cls):
+            return filters
+        if not filters:
+            return cls()
+        return cls(*(filters.get(field) for field in cls._fields))
+
+    def get(self, key, default=None):
+        """Acceso estilo diccionario, para el código que recibe los filtros como dict"""
+        value = getattr(self, key) if key in self._fields else None
+        return default if value is None else value
+
+    def active(self):
+        """
+        Retorna un diccionario solo con los filtros establecidos.
+        Los mismos filtros dan el mismo diccionario tanto si llegaron como dict parcial o completo.
+        """
+        return {field: value for field, value in zip(self._fields, self) if value}
+
 def extract_messages(data, contacts=None, chat_filter=None, start_date=None, end_date=None, sender_filter=None, phone_filter=None):
     """
     Extrae mensajes de los datos de WhatsApp con filtros opcionales.
@@ -404,8 +945,27 @@ def extract_messages(data, contacts=None, chat_filter=None, start_date=None, end
     Retorna:
     - messages: Lista de mensajes extraídos
     """
-    all_messages = []
+    return list(iter_messages(data, contacts=contacts, chat_filter=chat_filter,
+                              start_date=start_date, end_date=end_date,
+                              sender_filter=sender_filter, phone_filter=phone_filter))
+
+def iter_messages(data, contacts=None, chat_filter=None, start_date=None, end_date=None, sender_filter=None, phone_filter=None):
+    """
+    Genera uno a uno los mensajes que devolvería extract_messages, en el mismo orden,
+    para que quien los consume pueda descartarlos sin tener la lista completa en memoria.
 
+    Parámetros:
+    - data: Datos de WhatsApp
+    - contacts: Diccionario de contactos (opcional)
+    - chat_filter: Filtro de nombre de chat (opcional)
+    - start_date: Fecha de inicio (YYYY-MM-DD) (opcional)
+    - end_date: Fecha de fin (YYYY-MM-DD) (opcional)
+    - sender_filter: Filtro de nombre de remitente (opcional)
+    - phone_filter: Filtro de número de teléfono (opcional)
+
+    Retorna:
+    - Generador de mensajes extraídos
+    """
     # Convertir fechas a marcas de tiempo si se proporcionan
     start_timestamp = None
     end_timestamp = None
@@ -423,171 +983,35 @@ def extract_messages(data, contacts=None, chat_filter=None, start_date=None, end
         except ValueError:
             print(f"Formato de fecha de fin inválido: {end_date}. Usar formato YYYY-MM-DD.")
 
-    # Iterar a través de los chats
-    for chat_id, chat_data in data.items():
-        # Extraer el número de teléfono limpio del chat_id para buscar en contactos
-        chat_phone_raw = chat_id.split('@')[0] if '@' in chat_id else chat_id
-
-        # Obtener nombre del chat
-        chat_name = None
-
-        # Primero intentar buscar directamente en los contactos
-        if contacts and chat_phone_raw in contacts:
-            contact_info = contacts[chat_phone_raw]
-            if contact_info.get('display_name'):
-                chat_name = contact_info.get('display_name')
+    filters = (start_timestamp, end_timestamp, chat_filter, sender_filter, phone_filter)
 
-        # Si no se encontró nombre en los contactos, usar el nombre guardado en los datos
-        if not chat_name:
-            chat_name = chat_data.get('name', chat_id)
-
-            # Si el nombre sigue siendo el chat_id, intentar formatear el número
-            if chat_name == chat_id:
-                chat_name = format_phone_number(chat_id, contacts)
-
-        # Aplicar filtro de chat si se proporciona
-        if chat_filter and chat_filter.lower() not in chat_name.lower():
-            continue
-
-        # Obtener mensajes
-        messages = chat_data.get('messages', {})
-
-        # Iterar a través de los mensajes
-        for msg_id, message in messages.items():
-            # Obtener contenido del mensaje
-            msg_content = message.get('content', '')
-            # Si no hay contenido, intentar con data o caption
-            if not msg_content:
-                msg_content = message.get('data', '')
-            if not msg_content and message.get('caption'):
-                msg_content = message.get('caption', '')
-            if not msg_content:
-                continue
-
-            # Obtener marca de tiempo
-            msg_timestamp = message.get('timestamp', 0)
-            # Si no hay timestamp, intentar con time
-            if not msg_timestamp and message.get('time'):
-                # Convertir time a timestamp si es posible
-                try:
-                    # Asumimos que time es una cadena con formato HH:MM
-                    # y que el mensaje es de hoy
-                    time_str = message.get('time', '')
-                    if time_str:
-                        today = datetime.now().strftime('%Y-%m-%d')
-                        datetime_str = f"{today} {time_str}"
-                        msg_timestamp = datetime.strptime(datetime_str, '%Y-%m-%d %H:%M').timestamp()
-                except Exception:
-                    # Si hay algún error, usar 0 como timestamp
-                    pass
-
-            # Aplicar filtros de fecha
-            if start_timestamp and msg_timestamp < start_timestamp:
-                continue
-            if end_timestamp and msg_timestamp > end_timestamp:
-                continue
-
-            # Obtener información del remitente
-            sender_name = message.get('sender', 'Desconocido')
-            sender_id = message.get('sender_id', '')
-            from_me = message.get('from_me', False)
-
-            # Verificar si hay un remitente resuelto previamente
-            if message.get('resolved_sender') and message.get('resolution_confidence', 0) > 50:
-                sender_name = message['resolved_sender']
-
-            # Si no hay sender_id pero hay sender, usar sender como sender_id
-            if not sender_id and sender_name and sender_name != 'Desconocido':
-                sender_id = sender_name
-
-            # Si el sender_id es "None" o "Desconocido" como string, intentar inferirlo del contexto
-            if sender_id == "None" or sender_id == "Desconocido":
-                # En chats individuales, el remitente probablemente es el chat_id
-                if '-' not in chat_id:  # No es un grupo
-                    sender_id = chat_id
-
-            # Extraer número de teléfono limpio del sender_id
-            sender_phone_raw = sender_id.split('@')[0] if sender_id and '@' in sender_id else sender_id
-
-            # Buscar nombre del remitente en los contactos
-            contact_name = None
-            if contacts and sender_phone_raw and sender_phone_raw in contacts:
-                contact_info = contacts[sender_phone_raw]
-                if contact_info.get('display_name'):
-                    contact_name = contact_info.get('display_name')
-                    sender_name = contact_name
-
-            # Intentar usar el resolvedor avanzado si está disponible
-            try:
-                from contact_resolver import get_resolver
-                resolver = get_resolver(contacts_data=contacts, chat_data=data)
-                if resolver and sender_id:
-                    contact_info = resolver.resolve_contact(
-                        sender_id,
-                        context={"chat_id": chat_id, "message_id": msg_id}
-                    )
-                    if contact_info['confidence'] > 50:
-                        sender_name = contact_info['display_name']
-                        formatted_phone = contact_info['phone']
-                        contact_name = sender_name
-                    else:
-                        # Formatear número de teléfono
-                        formatted_phone = format_phone_number(sender_id, contacts) if sender_id else "Desconocido"
-                else:
-                    # Formatear número de teléfono
-                    formatted_phone = format_phone_number(sender_id, contacts) if sender_id else "Desconocido"
-            except Exception:
-                # Si hay error con el resolvedor, usar el método tradicional
-                formatted_phone = format_phone_number(sender_id, contacts) if sender_id else "Desconocido"
-
-            # Determinar qué mostrar para el remitente
-            if from_me:
-                sender_display = "Yo"
-            elif contact_name:
-                # Si tenemos un nombre de contacto, usarlo
-                sender_display = contact_name
-            elif not sender_name or sender_name == "Desconocido":
-                if sender_id and sender_id != "None" and sender_id != "Desconocido":
-                    sender_display = formatted_phone
-                else:
-                    # Para chats individuales, usar el nombre del chat como último recurso
-                    if '-' not in chat_id and chat_name and chat_name != chat_id:
-                        sender_display = chat_name
-                    else:
-                        sender_display = "Desconocido"
-            else:
-                sender_display = sender_name
-
-            # Aplicar filtro de remitente si se proporciona
-            if sender_filter:
-                if from_me and sender_filter.lower() in "yo":
-                    pass  # Permitir coincidencia con "yo" para mensajes propios
-                elif not from_me and sender_filter.lower() not in sender_display.lower():
-                    continue
-
-            # Aplicar filtro de teléfono si se proporciona
-            if phone_filter and (not sender_id or phone_filter not in sender_id):
-                continue
-
-            # Formatear marca de tiempo como fecha legible
-            date_str = datetime.fromtimestamp(msg_timestamp).strftime('%Y-%m-%d %H:%M:%S')
+    # Con muchos mensajes, repartir los chats entre procesos (solo con fork: los datos no se copian por pickle)
+    processes = os.cpu_count() or 1
+    if (processes > 1 and not _IN_WORKER_PROCESS and len(data) > 1
+            and 'fork' in multiprocessing.get_all_start_methods()
+            and sum(len(chat_data.get('messages', {})) for chat_data in data.values()) >= _PARALLEL_MIN_MESSAGES):
+        # Construir el resolvedor de contactos antes del fork, para que los procesos lo hereden
+        # en lugar de construir cada uno el suyo sobre todos los datos
+        try:
+            from contact_resolver import get_resolver
+            get_resolver(contacts_data=contacts, chat_data=data)
+        except Exception:
+            pass
 
-            # Añadir mensaje a la lista
-            all_messages.append({
-                'chat_id': chat_id,
-                'chat_name': chat_name,
-                'msg_id': msg_id,
-                'sender': sender_display,
-                'sender_id': sender_id,
-                'phone': formatted_phone,
-                'contact_name': contact_name,
-                'from_me': from_me,
-                'date': date_str,
-                'timestamp': msg_timestamp,
-                'message': msg_content
-            })
+        global _POOL_STATE
+        _POOL_STATE = (data, contacts, filters)
+        try:
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                # imap (ordenado) conserva el orden original de los mensajes
+                chunks = pool.imap(_extract_chat_worker, data.items(), chunksize=16)
+                yield from itertools.chain.from_iterable(chunks)
+        finally:
+            _POOL_STATE = None
+        return
 
-    return all_messages
+    # Iterar a través de los chats
+    for chat_id, chat_data in data.items():
+        yield from _extract_chat_messages(chat_id, chat_data, data, contacts, filters)
 
 # Import format_phone_number from whatsapp_core to avoid circular imports
 from whatsapp_core import format_phone_number
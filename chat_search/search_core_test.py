@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from chat_search import search_core
+from chat_search.search_core import (_keyword_needles, build_keyword_index, calculate_relevance_score,
+                                     extend_keyword_index, finalize_keyword_index, index_candidate_indices,
+                                     keyword_candidate_indices)
+
+# Palabras clave con acentos, mayúsculas, frases y caracteres de varios bytes en UTF-8;
+# "ok" e "ñu" producen subcadenas demasiado cortas para el índice trigram
+KEYWORDS = ["café", "Niño", "canción", "precio", "envío", "AÑO", "über", "日本語", "straße",
+            "buen precio", "ok", "ñu", "cotización", "İstanbul", "😀feliz"]
+
+FILLER = ["hola", "gracias", "mañana", "qué", "tal", "€", "😀", "🇪🇸", "中文", "ßß", "İ", "ǅ",
+          "", " ", ",", ".", "!", "¿", "\n", "a", "e"]
+
+
+def _random_message(rng):
+    """Mensaje aleatorio con palabras de relleno y palabras clave enteras, cortadas o pegadas"""
+    parts = []
+    for _ in range(rng.randint(0, 12)):
+        roll = rng.random()
+        if roll < 0.3:
+            keyword = rng.choice(KEYWORDS)
+            variant = rng.choice([keyword, keyword.upper(), keyword.lower(), keyword.title()])
+            cut = rng.randint(0, len(variant))
+            parts.append(rng.choice([variant, variant[:cut], variant[cut:], variant + rng.choice(FILLER)]))
+        else:
+            parts.append(rng.choice(FILLER))
+    return rng.choice(["", " ", ""]).join(parts)
+
+
+def _random_case(seed):
+    rng = random.Random(seed)
+    messages = [_random_message(rng) for _ in range(rng.randint(1, 300))]
+    keywords = rng.sample(KEYWORDS, rng.randint(1, len(KEYWORDS)))
+    return messages, keywords
+
+
+def _scored(messages, keywords):
+    return {i for i, message in enumerate(messages) if calculate_relevance_score(message, keywords)[0] > 0}
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_regex_prefilter_is_superset(seed, monkeypatch):
+    monkeypatch.setattr(search_core, "AHOCORASICK_AVAILABLE", False)
+    messages, keywords = _random_case(seed)
+    texts = [message.lower() for message in messages]
+
+    candidates = set(keyword_candidate_indices(texts, keywords, chunk_size=17).tolist())
+    assert _scored(messages, keywords) <= candidates
+
+@pytest.mark.parametrize("seed", range(40))
+def test_ahocorasick_prefilter_is_superset(seed, monkeypatch):
+    if not search_core.AHOCORASICK_AVAILABLE:
+        pytest.skip("pyahocorasick no está instalado")
+    monkeypatch.setattr(search_core, "_AHOCORASICK_MIN_NEEDLES", 1)
+    messages, keywords = _random_case(seed)
+    texts = [message.lower() for message in messages]
+
+    candidates = set(keyword_candidate_indices(texts, keywords, chunk_size=17).tolist())
+    assert _scored(messages, keywords) <= candidates
+
+    # Las posiciones del autómata deben caer en el mismo mensaje que las de la expresión regular
+    monkeypatch.setattr(search_core, "AHOCORASICK_AVAILABLE", False)
+    assert candidates == set(keyword_candidate_indices(texts, keywords, chunk_size=17).tolist())
+
+@pytest.mark.parametrize("seed", range(40))
+def test_fts5_prefilter_is_superset(seed, monkeypatch):
+    monkeypatch.setattr(search_core, "AHOCORASICK_AVAILABLE", False)
+    messages, keywords = _random_case(seed)
+    texts = [message.lower() for message in messages]
+    index = build_keyword_index(texts)
+    if index is None:
+        pytest.skip("SQLite sin FTS5/trigram")
+
+    indices = index_candidate_indices(index, keywords)
+    if indices is None:
+        # Solo se rechaza la consulta si alguna subcadena es más corta que un trigrama
+        assert any(len(needle) < 3 for needle in _keyword_needles(keywords))
+    else:
+        assert _scored(messages, keywords) <= set(indices.tolist())
+
+    # Con el índice (o su alternativa si no sirve) el resultado sigue siendo un superconjunto
+    candidates = set(keyword_candidate_indices(texts, keywords, index=index).tolist())
+    assert _scored(messages, keywords) <= candidates
+
+@pytest.mark.parametrize("seed", range(10))
+def test_fts5_index_built_by_chunks_matches_one_shot(seed):
+    messages, keywords = _random_case(seed)
+    texts = [message.lower() for message in messages]
+    whole = build_keyword_index(texts)
+    if whole is None:
+        pytest.skip("SQLite sin FTS5/trigram")
+
+    chunked = build_keyword_index()
+    for start in range(0, len(texts), 17):
+        chunked = extend_keyword_index(chunked, texts[start:start+17], start)
+    chunked = finalize_keyword_index(chunked)
+
+    expected = index_candidate_indices(whole, keywords)
+    indices = index_candidate_indices(chunked, keywords)
+    if expected is None:
+        assert indices is None
+    else:
+        assert indices.tolist() == expected.tolist()
+
+def test_fts5_prefilter_with_long_keywords():
+    messages = ["Precio del CAFÉ", "canción de cuna", "日本語を話す", "nada", "Straße", "envio sin tilde"]
+    keywords = ["café", "Canción", "日本語", "straße", "envío"]
+    index = build_keyword_index([message.lower() for message in messages])
+    if index is None:
+        pytest.skip("SQLite sin FTS5/trigram")
+
+    indices = index_candidate_indices(index, keywords)
+    assert indices is not None
+    assert _scored(messages, keywords) <= set(indices.tolist())
+    assert set(indices.tolist()) == {0, 1, 2, 4}
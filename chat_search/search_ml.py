@@ -8,35 +8,92 @@ Optimized for Intel CPUs and GPUs.
 """
 
 import os
+import importlib.util
 import pickle
 import hashlib
+import sqlite3
+from collections import Counter
+from contextlib import closing
 import numpy as np
 from datetime import datetime
 from tqdm import tqdm
 import platform
 import sys
-
-from .search_core import extract_messages, get_message_context
+from functools import lru_cache
+
+from .search_core import Filters, extract_messages, get_message_context
+
+# zstandard is optional: when installed the embeddings cache file is written compressed
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Magic number at the start of a zstd frame (older cache files are plain pickles)
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Modules required by the ML features
+_ML_MODULES = ("sklearn", "nltk", "spacy", "textblob", "sentence_transformers", "transformers", "torch")
+
+# Message count above which extract_entities runs spaCy in several processes
+ENTITY_MULTIPROCESS_MIN = 10000
+
+# Message count from which cluster_messages fits MiniBatchKMeans instead of full K-means
+CLUSTER_MINIBATCH_MIN = 20000
+CLUSTER_MINIBATCH_SIZE = 1024
+
+# spaCy components that are never loaded: only NER is used (it has its own tok2vec)
+ENTITY_UNUSED_PIPES = ("morphologizer", "parser", "attribute_ruler", "lemmatizer", "senter")
+
+# Persistent cache of semantic query results (stored in the tool's cache_dir)
+SEMANTIC_CACHE_FILE = "semantic_queries.db"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Cached queries expire after SEMANTIC_CACHE_TTL seconds without a hit; only the most recently
+# used SEMANTIC_CACHE_MAX_ENTRIES are kept
+SEMANTIC_CACHE_TTL = 7 * 24 * 3600
+SEMANTIC_CACHE_MAX_ENTRIES = 500
+
+# Sentence embedding model, and the persistent store of message embeddings computed with it
+# (keyed by SHA-256 of model name and text, stored as float32 so stored and fresh vectors match).
+# Stored vectors expire after EMBEDDING_STORE_TTL seconds without a lookup; only the most recently
+# used EMBEDDING_STORE_MAX_ENTRIES are kept (about 3 KB each for a 768-dimension model)
+EMBEDDING_MODEL_NAME = 'paraphrase-multilingual-mpnet-base-v2'
+EMBEDDING_STORE_FILE = "message_embeddings.db"
+EMBEDDING_STORE_BATCH = 900
+EMBEDDING_STORE_TTL = 30 * 24 * 3600
+EMBEDDING_STORE_MAX_ENTRIES = 100000
+
+# Random-projection LSH over cached query embeddings: LSH_BITS hyperplanes give a bucket
+# signature, and lookups probe every bucket within LSH_RADIUS bit flips
+LSH_BITS = 12
+LSH_RADIUS = 2
+LSH_SEED = 1729
+
+# Texts per model forward pass when embedding messages (GPU / CPU), and texts per progress step
+EMBED_BATCH_SIZE_GPU = 256
+EMBED_BATCH_SIZE_CPU = 32
+EMBED_CHUNK_SIZE = 1000
+# Run the sentence model in FP16 on CUDA GPUs (embeddings are converted back to float32)
+EMBED_HALF_PRECISION_GPU = True
+
+# Cached query embeddings are scanned as int8 codes; candidates whose approximate similarity
+# is within SQ8_MARGIN of the threshold are re-checked against their float32 embedding
+SQ8_MARGIN = 0.02
+SQ8_BLOCK_ROWS = 256
+SQ8_MAX_REFINE = 8
 
 # Check if ML dependencies are installed
+@lru_cache(maxsize=1)
 def check_ml_dependencies():
     """
     Check if ML dependencies are installed.
+    Only locates the modules (without importing them); the result is computed once per process.
 
     Returns:
     - installed: True if installed, False otherwise
     """
-    try:
-        import sklearn
-        import nltk
-        import spacy
-        import textblob
-        import sentence_transformers
-        import transformers
-        import torch
-        return True
-    except ImportError:
-        return False
+    return all(importlib.util.find_spec(module) is not None for module in _ML_MODULES)
 
 # Check for Intel optimizations
 def check_intel_optimizations():
@@ -135,8 +192,11 @@ def check_intel_optimizations():
 # Global variable to track ML availability
 ML_AVAILABLE = check_ml_dependencies()
 
-# Check for Intel optimizations
-INTEL_OPTIMIZATIONS = check_intel_optimizations()
+# Optional gensim backend for topic extraction (multi-process LDA), imported when used
+GENSIM_AVAILABLE = importlib.util.find_spec("gensim") is not None
+
+# Intel optimizations, detected on first ML use (probing imports the Intel extensions)
+INTEL_OPTIMIZATIONS = None
 
 
 # Check for Intel oneAPI
@@ -195,11 +255,82 @@ def check_oneapi_environment():
 # Check for oneAPI
 ONEAPI_INFO = check_oneapi_environment()
 
-# Import ML dependencies if available
-if ML_AVAILABLE:
+# ML backends are imported on first use by the mode that needs them (see the _load_* helpers),
+# so keyword search and cached semantic queries never pay for scikit-learn, spaCy or PyTorch
+nlp = None
+
+# Cores the ML backends may use in this process (None: all of them). complete_analysis lowers it
+# while its stages run side by side, so that each stage's own parallelism (LDA worker processes,
+# n_jobs, spaCy processes, PyTorch threads) does not oversubscribe the same cores
+_CORE_BUDGET = None
+_TORCH_DEFAULT_THREADS = None
+
+def set_core_budget(cores):
+    """
+    Limit the cores the ML backends use in this process.
+
+    Parameters:
+    - cores: Number of cores, or None to use all of them again
+
+    Returns:
+    - previous: The previous budget, to restore it afterwards
+    """
+    global _CORE_BUDGET, _TORCH_DEFAULT_THREADS
+    previous = _CORE_BUDGET
+    _CORE_BUDGET = cores
+
+    # PyTorch's thread pool is process-wide: resize it if it is already loaded
+    torch_module = sys.modules.get("torch")
+    if torch_module is not None:
+        if cores is not None:
+            if _TORCH_DEFAULT_THREADS is None:
+                _TORCH_DEFAULT_THREADS = torch_module.get_num_threads()
+            torch_module.set_num_threads(cores)
+        elif _TORCH_DEFAULT_THREADS is not None:
+            torch_module.set_num_threads(_TORCH_DEFAULT_THREADS)
+            _TORCH_DEFAULT_THREADS = None
+    return previous
+
+def _available_cores():
+    """Return the cores the ML backends may use in this process (see set_core_budget)"""
+    return _CORE_BUDGET or os.cpu_count() or 1
+
+@lru_cache(maxsize=1)
+def _detect_intel_optimizations():
+    """
+    Detect Intel optimizations once and print their status.
+
+    Returns:
+    - dict with available optimizations
+    """
+    global INTEL_OPTIMIZATIONS
+    INTEL_OPTIMIZATIONS = check_intel_optimizations()
+
+    # Print optimization status
+    print("\nIntel Optimization Status:")
+    for opt, status in INTEL_OPTIMIZATIONS.items():
+        print(f"- {opt}: {'Enabled' if status else 'Not available'}")
+    print()
+    return INTEL_OPTIMIZATIONS
+
+@lru_cache(maxsize=1)
+def _load_ml_backends():
+    """
+    Import scikit-learn, NLTK and TextBlob (sentiment, topics and clustering).
+
+    Returns:
+    - available: True if the backends could be imported, False otherwise
+    """
+    global ML_AVAILABLE, TfidfVectorizer, CountVectorizer, TfidfTransformer, LatentDirichletAllocation
+    global KMeans, MiniBatchKMeans
+    global cosine_similarity, TextBlob, nltk, stopwords, word_tokenize
+    if not ML_AVAILABLE:
+        return False
+
+    optimizations = _detect_intel_optimizations()
     try:
         # Try to use Intel optimized scikit-learn if available
-        if INTEL_OPTIMIZATIONS['scikit-learn-intelex']:
+        if optimizations['scikit-learn-intelex']:
             try:
                 from sklearnex import patch_sklearn
                 patch_sklearn()
@@ -207,42 +338,73 @@ if ML_AVAILABLE:
             except Exception as e:
                 print(f"Warning: Could not patch scikit-learn with Intel optimizations: {str(e)}")
 
-        from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+        from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer, TfidfTransformer
         from sklearn.decomposition import LatentDirichletAllocation
-        from sklearn.cluster import KMeans
+        from sklearn.cluster import KMeans, MiniBatchKMeans
         from sklearn.metrics.pairwise import cosine_similarity
         from textblob import TextBlob
         import nltk
         from nltk.corpus import stopwords
         from nltk.tokenize import word_tokenize
-        import spacy
+    except Exception as e:
+        print(f"Warning: Error loading ML libraries: {str(e)}")
+        ML_AVAILABLE = False
+    return ML_AVAILABLE
+
+@lru_cache(maxsize=1)
+def _load_semantic_backend():
+    """
+    Import PyTorch and sentence-transformers (semantic search).
+
+    Returns:
+    - available: True if the backend could be imported, False otherwise
+    """
+    global SentenceTransformer, torch
+    if not ML_AVAILABLE:
+        return False
+
+    optimizations = _detect_intel_optimizations()
+    try:
         from sentence_transformers import SentenceTransformer
         import torch
+    except Exception as e:
+        print(f"Warning: Error loading semantic search libraries: {str(e)}")
+        return False
 
-        # Use Intel PyTorch Extension if available
-        if INTEL_OPTIMIZATIONS['ipex']:
-            try:
-                import intel_extension_for_pytorch as ipex
-                print("Using Intel Extension for PyTorch")
-            except Exception as e:
-                print(f"Warning: Could not import Intel Extension for PyTorch: {str(e)}")
-
-        # Load spaCy model for Spanish
+    # Use Intel PyTorch Extension if available
+    if optimizations['ipex']:
         try:
-            nlp = spacy.load("es_core_news_md")
-        except OSError:
-            print("Warning: spaCy Spanish model not loaded. Some ML features may not work.")
-            nlp = None
-
-        # Print optimization status
-        print("\nIntel Optimization Status:")
-        for opt, status in INTEL_OPTIMIZATIONS.items():
-            print(f"- {opt}: {'Enabled' if status else 'Not available'}")
-        print()
+            import intel_extension_for_pytorch as ipex
+            print("Using Intel Extension for PyTorch")
+        except Exception as e:
+            print(f"Warning: Could not import Intel Extension for PyTorch: {str(e)}")
+    return True
 
+@lru_cache(maxsize=1)
+def _load_spacy_model():
+    """
+    Load the Spanish spaCy model (entity extraction), without the components NER does not use.
+
+    Returns:
+    - nlp: spaCy pipeline, or None if it could not be loaded
+    """
+    global nlp
+    if not ML_AVAILABLE:
+        return None
+
+    try:
+        import spacy
     except Exception as e:
-        print(f"Warning: Error loading ML libraries: {str(e)}")
-        ML_AVAILABLE = False
+        print(f"Warning: Error loading spaCy: {str(e)}")
+        return None
+
+    # Load spaCy model for Spanish
+    try:
+        nlp = spacy.load("es_core_news_md", exclude=list(ENTITY_UNUSED_PIPES))
+    except OSError:
+        print("Warning: spaCy Spanish model not loaded. Some ML features may not work.")
+        nlp = None
+    return nlp
 
 def analyze_sentiment(tool, messages=None, filters=None):
     """
@@ -256,7 +418,7 @@ def analyze_sentiment(tool, messages=None, filters=None):
     Returns:
     - results: List of messages with sentiment analysis
     """
-    if not ML_AVAILABLE:
+    if not _load_ml_backends():
         print("ML dependencies not available. Please install them first.")
         return []
 
@@ -272,15 +434,16 @@ def analyze_sentiment(tool, messages=None, filters=None):
     results = []
 
     # Process each message
-    for msg in tqdm(messages, desc="Analyzing sentiment"):
+    for msg in tqdm(messages, desc="Analyzing sentiment",
+                    miniters=max(1, len(messages) // 200), mininterval=0.5):
         try:
             # Use TextBlob for sentiment analysis
-            analysis = TextBlob(msg['message'])
+            polarity, subjectivity = TextBlob(msg['message']).sentiment
 
             # Determine sentiment category
-            if analysis.sentiment.polarity > 0.1:
+            if polarity > 0.1:
                 sentiment = "positive"
-            elif analysis.sentiment.polarity < -0.1:
+            elif polarity < -0.1:
                 sentiment = "negative"
             else:
                 sentiment = "neutral"
@@ -288,29 +451,32 @@ def analyze_sentiment(tool, messages=None, filters=None):
             results.append({
                 **msg,
                 'sentiment': sentiment,
-                'polarity': analysis.sentiment.polarity,
-                'subjectivity': analysis.sentiment.subjectivity
+                'polarity': polarity,
+                'subjectivity': subjectivity
             })
         except Exception as e:
             # Just skip any problematic messages
             pass
 
-    # Calculate overall statistics
-    sentiments = [r['sentiment'] for r in results]
-    positive = sentiments.count('positive')
-    negative = sentiments.count('negative')
-    neutral = sentiments.count('neutral')
+    # Calculate overall statistics in a single pass over the results
+    counts = Counter(r['sentiment'] for r in results)
+    total = len(results)
+    positive = counts['positive']
+    negative = counts['negative']
+    neutral = counts['neutral']
 
     print("\nSentiment Analysis Results:")
-    print(f"Positive: {positive} ({positive/len(sentiments)*100:.1f}%)")
-    print(f"Negative: {negative} ({negative/len(sentiments)*100:.1f}%)")
-    print(f"Neutral: {neutral} ({neutral/len(sentiments)*100:.1f}%)")
+    print(f"Positive: {positive} ({positive/total*100:.1f}%)")
+    print(f"Negative: {negative} ({negative/total*100:.1f}%)")
+    print(f"Neutral: {neutral} ({neutral/total*100:.1f}%)")
 
     return results
 
-def extract_topics(tool, messages=None, num_topics=5, filters=None):
+def extract_topics(tool, messages=None, num_topics=5, filters=None, workers=None, passes=4,
+                   bow=None):
     """
     Extract main topics from messages using LDA.
+    Uses gensim's LdaMulticore when installed, otherwise scikit-learn's LDA.
     Optimized for Intel CPUs and GPUs.
 
     Parameters:
@@ -318,12 +484,15 @@ def extract_topics(tool, messages=None, num_topics=5, filters=None):
     - messages: List of messages to analyze (optional)
     - num_topics: Number of topics to extract
     - filters: Filters to apply when extracting messages (optional)
+    - workers: Worker processes for gensim's LdaMulticore (default: CPU count - 1)
+    - passes: Training passes over the corpus for gensim's LdaMulticore
+    - bow: (vectorizer, counts) from vectorize_messages(messages), to reuse (optional)
 
     Returns:
     - topics: List of topics
     - certainties: Dictionary of topic certainties
     """
-    if not ML_AVAILABLE:
+    if not _load_ml_backends():
         print("ML dependencies not available. Please install them first.")
         return [], {}
 
@@ -338,14 +507,11 @@ def extract_topics(tool, messages=None, num_topics=5, filters=None):
     print(f"Extracting {num_topics} main topics...")
 
     # Make sure we have stopwords
-    try:
-        nltk.data.find('corpora/stopwords')
-    except LookupError:
-        nltk.download('stopwords')
+    _ensure_stopwords()
 
     # Use Intel optimized scikit-learn if available
     using_intel_optimized = False
-    if INTEL_OPTIMIZATIONS['scikit-learn-intelex']:
+    if not GENSIM_AVAILABLE and INTEL_OPTIMIZATIONS['scikit-learn-intelex']:
         try:
             # This will use the patched version if sklearnex was imported successfully
             print("Using Intel optimized LDA")
@@ -353,28 +519,89 @@ def extract_topics(tool, messages=None, num_topics=5, filters=None):
         except Exception as e:
             print(f"Could not use Intel optimized LDA: {e}")
 
-    # Vectorize the messages with optimized parameters
-    print("Vectorizing messages...")
-    vectorizer = CountVectorizer(
-        max_df=0.95,          # Ignore terms that appear in more than 95% of documents
-        min_df=2,             # Ignore terms that appear in less than 2 documents
-        max_features=10000,   # Limit features for better performance
-        stop_words=stopwords.words('spanish')
+    # Vectorize the messages, unless the caller already did
+    vectorizer, counts = bow if bow is not None else vectorize_messages(messages)
+
+    if GENSIM_AVAILABLE:
+        topics = _extract_topics_gensim(vectorizer, counts, num_topics, workers, passes)
+    else:
+        topics = _extract_topics_sklearn(vectorizer, counts, num_topics)
+
+    # Calculate topic certainty with optimized processing
+    print("Calculating topic certainties...")
+    certainties = _calculate_topic_certainty(messages, topics)
+
+    # Display topics
+    print("\nMain Topics:")
+    for i, topic in enumerate(topics):
+        print(f"Topic {i+1}: {', '.join(topic)}")
+
+    # Display certainties
+    print("\nTopic Certainty:")
+    for topic, certainty in sorted(certainties.items(), key=lambda x: x[1], reverse=True):
+        print(f"{topic}: {certainty:.1f}%")
+
+    return topics, certainties
+
+def _extract_topics_gensim(vectorizer, counts, num_topics, workers=None, passes=4):
+    """
+    Fit gensim's LdaMulticore, which runs the E-step in worker processes.
+
+    Parameters:
+    - vectorizer: Fitted CountVectorizer (its vocabulary names the corpus terms)
+    - counts: Document-term count matrix from the vectorizer
+    - num_topics: Number of topics to extract
+    - workers: Number of worker processes (default: CPU count - 1)
+    - passes: Training passes over the corpus
+
+    Returns:
+    - topics: List of top-10 word lists, one per topic
+    """
+    from gensim.matutils import Sparse2Corpus
+    from gensim.models import LdaMulticore
+
+    # Stream the rows of the scikit-learn count matrix as the gensim corpus (same vocabulary)
+    corpus = Sparse2Corpus(counts, documents_columns=False)
+    id2word = dict(enumerate(vectorizer.get_feature_names_out().tolist()))
+
+    if workers is None:
+        workers = max(1, _available_cores() - 1)
+
+    print(f"Fitting LDA model with {workers} worker processes (this may take a while)...")
+    lda = LdaMulticore(
+        corpus=corpus,
+        num_topics=num_topics,
+        id2word=id2word,
+        workers=workers,
+        chunksize=2000,
+        passes=passes,
+        random_state=42
     )
 
-    # Process messages in batches for better memory usage
-    message_texts = [msg['message'] for msg in messages]
+    print("Extracting top words for each topic...")
+    return [[word for word, _ in lda.show_topic(topic_idx, topn=10)]
+            for topic_idx in range(num_topics)]
+
+def _extract_topics_sklearn(vectorizer, counts, num_topics):
+    """
+    Fit scikit-learn's LatentDirichletAllocation.
+
+    Parameters:
+    - vectorizer: Fitted CountVectorizer
+    - counts: Document-term count matrix from the vectorizer
+    - num_topics: Number of topics to extract
 
-    # Use optimized fit_transform
-    X = vectorizer.fit_transform(message_texts)
-    print(f"Vectorized {X.shape[0]} messages with {X.shape[1]} features")
+    Returns:
+    - topics: List of top-10 word lists, one per topic
+    """
+    X = counts
 
     # Apply LDA with optimized parameters for Intel hardware
     print("Applying LDA topic modeling...")
 
     # Set optimal parameters based on data size and hardware
-    n_jobs = os.cpu_count() or 2  # Use all available cores
-    batch_size = min(128, len(messages))  # Adjust batch size based on data size
+    n_jobs = _available_cores()  # Use all available cores
+    batch_size = min(128, X.shape[0])  # Adjust batch size based on data size
 
     # Create LDA model with optimized parameters
     lda = LatentDirichletAllocation(
@@ -403,21 +630,7 @@ def extract_topics(tool, messages=None, num_topics=5, filters=None):
         top_words = [feature_names[i] for i in top_words_idx]
         topics.append(top_words)
 
-    # Calculate topic certainty with optimized processing
-    print("Calculating topic certainties...")
-    certainties = _calculate_topic_certainty(messages, topics)
-
-    # Display topics
-    print("\nMain Topics:")
-    for i, topic in enumerate(topics):
-        print(f"Topic {i+1}: {', '.join(topic)}")
-
-    # Display certainties
-    print("\nTopic Certainty:")
-    for topic, certainty in sorted(certainties.items(), key=lambda x: x[1], reverse=True):
-        print(f"{topic}: {certainty:.1f}%")
-
-    return topics, certainties
+    return topics
 
 def _calculate_topic_certainty(messages, topics):
     """
@@ -451,7 +664,8 @@ def _calculate_topic_certainty(messages, topics):
 
     return certainties
 
-def semantic_search(tool, query, messages=None, num_results=10, filters=None, use_cache=True):
+def semantic_search(tool, query, messages=None, num_results=10, filters=None, use_cache=True,
+                    cache_threshold=SEMANTIC_CACHE_THRESHOLD, batch_size=None):
     """
     Perform semantic search using sentence embeddings.
     Optimized for Intel CPUs and GPUs.
@@ -463,6 +677,10 @@ def semantic_search(tool, query, messages=None, num_results=10, filters=None, us
     - num_results: Maximum number of results to return
     - filters: Filters to apply when extracting messages (optional)
     - use_cache: Whether to use cached embeddings
+    - cache_threshold: Cosine similarity above which a previous query's results are reused
+                       from the persistent query cache (None disables it)
+    - batch_size: Texts per model forward pass when embedding messages
+                  (default: EMBED_BATCH_SIZE_GPU on a GPU, EMBED_BATCH_SIZE_CPU on CPU)
 
     Returns:
     - results: List of search results
@@ -471,13 +689,20 @@ def semantic_search(tool, query, messages=None, num_results=10, filters=None, us
         print("ML dependencies not available. Please install them first.")
         return []
 
+    # Previous results can only be reused when the messages come from the tool's own data
+    cache_scope = None
+    if use_cache and cache_threshold is not None and not messages:
+        cache_scope = _semantic_cache_scope(tool, filters, num_results)
+
     # Extract messages if not provided
+    from_disk_cache = False
     if not messages:
         # Try to load messages and embeddings from cache
         if use_cache:
             cached_messages = _load_embeddings_cache(tool, filters)
             if cached_messages:
                 messages = cached_messages
+                from_disk_cache = True
             else:
                 messages = _get_filtered_messages(tool, filters)
         else:
@@ -489,9 +714,13 @@ def semantic_search(tool, query, messages=None, num_results=10, filters=None, us
 
     print(f"Performing semantic search for: '{query}'")
 
+    if not _load_semantic_backend():
+        print("ML dependencies not available. Please install them first.")
+        return []
+
     # Load pre-trained model
     try:
-        model_name = 'paraphrase-multilingual-mpnet-base-v2'
+        model_name = EMBEDDING_MODEL_NAME
         if not tool.embeddings_model:
             print(f"Loading model '{model_name}'...")
             tool.embeddings_model = SentenceTransformer(model_name)
@@ -512,6 +741,13 @@ def semantic_search(tool, query, messages=None, num_results=10, filters=None, us
             except Exception as e:
                 print(f"Could not use Intel GPU: {e}")
                 device = torch.device("cpu")
+        elif torch.cuda.is_available():
+            device = torch.device("cuda")
+            print("Using CUDA GPU for semantic search")
+            model.to(device)
+            if EMBED_HALF_PRECISION_GPU:
+                # Half the weight bandwidth and tensor-core matmuls; cosine similarities barely move
+                model.half()
         else:
             device = torch.device("cpu")
             print("Using CPU for semantic search")
@@ -519,24 +755,31 @@ def semantic_search(tool, query, messages=None, num_results=10, filters=None, us
             # If using CPU with MKL, set number of threads for better performance
             if INTEL_OPTIMIZATIONS['mkl']:
                 try:
-                    # Set optimal number of threads for Intel CPU
-                    import os
-                    num_threads = os.cpu_count()
-                    if num_threads:
-                        torch.set_num_threads(num_threads)
-                        print(f"Set PyTorch to use {num_threads} threads")
+                    # Set optimal number of threads for Intel CPU (within the core budget)
+                    num_threads = _available_cores()
+                    torch.set_num_threads(num_threads)
+                    print(f"Set PyTorch to use {num_threads} threads")
                 except Exception as e:
                     print(f"Could not optimize thread count: {e}")
+            elif _CORE_BUDGET is not None:
+                # Loaded while complete_analysis limits the cores: apply the budget now
+                set_core_budget(_CORE_BUDGET)
 
     except Exception as e:
         print(f"Error loading semantic search model: {str(e)}")
         return []
 
-    # Generate embedding for the query
-    query_embedding = model.encode(query)
+    # Generate embedding for the query (repeated queries come from the tool's query LRU)
+    query_embedding = _embed_query(tool, model, model_name, query)
 
-    # Check if we have cached embeddings for these messages
-    if use_cache and tool.embeddings_cache and len(tool.embeddings_cache) == len(messages):
+    # Reuse the results of an equivalent earlier query if there is one
+    if cache_scope:
+        cached_results = _lookup_semantic_cache(tool, cache_scope, query_embedding, cache_threshold)
+        if cached_results is not None:
+            return cached_results
+
+    # Check if we have cached embeddings for these messages (index-aligned with the disk cache)
+    if from_disk_cache and tool.embeddings_cache and len(tool.embeddings_cache) == len(messages):
         print("Usando embeddings en caché...")
         message_embeddings = np.array(list(tool.embeddings_cache.values()))
     else:
@@ -544,31 +787,16 @@ def semantic_search(tool, query, messages=None, num_results=10, filters=None, us
         print("Generando embeddings para mensajes (esto puede tomar tiempo)...")
         message_texts = [msg['message'] for msg in messages]
 
-        # Optimize batch size based on available memory
-        # Smaller batch size for GPU, larger for CPU
-        if device and device.type == "xpu":
-            batch_size = 256  # Smaller batch for GPU
-        else:
-            batch_size = 1000  # Larger batch for CPU
+        # Large forward batches keep a GPU busy; on CPU they mostly add padding
+        if batch_size is None:
+            if device and device.type in ("cuda", "xpu"):
+                batch_size = EMBED_BATCH_SIZE_GPU
+            else:
+                batch_size = EMBED_BATCH_SIZE_CPU
 
         print(f"Using batch size of {batch_size}")
-        all_embeddings = []
-
-        # Use Intel optimized processing
-        for i in tqdm(range(0, len(message_texts), batch_size), desc="Procesando lotes"):
-            batch_texts = message_texts[i:i+batch_size]
-            # Use convert_to_tensor=True for better performance with Intel hardware
-            batch_embeddings = model.encode(batch_texts, show_progress_bar=True,
-                                           convert_to_tensor=True)
-
-            # Convert tensor to numpy for consistent handling
-            if isinstance(batch_embeddings, torch.Tensor):
-                batch_embeddings = batch_embeddings.cpu().numpy()
-
-            all_embeddings.append(batch_embeddings)
-
-        # Use optimized numpy operations
-        message_embeddings = np.vstack(all_embeddings)
+        message_embeddings = _embed_texts(tool, model, message_texts, batch_size, use_lru=use_cache,
+                                          model_name=model_name)
 
         # Save embeddings to cache
         if use_cache:
@@ -600,9 +828,12 @@ def semantic_search(tool, query, messages=None, num_results=10, filters=None, us
             'context': context
         })
 
+    if cache_scope:
+        _store_semantic_cache(tool, cache_scope, query, query_embedding, results)
+
     return results
 
-def extract_entities(tool, messages=None, filters=None):
+def extract_entities(tool, messages=None, filters=None, batch_size=64):
     """
     Extract named entities from messages using spaCy.
 
@@ -610,11 +841,12 @@ def extract_entities(tool, messages=None, filters=None):
     - tool: The WhatsAppUnifiedTool instance
     - messages: List of messages to analyze (optional)
     - filters: Filters to apply when extracting messages (optional)
+    - batch_size: Number of messages spaCy processes per batch
 
     Returns:
     - results: List of messages with extracted entities
     """
-    if not ML_AVAILABLE or not nlp:
+    if not _load_spacy_model():
         print("spaCy model not available. Please install dependencies first.")
         return []
 
@@ -629,26 +861,30 @@ def extract_entities(tool, messages=None, filters=None):
     print(f"Extracting entities from {len(messages)} messages...")
     results = []
 
-    # Process each message
-    for msg in tqdm(messages, desc="Extracting entities"):
-        try:
-            # Process with spaCy
-            doc = nlp(msg['message'])
-
-            # Extract entities
-            entities = {}
-            for ent in doc.ents:
-                if ent.label_ not in entities:
-                    entities[ent.label_] = []
-                entities[ent.label_].append(ent.text)
-
+    # Process messages in batches with nlp.pipe; extra processes only pay off on large inputs
+    texts = [msg['message'] for msg in messages]
+    n_process = min(4, _available_cores()) if len(texts) > ENTITY_MULTIPROCESS_MIN else 1
+    try:
+        docs = nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+        for msg, doc in tqdm(zip(messages, docs), total=len(messages), desc="Extracting entities",
+                             miniters=max(1, len(messages) // 200), mininterval=0.5):
             results.append({
                 **msg,
-                'entities': entities
+                'entities': _doc_entities(doc)
             })
-        except Exception as e:
-            # Skip problematic messages
-            pass
+    except Exception as e:
+        # Fall back to one message at a time so a problematic message only skips itself
+        print(f"Batch entity extraction failed ({str(e)}), processing messages individually...")
+        results = []
+        for msg in messages:
+            try:
+                results.append({
+                    **msg,
+                    'entities': _doc_entities(nlp(msg['message']))
+                })
+            except Exception:
+                # Skip problematic messages
+                pass
 
     # Collect all entity types
     all_entities = {}
@@ -668,7 +904,24 @@ def extract_entities(tool, messages=None, filters=None):
 
     return results
 
-def cluster_messages(tool, messages=None, num_clusters=5, filters=None):
+def _doc_entities(doc):
+    """
+    Group the named entities of a spaCy document by label.
+
+    Parameters:
+    - doc: Processed spaCy document
+
+    Returns:
+    - entities: Dictionary of label -> list of entity texts
+    """
+    entities = {}
+    for ent in doc.ents:
+        if ent.label_ not in entities:
+            entities[ent.label_] = []
+        entities[ent.label_].append(ent.text)
+    return entities
+
+def cluster_messages(tool, messages=None, num_clusters=5, filters=None, bow=None):
     """
     Group similar messages using K-means clustering.
     Optimized for Intel CPUs and GPUs.
@@ -678,11 +931,12 @@ def cluster_messages(tool, messages=None, num_clusters=5, filters=None):
     - messages: List of messages to cluster (optional)
     - num_clusters: Number of clusters to create
     - filters: Filters to apply when extracting messages (optional)
+    - bow: (vectorizer, counts) from vectorize_messages(messages), to reuse (optional)
 
     Returns:
     - messages: List of messages with cluster assignments
     """
-    if not ML_AVAILABLE:
+    if not _load_ml_backends():
         print("ML dependencies not available. Please install them first.")
         return []
 
@@ -696,12 +950,6 @@ def cluster_messages(tool, messages=None, num_clusters=5, filters=None):
 
     print(f"Clustering {len(messages)} messages into {num_clusters} groups...")
 
-    # Make sure we have stopwords
-    try:
-        nltk.data.find('corpora/stopwords')
-    except LookupError:
-        nltk.download('stopwords')
-
     # Use Intel optimized scikit-learn if available
     using_intel_optimized = False
     if INTEL_OPTIMIZATIONS['scikit-learn-intelex']:
@@ -712,19 +960,24 @@ def cluster_messages(tool, messages=None, num_clusters=5, filters=None):
         except Exception as e:
             print(f"Could not use Intel optimized clustering: {e}")
 
-    # Vectorize the messages with optimized parameters
-    print("Vectorizing messages...")
-    vectorizer = TfidfVectorizer(
-        stop_words=stopwords.words('spanish'),
-        max_features=10000,  # Limit features for better performance
-        min_df=2,            # Ignore terms that appear in less than 2 documents
-        max_df=0.95          # Ignore terms that appear in more than 95% of documents
-    )
-    X = vectorizer.fit_transform([msg['message'] for msg in messages])
+    # TF-IDF weights over the shared bag of words (the same matrix a TfidfVectorizer with
+    # these vocabulary limits would produce)
+    vectorizer, counts = bow if bow is not None else vectorize_messages(messages)
+    X = TfidfTransformer().fit_transform(counts)
 
     # Apply K-means with optimized parameters for Intel hardware
     print("Applying K-means clustering...")
-    if using_intel_optimized:
+    if X.shape[0] >= CLUSTER_MINIBATCH_MIN:
+        # Large corpora: each iteration assigns one mini-batch instead of every message
+        print(f"Using MiniBatchKMeans (batch size {CLUSTER_MINIBATCH_SIZE})")
+        kmeans = MiniBatchKMeans(
+            n_clusters=num_clusters,
+            random_state=42,
+            n_init=3,
+            max_iter=100,
+            batch_size=CLUSTER_MINIBATCH_SIZE
+        )
+    elif using_intel_optimized:
         # Intel optimized K-means with parameters tuned for performance
         kmeans = KMeans(
             n_clusters=num_clusters,
@@ -753,39 +1006,72 @@ def cluster_messages(tool, messages=None, num_clusters=5, filters=None):
 
     # Assign clusters to messages
     print("Assigning clusters to messages...")
-    for i, msg in enumerate(messages):
-        msg['cluster'] = int(kmeans.labels_[i])
+    labels = kmeans.labels_
+    for msg, cluster in zip(messages, labels.tolist()):
+        msg['cluster'] = cluster
+
+    # Get cluster stats: message indices grouped by cluster (stable sort keeps message order)
+    counts = np.bincount(labels, minlength=num_clusters)
+    starts = np.cumsum(counts) - counts
+    members = np.argsort(labels, kind='stable')
 
-    # Get cluster stats
-    clusters = {}
-    for msg in messages:
-        cluster = msg['cluster']
-        if cluster not in clusters:
-            clusters[cluster] = []
-        clusters[cluster].append(msg)
+    # Representative words, computed once for every centroid
+    order_centroids = np.argsort(kmeans.cluster_centers_, axis=1)[:, ::-1][:, :10]
+    terms = vectorizer.get_feature_names_out()
 
     # Display cluster statistics
     print("\nCluster Statistics:")
-    for cluster, cluster_messages in sorted(clusters.items()):
-        print(f"Cluster {cluster}: {len(cluster_messages)} messages")
+    for cluster in np.flatnonzero(counts).tolist():
+        print(f"Cluster {cluster}: {counts[cluster]} messages")
 
         # Show representative words
-        order_centroids = kmeans.cluster_centers_.argsort()[:, ::-1]
-        terms = vectorizer.get_feature_names_out()
-
         print("Keywords:", end=" ")
-        for ind in order_centroids[cluster, :10]:
+        for ind in order_centroids[cluster]:
             print(f"{terms[ind]}", end=" ")
         print()
 
         # Show sample messages
         print("Examples:")
-        for msg in cluster_messages[:3]:
-            print(f"  - {msg['message'][:100]}...")
+        for i in members[starts[cluster]:starts[cluster] + min(3, counts[cluster])]:
+            print(f"  - {messages[i]['message'][:100]}...")
         print()
 
     return messages
 
+def vectorize_messages(messages):
+    """
+    Build the bag of words shared by topic extraction and clustering.
+    complete_analysis computes it once and passes it to both stages.
+
+    Parameters:
+    - messages: List of messages
+
+    Returns:
+    - vectorizer: Fitted CountVectorizer
+    - counts: Sparse document-term count matrix, one row per message
+    """
+    if not _load_ml_backends():
+        raise RuntimeError("ML dependencies not available")
+    _ensure_stopwords()
+
+    print("Vectorizing messages...")
+    vectorizer = CountVectorizer(
+        max_df=0.95,          # Ignore terms that appear in more than 95% of documents
+        min_df=2,             # Ignore terms that appear in less than 2 documents
+        max_features=10000,   # Limit features for better performance
+        stop_words=stopwords.words('spanish')
+    )
+    counts = vectorizer.fit_transform([msg['message'] for msg in messages])
+    print(f"Vectorized {counts.shape[0]} messages with {counts.shape[1]} features")
+    return vectorizer, counts
+
+def _ensure_stopwords():
+    """Download NLTK's stopword lists if they are not installed yet."""
+    try:
+        nltk.data.find('corpora/stopwords')
+    except LookupError:
+        nltk.download('stopwords')
+
 def _get_filtered_messages(tool, filters=None):
     """
     Extract messages using the specified filters.
@@ -797,19 +1083,472 @@ def _get_filtered_messages(tool, filters=None):
     Returns:
     - messages: List of filtered messages
     """
-    if not filters:
-        filters = {}
+    filters = Filters.coerce(filters)
 
     return extract_messages(
         tool.data,
         contacts=tool.contacts,
-        chat_filter=filters.get('chat'),
-        start_date=filters.get('start_date'),
-        end_date=filters.get('end_date'),
-        sender_filter=filters.get('sender'),
-        phone_filter=filters.get('phone')
+        chat_filter=filters.chat,
+        start_date=filters.start_date,
+        end_date=filters.end_date,
+        sender_filter=filters.sender,
+        phone_filter=filters.phone
+    )
+
+def _encode_batches(model, texts, batch_size):
+    """
+    Encode texts with the sentence model in batches.
+    Texts are handed to encode() a chunk at a time (for progress reporting), and the
+    model runs forward passes of batch_size texts within each chunk.
+
+    Parameters:
+    - model: SentenceTransformer model
+    - texts: List of texts to encode
+    - batch_size: Number of texts per model forward pass
+
+    Returns:
+    - embeddings: float32 array with one row per text
+    """
+    chunk_size = max(EMBED_CHUNK_SIZE, batch_size)
+    all_embeddings = []
+
+    for i in tqdm(range(0, len(texts), chunk_size), desc="Procesando lotes"):
+        all_embeddings.append(model.encode(
+            texts[i:i + chunk_size],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ))
+
+    return np.vstack(all_embeddings).astype(np.float32, copy=False)
+
+def _embed_texts(tool, model, texts, batch_size, use_lru=True, model_name=EMBEDDING_MODEL_NAME):
+    """
+    Embed message texts, reusing vectors from the tool's content-keyed LRU and, for texts
+    not in it, from the persistent embedding store of earlier sessions.
+    Repeated texts are encoded once, and only texts not seen before are sent to the model.
+
+    Parameters:
+    - tool: The WhatsAppUnifiedTool instance
+    - model: SentenceTransformer model
+    - texts: List of message texts
+    - batch_size: Number of texts per encode call
+    - use_lru: Whether to read from and update the LRU and the persistent store
+    - model_name: Name of the model, part of the persistent store key
+
+    Returns:
+    - embeddings: float32 array with one row per text
+    """
+    unique_texts = dict.fromkeys(texts)
+
+    if not use_lru:
+        if len(unique_texts) == len(texts):
+            return _encode_batches(model, texts, batch_size)
+
+        # Encode each distinct text once and scatter the vectors back to message order
+        print(f"Mensajes únicos a codificar: {len(unique_texts)} de {len(texts)}")
+        positions = {text: i for i, text in enumerate(unique_texts)}
+        unique_embeddings = _encode_batches(model, list(unique_texts), batch_size)
+        return unique_embeddings[[positions[text] for text in texts]]
+
+    lru = tool.embeddings_lru
+    missing = [text for text in unique_texts if text not in lru]
+    if missing:
+        stored = _load_stored_embeddings(tool, model_name, missing)
+        lru.update(stored)
+        new_texts = [text for text in missing if text not in stored]
+        print(f"Embeddings en caché: {len(unique_texts) - len(missing)}, en disco: {len(stored)}, "
+              f"nuevos: {len(new_texts)}")
+        if new_texts:
+            new_embeddings = _encode_batches(model, new_texts, batch_size)
+            for text, vector in zip(new_texts, new_embeddings):
+                lru[text] = vector
+            _store_embeddings(tool, model_name, new_texts, new_embeddings)
+    else:
+        print("Usando embeddings en caché...")
+
+    vectors = []
+    for text in texts:
+        lru.move_to_end(text)
+        vectors.append(lru[text])
+
+    # Evict least recently used entries only after the current texts have been read
+    while len(lru) > tool.embeddings_lru_max:
+        lru.popitem(last=False)
+
+    return np.vstack(vectors)
+
+def _embed_query(tool, model, model_name, query):
+    """
+    Embed a search query, reusing the vector of an identical earlier query.
+
+    Parameters:
+    - tool: The WhatsAppUnifiedTool instance
+    - model: SentenceTransformer model
+    - model_name: Name of the model, part of the LRU key
+    - query: Query text
+
+    Returns:
+    - embedding: float32 query embedding
+    """
+    lru = getattr(tool, 'query_embeddings_lru', None)
+    if lru is None:
+        return model.encode(query)
+
+    key = (model_name, query)
+    embedding = lru.get(key)
+    if embedding is None:
+        embedding = lru[key] = np.asarray(model.encode(query), dtype=np.float32)
+        while len(lru) > tool.query_embeddings_lru_max:
+            lru.popitem(last=False)
+    else:
+        lru.move_to_end(key)
+    return embedding
+
+def _semantic_cache_scope(tool, filters, num_results):
+    """
+    Build the key that scopes cached query results to one dataset, contact set, filter set
+    and result size.
+
+    Parameters:
+    - tool: The WhatsAppUnifiedTool instance
+    - filters: Filters applied to the data
+    - num_results: Maximum number of results requested
+
+    Returns:
+    - scope: Hex digest identifying the search scope, or None when the data or contacts were
+             modified in memory (e.g. corrections applied), which the files cannot identify
+    """
+    import json
+    # Same rule as the keyword search cache: only data and contacts as loaded from their files
+    if tool._data_fingerprint is None or id(tool.contacts) != tool._contacts_fingerprint_of:
+        return None
+    scope_input = json.dumps(
+        [os.path.abspath(tool.data_file) if tool.data_file else None, tool._data_fingerprint,
+         tool._contacts_fingerprint, Filters.coerce(filters).active(), num_results],
+        sort_keys=True, default=str
+    )
+    return hashlib.md5(scope_input.encode()).hexdigest()
+
+@lru_cache(maxsize=4)
+def _lsh_hyperplanes(dimension):
+    """
+    Return the fixed random hyperplanes used to hash embeddings of a given size.
+    They are derived from a constant seed, so signatures stay stable across runs.
+    """
+    return np.random.default_rng(LSH_SEED).standard_normal((LSH_BITS, dimension)).astype(np.float32)
+
+def _lsh_signature(embedding):
+    """
+    Hash an embedding to an integer bucket: one bit per hyperplane, set on its positive side.
+
+    Parameters:
+    - embedding: 1-D embedding vector
+
+    Returns:
+    - signature: Integer in [0, 2**LSH_BITS)
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    bits = (_lsh_hyperplanes(vector.shape[0]) @ vector) > 0
+    return int(bits @ (1 << np.arange(LSH_BITS)))
+
+@lru_cache(maxsize=LSH_BITS + 1)
+def _lsh_neighbor_masks():
+    """Return the XOR masks of every bit pattern with at most LSH_RADIUS bits set"""
+    from itertools import combinations
+    return tuple(
+        sum(1 << bit for bit in bits)
+        for radius in range(LSH_RADIUS + 1)
+        for bits in combinations(range(LSH_BITS), radius)
     )
 
+def _quantize_embedding(embedding):
+    """
+    Quantize an embedding to int8 with a per-vector scale (largest component maps to 127).
+    Cosine similarity does not depend on the scale, so it is not stored.
+
+    Parameters:
+    - embedding: 1-D float embedding vector
+
+    Returns:
+    - codes: int8 array of the same length
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    peak = float(np.abs(vector).max()) if vector.size else 0.0
+    if peak == 0.0:
+        return np.zeros(vector.shape, dtype=np.int8)
+    return np.round(vector * (127.0 / peak)).astype(np.int8)
+
+def _int8_cosine(codes, query_codes):
+    """
+    Approximate cosine similarity between int8 codes and a query's int8 codes.
+    Rows are widened to float32 a block at a time, so the scan reads the compact codes
+    and only a small buffer of floats stays hot in cache.
+
+    Parameters:
+    - codes: 2-D int8 array, one row per cached embedding
+    - query_codes: 1-D int8 array
+
+    Returns:
+    - similarities: float32 array, one value per row
+    """
+    query = query_codes.astype(np.float32)
+    dots = np.empty(codes.shape[0], dtype=np.float32)
+    norms = np.empty(codes.shape[0], dtype=np.float32)
+    block = np.empty((min(SQ8_BLOCK_ROWS, codes.shape[0]), codes.shape[1]), dtype=np.float32)
+    for start in range(0, codes.shape[0], SQ8_BLOCK_ROWS):
+        rows = codes[start:start + SQ8_BLOCK_ROWS]
+        widened = block[:rows.shape[0]]
+        np.copyto(widened, rows, casting='unsafe')
+        np.dot(widened, query, out=dots[start:start + rows.shape[0]])
+        np.einsum('ij,ij->i', widened, widened, out=norms[start:start + rows.shape[0]])
+    denominator = np.sqrt(norms) * np.linalg.norm(query)
+    return np.divide(dots, denominator, out=np.zeros_like(dots), where=denominator > 0)
+
+def _semantic_cache_connection(tool):
+    """
+    Open the persistent query cache, creating its table on first use.
+
+    Parameters:
+    - tool: The WhatsAppUnifiedTool instance
+
+    Returns:
+    - connection: sqlite3 connection to the cache database
+    """
+    connection = sqlite3.connect(os.path.join(tool.cache_dir, SEMANTIC_CACHE_FILE))
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS semantic_queries ("
+        "scope TEXT, query TEXT, embedding BLOB, results BLOB, ts REAL, signature INTEGER, "
+        "embedding_q8 BLOB)"
+    )
+    # Caches created before LSH signatures / int8 codes existed lack the columns; their rows keep NULLs
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(semantic_queries)")}
+    if 'signature' not in columns:
+        connection.execute("ALTER TABLE semantic_queries ADD COLUMN signature INTEGER")
+    if 'embedding_q8' not in columns:
+        connection.execute("ALTER TABLE semantic_queries ADD COLUMN embedding_q8 BLOB")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_semantic_scope ON semantic_queries(scope)")
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS idx_semantic_bucket ON semantic_queries(scope, signature)"
+    )
+    return connection
+
+def _lookup_semantic_cache(tool, scope, query_embedding, threshold):
+    """
+    Find cached results for a query whose embedding is close enough to this one.
+    Only queries in nearby LSH buckets are compared, so the probe does not grow with the
+    total size of the cache. They are scanned through their int8 codes, and the few
+    candidates near the threshold are confirmed with their float32 embeddings.
+
+    Parameters:
+    - tool: The WhatsAppUnifiedTool instance
+    - scope: Key from _semantic_cache_scope
+    - query_embedding: Embedding of the current query
+    - threshold: Minimum cosine similarity for a cache hit
+
+    Returns:
+    - results: Cached results, or None on a miss
+    """
+    try:
+        with closing(_semantic_cache_connection(tool)) as connection:
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            signature = _lsh_signature(query_vector)
+            buckets = [signature ^ mask for mask in _lsh_neighbor_masks()]
+
+            rows = connection.execute(
+                "SELECT rowid, query, COALESCE(embedding_q8, embedding) FROM semantic_queries "
+                f"WHERE scope = ? AND ts >= ? AND (signature IN ({','.join('?' * len(buckets))}) "
+                "OR signature IS NULL)",
+                (scope, datetime.now().timestamp() - SEMANTIC_CACHE_TTL, *buckets)
+            ).fetchall()
+
+            dimension = query_vector.shape[0]
+            candidates = []
+            codes = []
+            for row in rows:
+                if len(row[2]) == dimension:
+                    codes.append(np.frombuffer(row[2], dtype=np.int8))
+                elif len(row[2]) == query_vector.nbytes:
+                    # Rows saved before int8 codes existed only have the float32 embedding
+                    codes.append(_quantize_embedding(np.frombuffer(row[2], dtype=np.float32)))
+                else:
+                    continue
+                candidates.append(row)
+            if not candidates:
+                return None
+
+            approximate = _int8_cosine(np.vstack(codes), _quantize_embedding(query_vector))
+            order = np.argsort(-approximate)[:SQ8_MAX_REFINE]
+            order = [int(i) for i in order if approximate[i] >= threshold - SQ8_MARGIN]
+            if not order:
+                return None
+
+            # Exact cosine on the float32 embeddings of the few remaining candidates
+            rowids = [candidates[i][0] for i in order]
+            gold = dict(connection.execute(
+                "SELECT rowid, embedding FROM semantic_queries "
+                f"WHERE rowid IN ({','.join('?' * len(rowids))})",
+                rowids
+            ).fetchall())
+            query_norm = np.linalg.norm(query_vector)
+            best_row, best_similarity = None, -1.0
+            for i in order:
+                blob = gold.get(candidates[i][0])
+                if blob is None or len(blob) != query_vector.nbytes:
+                    continue
+                vector = np.frombuffer(blob, dtype=np.float32)
+                similarity = float(vector @ query_vector / (np.linalg.norm(vector) * query_norm))
+                if similarity > best_similarity:
+                    best_row, best_similarity = candidates[i], similarity
+            if best_row is None or best_similarity < threshold:
+                return None
+
+            print(f"Reusing cached results for similar query '{best_row[1]}' "
+                  f"(similarity {best_similarity:.3f})")
+            blob = connection.execute(
+                "SELECT results FROM semantic_queries WHERE rowid = ?", (best_row[0],)
+            ).fetchone()[0]
+            # A hit renews the entry's TTL and LRU position
+            with connection:
+                connection.execute("UPDATE semantic_queries SET ts = ? WHERE rowid = ?",
+                                   (datetime.now().timestamp(), best_row[0]))
+            return pickle.loads(blob)
+    except Exception as e:
+        print(f"Error reading semantic query cache: {str(e)}")
+        return None
+
+def _store_semantic_cache(tool, scope, query, query_embedding, results):
+    """
+    Save the results of a query to the persistent query cache.
+
+    Parameters:
+    - tool: The WhatsAppUnifiedTool instance
+    - scope: Key from _semantic_cache_scope
+    - query: Query text
+    - query_embedding: Embedding of the query
+    - results: Search results to cache
+
+    Returns:
+    - success: True if saved successfully, False otherwise
+    """
+    try:
+        with closing(_semantic_cache_connection(tool)) as connection, connection:
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            connection.execute(
+                "INSERT INTO semantic_queries "
+                "(scope, query, embedding, results, ts, signature, embedding_q8) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scope, query, query_vector.tobytes(),
+                 pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL), datetime.now().timestamp(),
+                 _lsh_signature(query_vector), _quantize_embedding(query_vector).tobytes())
+            )
+            # Evict expired entries, then the least recently used beyond the size cap
+            connection.execute("DELETE FROM semantic_queries WHERE ts < ?",
+                               (datetime.now().timestamp() - SEMANTIC_CACHE_TTL,))
+            connection.execute(
+                "DELETE FROM semantic_queries WHERE rowid NOT IN "
+                "(SELECT rowid FROM semantic_queries ORDER BY ts DESC LIMIT ?)",
+                (SEMANTIC_CACHE_MAX_ENTRIES,)
+            )
+        return True
+    except Exception as e:
+        print(f"Error saving semantic query cache: {str(e)}")
+        return False
+
+def _embedding_key(model_name, text):
+    """Key of a text's embedding in the persistent store: SHA-256 of model name and text"""
+    return hashlib.sha256(f"{model_name}\0{text}".encode()).digest()
+
+def _embedding_store_connection(tool):
+    """
+    Open the persistent embedding store, creating its table on first use.
+
+    Parameters:
+    - tool: The WhatsAppUnifiedTool instance
+
+    Returns:
+    - connection: sqlite3 connection to the store
+    """
+    connection = sqlite3.connect(os.path.join(tool.cache_dir, EMBEDDING_STORE_FILE))
+    # Stores created before the ts column held float16 vectors; drop them rather than mix precisions
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(embeddings)")}
+    if columns and 'ts' not in columns:
+        connection.execute("DROP TABLE embeddings")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB, ts REAL) WITHOUT ROWID"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_ts ON embeddings(ts)")
+    return connection
+
+def _load_stored_embeddings(tool, model_name, texts):
+    """
+    Look up the embeddings of texts in the persistent store, refreshing the
+    last-used time of the ones found.
+
+    Parameters:
+    - tool: The WhatsAppUnifiedTool instance
+    - model_name: Name of the model that produced the embeddings
+    - texts: Distinct texts to look up
+
+    Returns:
+    - embeddings: Dictionary of text -> float32 embedding for the texts found
+    """
+    found = {}
+    now = datetime.now().timestamp()
+    try:
+        with closing(_embedding_store_connection(tool)) as connection, connection:
+            for start in range(0, len(texts), EMBEDDING_STORE_BATCH):
+                keys = {_embedding_key(model_name, text): text
+                        for text in texts[start:start + EMBEDDING_STORE_BATCH]}
+                placeholders = ",".join("?" * len(keys))
+                rows = connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN (%s)" % placeholders, list(keys)
+                ).fetchall()
+                for key, vector in rows:
+                    found[keys[key]] = np.frombuffer(vector, dtype=np.float32).copy()
+                if rows:
+                    connection.execute(
+                        "UPDATE embeddings SET ts = ? WHERE key IN (%s)" % ",".join("?" * len(rows)),
+                        [now] + [key for key, _ in rows]
+                    )
+    except Exception as e:
+        print(f"Error reading embedding store: {str(e)}")
+    return found
+
+def _store_embeddings(tool, model_name, texts, embeddings):
+    """
+    Save newly computed embeddings to the persistent store, then evict expired entries
+    and the least recently used beyond EMBEDDING_STORE_MAX_ENTRIES.
+
+    Parameters:
+    - tool: The WhatsAppUnifiedTool instance
+    - model_name: Name of the model that produced the embeddings
+    - texts: List of texts
+    - embeddings: Array with one embedding row per text
+
+    Returns:
+    - success: True if saved successfully, False otherwise
+    """
+    try:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        now = datetime.now().timestamp()
+        with closing(_embedding_store_connection(tool)) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, ts) VALUES (?, ?, ?)",
+                ((_embedding_key(model_name, text), vector.tobytes(), now)
+                 for text, vector in zip(texts, vectors))
+            )
+            connection.execute("DELETE FROM embeddings WHERE ts < ?", (now - EMBEDDING_STORE_TTL,))
+            connection.execute(
+                "DELETE FROM embeddings WHERE key NOT IN "
+                "(SELECT key FROM embeddings ORDER BY ts DESC LIMIT ?)",
+                (EMBEDDING_STORE_MAX_ENTRIES,)
+            )
+        return True
+    except Exception as e:
+        print(f"Error saving embedding store: {str(e)}")
+        return False
+
 def _get_cache_filename(tool, filters=None):
     """
     Generate a unique filename for the embeddings cache based on filters.
@@ -823,7 +1562,7 @@ def _get_cache_filename(tool, filters=None):
     """
     import json
     # Create a hash based on the filters and data file
-    hash_input = f"{tool.data_file}_{json.dumps(filters or {}, sort_keys=True)}"
+    hash_input = f"{tool.data_file}_{json.dumps(Filters.coerce(filters).active(), sort_keys=True)}"
     hash_value = hashlib.md5(hash_input.encode()).hexdigest()
     return os.path.join(tool.cache_dir, f"embeddings_{hash_value}.pkl")
 
@@ -845,7 +1584,12 @@ def _load_embeddings_cache(tool, filters=None):
         try:
             print(f"Cargando embeddings desde caché: {cache_file}")
             with open(cache_file, 'rb') as f:
-                cache_data = pickle.load(f)
+                if f.read(4) == ZSTD_MAGIC:
+                    f.seek(0)
+                    cache_data = pickle.load(zstandard.ZstdDecompressor().stream_reader(f))
+                else:
+                    f.seek(0)
+                    cache_data = pickle.load(f)
                 tool.embeddings_cache = cache_data.get('embeddings', {})
                 cached_messages = cache_data.get('messages', [])
                 print(f"Embeddings cargados para {len(cached_messages)} mensajes")
@@ -879,7 +1623,13 @@ def _save_embeddings_cache(tool, messages, embeddings):
                 'messages': messages,
                 'timestamp': datetime.now().timestamp()
             }
-            pickle.dump(cache_data, f)
+            if ZSTD_AVAILABLE:
+                # Streamed through a multi-threaded zstd compressor instead of written raw
+                compressor = zstandard.ZstdCompressor(level=3, threads=-1)
+                with compressor.stream_writer(f, closefd=False) as writer:
+                    pickle.dump(cache_data, writer, protocol=pickle.HIGHEST_PROTOCOL)
+            else:
+                pickle.dump(cache_data, f)
         print(f"Embeddings guardados para {len(messages)} mensajes")
         return True
     except Exception as e:
@@ -5,10 +5,73 @@ WhatsApp Chat Search Utilities Module
 This module contains utility functions for displaying and saving search results.
 """
 
+import atexit
+import gzip
+import io
 import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
-def print_results(results, show_context=True, contacts=None):
+# orjson es opcional: si está instalado se usa para codificar JSON más rápido
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# zstandard y msgpack son opcionales: permiten guardar resultados comprimidos (.json.zst, .msgpack.zst)
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Extensiones de archivo reconocidas por save_results_to_file
+RESULT_FILE_EXTENSIONS = ('.md', '.json', '.json.gz', '.json.zst', '.msgpack.zst')
+
+# Codificador JSON reutilizado por save_results_to_file (los resultados son árboles, sin referencias circulares)
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, indent=2, default=str, check_circular=False)
+
+# Variante compacta para los archivos comprimidos (la indentación solo añade bytes que comprimir)
+_JSON_ENCODER_COMPACT = json.JSONEncoder(ensure_ascii=False, default=str, check_circular=False)
+
+# Líneas separadoras de print_results, construidas una sola vez
+_SEPARATOR = "=" * 80
+_SEPARATOR_LINE = _SEPARATOR + "\n"
+_NAV_SEPARATOR = "\n" + "-" * 80 + "\n"
+
+# Plantilla precompilada para las líneas de contexto de _format_result
+_CTX_FMT = "  {}[{}] {}: {}\n".format
+
+# Prefijo de cada línea de contexto según su tipo
+_CTX_PREFIX = {'previous': "↑ ", 'next': "↓ "}
+
+# Resultados que print_results acumula antes de cada escritura en la salida estándar
+_PRINT_PAGE_SIZE = 64
+
+# Hilo escritor para guardar resultados en segundo plano (se crea al primer uso)
+_WRITER = None
+
+def _get_writer():
+    """
+    Retorna el ejecutor de un solo hilo usado para las escrituras en segundo plano.
+    Las escrituras se serializan en orden y se esperan al salir del intérprete.
+    """
+    global _WRITER
+    if _WRITER is None:
+        _WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wae-writer")
+        atexit.register(_WRITER.shutdown)
+    return _WRITER
+
+def print_results(results, show_context=True, contacts=None, interactive=None):
     """
     Imprime resultados de búsqueda en un formato legible.
 
@@ -16,6 +79,8 @@ def print_results(results, show_context=True, contacts=None):
     - results: Lista de resultados de búsqueda o diccionario con resultados y relevancia de contactos
     - show_context: Si se deben mostrar mensajes de contexto
     - contacts: Diccionario de contactos (opcional)
+    - interactive: Si se navega resultado a resultado; si es False se escriben todos de una vez.
+      Por defecto solo se navega cuando la entrada estándar es una terminal
     """
     # Extraer componentes si results es un diccionario
     contact_relevance = None
@@ -40,7 +105,7 @@ def print_results(results, show_context=True, contacts=None):
     # Mostrar el contacto más relevante si está disponible
     if most_relevant_contact:
         contact_id, contact_data = most_relevant_contact
-        print("\n" + "=" * 80)
+        print("\n" + _SEPARATOR)
         print(f"CONTACTO MÁS RELEVANTE: {contact_data['display_name']} ({contact_data['phone']})")
         print(f"Puntuación total: {contact_data.get('final_score', contact_data['score']):.1f}")
         print(f"Mensajes coincidentes: {contact_data['message_count']}")
@@ -60,7 +125,7 @@ def print_results(results, show_context=True, contacts=None):
             print("Palabras clave más frecuentes:")
             for keyword, count in sorted_keywords[:5]:  # Mostrar las 5 más frecuentes
                 print(f"  - {keyword}: {count} veces")
-        print("=" * 80 + "\n")
+        print(_SEPARATOR_LINE)
 
     # Mostrar información sobre criterios de ordenación si están disponibles
     if isinstance(results, dict) and 'sort_criteria' in results:
@@ -71,105 +136,34 @@ def print_results(results, show_context=True, contacts=None):
 
     print(f"\nSe encontraron {len(message_results)} mensajes coincidentes.")
 
+    if interactive is None:
+        interactive = sys.stdin is not None and sys.stdin.isatty()
+
+    if not interactive:
+        # Sin terminal (salida redirigida o en scripts): listar todos los resultados, acumulándolos
+        # y escribiéndolos por páginas de _PRINT_PAGE_SIZE para no retener el listado completo
+        total = len(message_results)
+        parts = []
+        for position, result in enumerate(message_results, 1):
+            parts.extend(_format_result(result, position, total, show_context))
+            if position % _PRINT_PAGE_SIZE == 0:
+                sys.stdout.write("".join(parts))
+                parts.clear()
+        sys.stdout.write("".join(parts))
+        print("\nBúsqueda finalizada.")
+        return
+
     # Iniciar navegación interactiva
     current_index = 0
     page_size = 1  # Mostrar un resultado a la vez para mejor navegación
 
     while True:
-        # Limpiar pantalla para mejor visualización
-        print("\n" + "=" * 80)
-        print(f"Resultado {current_index + 1} de {len(message_results)}")
-        print("=" * 80)
-
-        # Obtener el resultado actual
-        result = message_results[current_index]
-
-        # Mostrar información del chat
-        chat_name = result.get('chat_name', "")
-        chat_id = result.get('chat_id', "")
-
-        # Asegurarse de que chat_name no sea None para evitar errores
-        if chat_name is None:
-            chat_name = ""
-
-        # Si el chat_name es diferente del ID (número), mostrar ambos
-        if chat_name and chat_id and chat_name != chat_id and not chat_id.startswith(chat_name):
-            print(f"Chat: {chat_name} ({chat_id})")
-        else:
-            print(f"Chat: {chat_id}")
-
-        # Mostrar información del remitente
-        if result.get('from_me'):
-            print(f"Remitente: Yo")
-        else:
-            sender_info = result.get('sender', 'Desconocido')
-            phone_info = result.get('phone', 'Desconocido')
-            sender_id = result.get('sender_id', '')
-
-            # Asegurarse de que sender_info y phone_info no sean None
-            if sender_info is None:
-                sender_info = "Desconocido"
-            if phone_info is None:
-                phone_info = "Desconocido"
-
-            # Si hay un nombre de contacto y es diferente del número, mostrar ambos
-            if sender_info != phone_info and sender_info != "Desconocido" and sender_info != sender_id:
-                print(f"Remitente: {sender_info} ({phone_info})")
-            else:
-                print(f"Remitente: {phone_info}")
-
-        print(f"Fecha: {result['date']}")
-        print(f"Puntuación: {result.get('score', 0):.1f}")
-
-        if 'matched_keywords' in result:
-            print(f"Palabras clave coincidentes: {', '.join(result['matched_keywords'])}")
-
-        # Mostrar estadísticas de palabras si están disponibles
-        if 'word_stats' in result:
-            stats = result['word_stats']
-            print(f"Densidad de palabras clave: {stats['keyword_density']:.2%} ({stats['total_keywords']} de {stats['total_words']} palabras)")
-
-            # Mostrar factores adicionales si están disponibles
-            additional_factors = []
-
-            if 'proximity_factor' in stats:
-                additional_factors.append(f"Proximidad: {stats['proximity_factor']:.2f}")
-
-            if 'position_factor' in stats:
-                additional_factors.append(f"Posición: {stats['position_factor']:.2f}")
-
-            if 'partial_matches' in stats and stats['partial_matches'] > 0:
-                additional_factors.append(f"Coincidencias parciales: {stats['partial_matches']}")
-
-            if additional_factors:
-                print(f"Factores adicionales: {' | '.join(additional_factors)}")
-
-        print(f"\nMensaje: {result['message']}")
-
-        if show_context and 'context' in result and result['context']:
-            print("\nContexto:")
-            for ctx in result['context']:
-                prefix = "↑ " if ctx['type'] == 'previous' else "↓ "
-
-                # Formatear remitente para mensajes de contexto
-                if ctx.get('from_me'):
-                    ctx_sender = "Yo"
-                else:
-                    ctx_sender = ctx.get('sender', 'Desconocido')
-                    if ctx_sender is None:
-                        ctx_sender = "Desconocido"
-                    ctx_phone = ctx.get('phone', 'Desconocido')
-                    if ctx_phone is None:
-                        ctx_phone = "Desconocido"
-                    # Si el nombre es diferente del teléfono, mostrar ambos
-                    if ctx_sender != ctx_phone and ctx_sender != "Desconocido":
-                        ctx_sender = f"{ctx_sender} ({ctx_phone})"
-
-                print(f"  {prefix}[{ctx['date']}] {ctx_sender}: {ctx['message']}")
-
-        # Mostrar opciones de navegación
-        print("\n" + "-" * 80)
-        print("Navegación: [p]revio | [s]iguiente | [c]ontactos | [r]esumen | [q]salir")
+        # Escribir la página completa de una sola vez
+        parts = _format_result(message_results[current_index], current_index + 1,
+                               len(message_results), show_context)
+        parts.append(_NAV_SEPARATOR)
+        parts.append("Navegación: [p]revio | [s]iguiente | [c]ontactos | [r]esumen | [q]salir\n")
+        sys.stdout.write("".join(parts))
 
         choice = input("Opción: ").lower()
 
@@ -181,9 +175,9 @@ def print_results(results, show_context=True, contacts=None):
             current_index = min(len(message_results) - 1, current_index + 1)
         elif choice == 'c' and contact_relevance:
             # Mostrar relevancia de contactos
-            print("\n" + "=" * 80)
+            print("\n" + _SEPARATOR)
             print("RELEVANCIA DE CONTACTOS")
-            print("=" * 80)
+            print(_SEPARATOR)
 
             for i, (contact_id, data) in enumerate(contact_relevance[:10], 1):  # Mostrar los 10 más relevantes
                 print(f"{i}. {data['display_name']} ({data['phone']})")
@@ -213,9 +207,9 @@ def print_results(results, show_context=True, contacts=None):
             input("Presiona Enter para continuar...")
         elif choice == 'r':
             # Mostrar resumen de resultados
-            print("\n" + "=" * 80)
+            print("\n" + _SEPARATOR)
             print("RESUMEN DE RESULTADOS")
-            print("=" * 80)
+            print(_SEPARATOR)
 
             # Mostrar distribución de resultados por chat
             if chat_relevance:
@@ -267,228 +261,155 @@ def print_results(results, show_context=True, contacts=None):
 
     print("\nBúsqueda finalizada.")
 
-def save_results_to_file(results, filename, contacts=None):
+@lru_cache(maxsize=256)
+def _fmt_kw(keywords):
+    """Formatea la línea de palabras clave coincidentes (memoizada por tupla de palabras clave)"""
+    return "Palabras clave coincidentes: " + ", ".join(keywords) + "\n"
+
+def _format_result(result, position, total, show_context=True):
     """
-    Guarda resultados en un archivo JSON o Markdown.
+    Genera el texto de un resultado de print_results como una lista de fragmentos.
 
     Parámetros:
-    - results: Resultados a guardar (lista o diccionario con resultados y relevancia de contactos)
-    - filename: Nombre del archivo
-    - contacts: Diccionario de contactos (opcional)
+    - result: Resultado a mostrar
+    - position: Posición del resultado (desde 1)
+    - total: Número total de resultados
+    - show_context: Si se deben mostrar mensajes de contexto
 
     Retorna:
-    - success: True si se guardó correctamente, False en caso contrario
+    - parts: Lista de cadenas que concatenadas forman el texto del resultado
     """
-    try:
-        # Verificar si es un archivo Markdown
-        if filename.lower().endswith('.md'):
-            with open(filename, 'w', encoding='utf-8') as f:
-                # Verificar si results es un diccionario con resultados
-                if isinstance(results, dict):
-                    # Manejar diferentes tipos de resultados
-                    if 'results' in results:
-                        message_results = results['results']
-                    elif 'contact_relevance' in results:
-                        # Escribir encabezado para relevancia de contactos
-                        f.write(f"# Análisis de Relevancia de Contactos\n\n")
-                        contact_dict = results['contact_relevance']
-
-                        f.write(f"Se encontraron {len(contact_dict)} contactos relevantes:\n\n")
-
-                        # Ordenar contactos por puntuación
-                        sorted_contacts = sorted(
-                            contact_dict.items(),
-                            key=lambda x: x[1].get('final_score', x[1].get('score', 0)),
-                            reverse=True
-                        )
-
-                        for i, (contact_id, data) in enumerate(sorted_contacts, 1):
-                            score = data.get('final_score', data.get('score', 0))
-                            f.write(f"## {i}. {data.get('display_name', 'Desconocido')} (Puntuación: {score:.1f})\n")
-                            f.write(f"**Teléfono:** {data.get('phone', 'Desconocido')}\n")
-                            f.write(f"**Mensajes coincidentes:** {data.get('message_count', 0)}\n")
-
-                            # Escribir métricas adicionales si están disponibles
-                            if 'keyword_density' in data:
-                                f.write(f"**Densidad de palabras clave:** {data['keyword_density']:.2%}\n")
-                            if 'keyword_diversity' in data:
-                                f.write(f"**Diversidad de palabras clave:** {data['keyword_diversity']:.2%}\n")
-                            if 'recency_factor' in data:
-                                f.write(f"**Factor de recencia:** {data['recency_factor']:.2f}\n")
-
-                            # Escribir palabras clave más frecuentes
-                            if 'keyword_counts' in data and data['keyword_counts']:
-                                f.write("**Palabras clave más frecuentes:**\n")
-                                sorted_keywords = sorted(data['keyword_counts'].items(), key=lambda x: x[1], reverse=True)
-                                for keyword, count in sorted_keywords[:5]:
-                                    f.write(f"- {keyword}: {count} veces\n")
-
-                            f.write("\n")
-
-                        # Terminar aquí para evitar procesar como mensajes
-                        print(f"Resultados guardados en {filename}")
-                        return True
-                    elif 'chat_relevance' in results:
-                        # Escribir encabezado para relevancia de chats
-                        f.write(f"# Análisis de Relevancia de Chats\n\n")
-                        chat_dict = results['chat_relevance']
-
-                        f.write(f"Se encontraron {len(chat_dict)} chats relevantes:\n\n")
-
-                        # Ordenar chats por puntuación
-                        sorted_chats = sorted(
-                            chat_dict.items(),
-                            key=lambda x: x[1].get('final_score', x[1].get('score', 0)),
-                            reverse=True
-                        )
-
-                        for i, (chat_id, data) in enumerate(sorted_chats, 1):
-                            score = data.get('final_score', data.get('score', 0))
-                            f.write(f"## {i}. {data.get('display_name', 'Desconocido')} (Puntuación: {score:.1f})\n")
-                            f.write(f"**Mensajes coincidentes:** {data.get('message_count', 0)}\n")
-
-                            # Escribir métricas adicionales si están disponibles
-                            if 'keyword_density' in data:
-                                f.write(f"**Densidad de palabras clave:** {data['keyword_density']:.2%}\n")
-                            if 'keyword_diversity' in data:
-                                f.write(f"**Diversidad de palabras clave:** {data['keyword_diversity']:.2%}\n")
-                            if 'recency_factor' in data:
-                                f.write(f"**Factor de recencia:** {data['recency_factor']:.2f}\n")
-
-                            # Escribir palabras clave más frecuentes
-                            if 'keyword_counts' in data and data['keyword_counts']:
-                                f.write("**Palabras clave más frecuentes:**\n")
-                                sorted_keywords = sorted(data['keyword_counts'].items(), key=lambda x: x[1], reverse=True)
-                                for keyword, count in sorted_keywords[:5]:
-                                    f.write(f"- {keyword}: {count} veces\n")
-
-                            f.write("\n")
-
-                        # Terminar aquí para evitar procesar como mensajes
-                        print(f"Resultados guardados en {filename}")
-                        return True
-                    elif 'prospects' in results:
-                        # Escribir encabezado para prospectos de ventas
-                        f.write(f"# Análisis de Prospectos de Ventas\n\n")
-                        prospects_dict = results['prospects']
-
-                        f.write(f"Se encontraron {len(prospects_dict)} prospectos potenciales:\n\n")
-
-                        # Ordenar prospectos por puntuación de potencial
-                        sorted_prospects = sorted(
-                            prospects_dict.items(),
-                            key=lambda x: x[1].get('potential_score', 0),
-                            reverse=True
-                        )
-
-                        for i, (contact_id, data) in enumerate(sorted_prospects, 1):
-                            f.write(f"## {i}. {data.get('display_name', 'Desconocido')} ({data.get('phone', 'Desconocido')})\n")
-                            f.write(f"**Potencial de compra:** {data.get('potential_level', 'Desconocido')} ({data.get('potential_score', 0):.1f}/100)\n")
-                            f.write(f"**Mensajes relevantes:** {data.get('message_count', 0)}\n")
-                            f.write(f"**Densidad de palabras clave:** {data.get('keyword_density', 0):.2%}\n")
-
-                            # Escribir interés por categorías
-                            if 'categories' in data and data['categories']:
-                                f.write("**Interés por categorías:**\n")
-                                sorted_categories = sorted(
-                                    data['categories'].items(),
-                                    key=lambda x: x[1].get('score', 0),
-                                    reverse=True
-                                )
-                                for category_name, category_data in sorted_categories:
-                                    f.write(f"- {category_name}: {category_data.get('score', 0):.1f} puntos ({category_data.get('message_count', 0)} mensajes)\n")
-
-                            f.write("\n")
-
-                        # Escribir información de categorías
-                        if 'categories' in results:
-                            f.write("## Categorías analizadas\n\n")
-                            for category_name, keywords in results['categories'].items():
-                                f.write(f"**{category_name}:** {', '.join(keywords)}\n")
-
-                        # Escribir información de filtros
-                        if 'filters' in results:
-                            f.write("\n## Filtros aplicados\n\n")
-                            filters = results['filters']
-                            if 'start_date' in filters and filters['start_date']:
-                                f.write(f"**Fecha de inicio:** {filters['start_date']}\n")
-                            if 'end_date' in filters and filters['end_date']:
-                                f.write(f"**Fecha de fin:** {filters['end_date']}\n")
-                            if 'min_score' in filters:
-                                f.write(f"**Puntuación mínima:** {filters['min_score']}\n")
-
-                        # Escribir fecha de análisis
-                        if 'analysis_date' in results:
-                            f.write(f"\n**Fecha de análisis:** {results['analysis_date']}\n")
-
-                        # Terminar aquí para evitar procesar como mensajes
-                        print(f"Resultados guardados en {filename}")
-                        return True
-                    else:
-                        # Si no es ninguno de los tipos especiales, tratar como mensajes
-                        message_results = results
-                else:
-                    # Si no es un diccionario, asumir que es una lista de mensajes
-                    message_results = results
+    parts = []
+    write = parts.append
 
-                # Escribir encabezado para mensajes
-                f.write(f"# Resultados de búsqueda\n\n")
+    write("\n")
+    write(_SEPARATOR_LINE)
+    write(f"Resultado {position} de {total}\n")
+    write(_SEPARATOR_LINE)
 
-                # Verificar si message_results es una lista
-                if isinstance(message_results, list):
-                    f.write(f"Se encontraron {len(message_results)} mensajes coincidentes:\n\n")
+    # Mostrar información del chat
+    chat_name = result.get('chat_name', "")
+    chat_id = result.get('chat_id', "")
 
-                    for i, result in enumerate(message_results, 1):
-                        f.write(f"## Resultado {i}" + (f" (Puntuación: {result.get('score', 0):.1f})" if 'score' in result else "") + "\n")
-                        f.write(f"**Chat:** {result.get('chat_name', 'Desconocido')}\n")
+    # Asegurarse de que chat_name no sea None para evitar errores
+    if chat_name is None:
+        chat_name = ""
 
-                        # Escribir información del remitente
-                        if result.get('from_me'):
-                            f.write(f"**Remitente:** Yo\n")
-                        else:
-                            sender_info = result.get('sender', 'Desconocido')
-                            phone_info = result.get('phone', 'Desconocido')
+    # Si el chat_name es diferente del ID (número), mostrar ambos
+    if chat_name and chat_id and chat_name != chat_id and not chat_id.startswith(chat_name):
+        write(f"Chat: {chat_name} ({chat_id})\n")
+    else:
+        write(f"Chat: {chat_id}\n")
 
-                            if sender_info == phone_info or sender_info == result.get('sender_id', ''):
-                                f.write(f"**Remitente:** {phone_info}\n")
-                            else:
-                                f.write(f"**Remitente:** {sender_info}\n")
-                                if phone_info != "Desconocido":
-                                    f.write(f"**Teléfono:** {phone_info}\n")
+    # Mostrar información del remitente
+    if result.get('from_me'):
+        write(f"Remitente: Yo\n")
+    else:
+        sender_info = result.get('sender', 'Desconocido')
+        phone_info = result.get('phone', 'Desconocido')
+        sender_id = result.get('sender_id', '')
+
+        # Asegurarse de que sender_info y phone_info no sean None
+        if sender_info is None:
+            sender_info = "Desconocido"
+        if phone_info is None:
+            phone_info = "Desconocido"
+
+        # Si hay un nombre de contacto y es diferente del número, mostrar ambos
+        if sender_info != phone_info and sender_info != "Desconocido" and sender_info != sender_id:
+            write(f"Remitente: {sender_info} ({phone_info})\n")
+        else:
+            write(f"Remitente: {phone_info}\n")
 
-                        f.write(f"**Fecha:** {result.get('date', 'Desconocida')}\n")
+    write(f"Fecha: {result['date']}\n")
+    write(f"Puntuación: {result.get('score', 0):.1f}\n")
 
-                        if 'matched_keywords' in result:
-                            f.write(f"**Palabras clave coincidentes:** {', '.join(result['matched_keywords'])}\n")
+    if 'matched_keywords' in result:
+        write(_fmt_kw(tuple(result['matched_keywords'])))
 
-                        # Incluir estadísticas de palabras si están disponibles
-                        if 'word_stats' in result:
-                            stats = result['word_stats']
-                            f.write(f"**Densidad de palabras clave:** {stats.get('keyword_density', 0):.2%} ({stats.get('total_keywords', 0)} de {stats.get('total_words', 0)} palabras)\n")
+    # Mostrar estadísticas de palabras si están disponibles
+    if 'word_stats' in result:
+        stats = result['word_stats']
+        write(f"Densidad de palabras clave: {stats['keyword_density']:.2%} ({stats['total_keywords']} de {stats['total_words']} palabras)\n")
 
-                            # Incluir factores adicionales si están disponibles
-                            additional_factors = []
+        # Mostrar factores adicionales si están disponibles
+        additional_factors = []
 
-                            if 'proximity_factor' in stats:
-                                additional_factors.append(f"Proximidad: {stats['proximity_factor']:.2f}")
+        if 'proximity_factor' in stats:
+            additional_factors.append(f"Proximidad: {stats['proximity_factor']:.2f}")
 
-                            if 'position_factor' in stats:
-                                additional_factors.append(f"Posición: {stats['position_factor']:.2f}")
+        if 'position_factor' in stats:
+            additional_factors.append(f"Posición: {stats['position_factor']:.2f}")
 
-                            if 'partial_matches' in stats and stats['partial_matches'] > 0:
-                                additional_factors.append(f"Coincidencias parciales: {stats['partial_matches']}")
+        if 'partial_matches' in stats and stats['partial_matches'] > 0:
+            additional_factors.append(f"Coincidencias parciales: {stats['partial_matches']}")
 
-                            if additional_factors:
-                                f.write(f"**Factores adicionales:** {' | '.join(additional_factors)}\n")
+        if additional_factors:
+            write(f"Factores adicionales: {' | '.join(additional_factors)}\n")
 
-                        f.write(f"**Mensaje:** {result.get('message', '')}\n\n")
-                else:
-                    # Si no es una lista, escribir un mensaje de error
-                    f.write("Error: No se pudieron procesar los resultados en formato adecuado.\n")
+    write(f"\nMensaje: {result['message']}\n")
+
+    context = result.get('context') if show_context else None
+    if context:
+        write("\nContexto:\n")
+        # Enlazar globales y métodos a variables locales para el bucle de contexto
+        ctx_fmt = _CTX_FMT
+        ctx_prefix = _CTX_PREFIX.get
+        for ctx in context:
+            ctx_get = ctx.get
+
+            # Formatear remitente para mensajes de contexto
+            if ctx_get('from_me'):
+                ctx_sender = "Yo"
+            else:
+                ctx_sender = ctx_get('sender', 'Desconocido')
+                if ctx_sender is None:
+                    ctx_sender = "Desconocido"
+                ctx_phone = ctx_get('phone', 'Desconocido')
+                if ctx_phone is None:
+                    ctx_phone = "Desconocido"
+                # Si el nombre es diferente del teléfono, mostrar ambos
+                if ctx_sender != ctx_phone and ctx_sender != "Desconocido":
+                    ctx_sender = f"{ctx_sender} ({ctx_phone})"
+
+            write(ctx_fmt(ctx_prefix(ctx['type'], "  "), ctx['date'], ctx_sender, ctx['message']))
+
+    return parts
+
+def save_results_to_file(results, filename, contacts=None, background=False):
+    """
+    Guarda resultados en un archivo JSON o Markdown.
+    El formato se elige por la extensión: .md, .json, JSON comprimido (.json.gz, .json.zst)
+    o MessagePack comprimido (.msgpack.zst).
+
+    Parámetros:
+    - results: Resultados a guardar (lista o diccionario con resultados y relevancia de contactos)
+    - filename: Nombre del archivo
+    - contacts: Diccionario de contactos (opcional)
+    - background: Si es True, la escritura se encola en un hilo aparte y no se
+      deben modificar los resultados hasta que termine
+
+    Retorna:
+    - success: True si se guardó correctamente, False en caso contrario
+      (con background=True, un Future que resuelve a ese mismo valor)
+    """
+    if background:
+        return _get_writer().submit(save_results_to_file, results, filename, contacts)
+
+    try:
+        name = filename.lower()
+        # Verificar si es un archivo Markdown
+        if name.endswith('.md'):
+            # Construir el documento completo en memoria y escribirlo de una sola vez
+            parts = _build_markdown(results)
+            with open(filename, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                f.write("".join(parts))
+        elif name.endswith('.msgpack.zst'):
+            _save_msgpack_compressed(results, filename)
+        elif name.endswith(('.json.gz', '.json.zst')):
+            _save_json_compressed(results, filename)
         else:
-            # Guardar como JSON
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
+            _save_json(results, filename)
 
         print(f"Resultados guardados en {filename}")
         return True
@@ -497,3 +418,324 @@ def save_results_to_file(results, filename, contacts=None):
         import traceback
         traceback.print_exc()
         return False
+
+def _build_markdown(results):
+    """
+    Genera el contenido Markdown de save_results_to_file como una lista de fragmentos.
+
+    Parámetros:
+    - results: Resultados a guardar (lista o diccionario con resultados y relevancia de contactos)
+
+    Retorna:
+    - parts: Lista de fragmentos de texto que forman el documento
+    """
+    parts = []
+    write = parts.append
+
+    # Verificar si results es un diccionario con resultados
+    if isinstance(results, dict):
+        # Manejar diferentes tipos de resultados
+        if 'results' in results:
+            message_results = results['results']
+        elif 'contact_relevance' in results:
+            # Escribir encabezado para relevancia de contactos
+            write(f"# Análisis de Relevancia de Contactos\n\n")
+            contact_dict = results['contact_relevance']
+
+            write(f"Se encontraron {len(contact_dict)} contactos relevantes:\n\n")
+
+            # Ordenar contactos por puntuación
+            sorted_contacts = sorted(
+                contact_dict.items(),
+                key=lambda x: x[1].get('final_score', x[1].get('score', 0)),
+                reverse=True
+            )
+
+            for i, (contact_id, data) in enumerate(sorted_contacts, 1):
+                score = data.get('final_score', data.get('score', 0))
+                write(f"## {i}. {data.get('display_name', 'Desconocido')} (Puntuación: {score:.1f})\n")
+                write(f"**Teléfono:** {data.get('phone', 'Desconocido')}\n")
+                write(f"**Mensajes coincidentes:** {data.get('message_count', 0)}\n")
+
+                # Escribir métricas adicionales si están disponibles
+                if 'keyword_density' in data:
+                    write(f"**Densidad de palabras clave:** {data['keyword_density']:.2%}\n")
+                if 'keyword_diversity' in data:
+                    write(f"**Diversidad de palabras clave:** {data['keyword_diversity']:.2%}\n")
+                if 'recency_factor' in data:
+                    write(f"**Factor de recencia:** {data['recency_factor']:.2f}\n")
+
+                # Escribir palabras clave más frecuentes
+                if 'keyword_counts' in data and data['keyword_counts']:
+                    write("**Palabras clave más frecuentes:**\n")
+                    sorted_keywords = sorted(data['keyword_counts'].items(), key=lambda x: x[1], reverse=True)
+                    for keyword, count in sorted_keywords[:5]:
+                        write(f"- {keyword}: {count} veces\n")
+
+                write("\n")
+
+            # Terminar aquí para evitar procesar como mensajes
+            return parts
+        elif 'chat_relevance' in results:
+            # Escribir encabezado para relevancia de chats
+            write(f"# Análisis de Relevancia de Chats\n\n")
+            chat_dict = results['chat_relevance']
+
+            write(f"Se encontraron {len(chat_dict)} chats relevantes:\n\n")
+
+            # Ordenar chats por puntuación
+            sorted_chats = sorted(
+                chat_dict.items(),
+                key=lambda x: x[1].get('final_score', x[1].get('score', 0)),
+                reverse=True
+            )
+
+            for i, (chat_id, data) in enumerate(sorted_chats, 1):
+                score = data.get('final_score', data.get('score', 0))
+                write(f"## {i}. {data.get('display_name', 'Desconocido')} (Puntuación: {score:.1f})\n")
+                write(f"**Mensajes coincidentes:** {data.get('message_count', 0)}\n")
+
+                # Escribir métricas adicionales si están disponibles
+                if 'keyword_density' in data:
+                    write(f"**Densidad de palabras clave:** {data['keyword_density']:.2%}\n")
+                if 'keyword_diversity' in data:
+                    write(f"**Diversidad de palabras clave:** {data['keyword_diversity']:.2%}\n")
+                if 'recency_factor' in data:
+                    write(f"**Factor de recencia:** {data['recency_factor']:.2f}\n")
+
+                # Escribir palabras clave más frecuentes
+                if 'keyword_counts' in data and data['keyword_counts']:
+                    write("**Palabras clave más frecuentes:**\n")
+                    sorted_keywords = sorted(data['keyword_counts'].items(), key=lambda x: x[1], reverse=True)
+                    for keyword, count in sorted_keywords[:5]:
+                        write(f"- {keyword}: {count} veces\n")
+
+                write("\n")
+
+            # Terminar aquí para evitar procesar como mensajes
+            return parts
+        elif 'prospects' in results:
+            # Escribir encabezado para prospectos de ventas
+            write(f"# Análisis de Prospectos de Ventas\n\n")
+            prospects_dict = results['prospects']
+
+            write(f"Se encontraron {len(prospects_dict)} prospectos potenciales:\n\n")
+
+            # Ordenar prospectos por puntuación de potencial
+            sorted_prospects = sorted(
+                prospects_dict.items(),
+                key=lambda x: x[1].get('potential_score', 0),
+                reverse=True
+            )
+
+            for i, (contact_id, data) in enumerate(sorted_prospects, 1):
+                write(f"## {i}. {data.get('display_name', 'Desconocido')} ({data.get('phone', 'Desconocido')})\n")
+                write(f"**Potencial de compra:** {data.get('potential_level', 'Desconocido')} ({data.get('potential_score', 0):.1f}/100)\n")
+                write(f"**Mensajes relevantes:** {data.get('message_count', 0)}\n")
+                write(f"**Densidad de palabras clave:** {data.get('keyword_density', 0):.2%}\n")
+
+                # Escribir interés por categorías
+                if 'categories' in data and data['categories']:
+                    write("**Interés por categorías:**\n")
+                    sorted_categories = sorted(
+                        data['categories'].items(),
+                        key=lambda x: x[1].get('score', 0),
+                        reverse=True
+                    )
+                    for category_name, category_data in sorted_categories:
+                        write(f"- {category_name}: {category_data.get('score', 0):.1f} puntos ({category_data.get('message_count', 0)} mensajes)\n")
+
+                write("\n")
+
+            # Escribir información de categorías
+            if 'categories' in results:
+                write("## Categorías analizadas\n\n")
+                for category_name, keywords in results['categories'].items():
+                    write(f"**{category_name}:** {', '.join(keywords)}\n")
+
+            # Escribir información de filtros
+            if 'filters' in results:
+                write("\n## Filtros aplicados\n\n")
+                filters = results['filters']
+                if 'start_date' in filters and filters['start_date']:
+                    write(f"**Fecha de inicio:** {filters['start_date']}\n")
+                if 'end_date' in filters and filters['end_date']:
+                    write(f"**Fecha de fin:** {filters['end_date']}\n")
+                if 'min_score' in filters:
+                    write(f"**Puntuación mínima:** {filters['min_score']}\n")
+
+            # Escribir fecha de análisis
+            if 'analysis_date' in results:
+                write(f"\n**Fecha de análisis:** {results['analysis_date']}\n")
+
+            # Terminar aquí para evitar procesar como mensajes
+            return parts
+        else:
+            # Si no es ninguno de los tipos especiales, tratar como mensajes
+            message_results = results
+    else:
+        # Si no es un diccionario, asumir que es una lista de mensajes
+        message_results = results
+
+    # Escribir encabezado para mensajes
+    write(f"# Resultados de búsqueda\n\n")
+
+    # Verificar si message_results es una lista
+    if isinstance(message_results, list):
+        write(f"Se encontraron {len(message_results)} mensajes coincidentes:\n\n")
+
+        for i, result in enumerate(message_results, 1):
+            write(f"## Resultado {i}" + (f" (Puntuación: {result.get('score', 0):.1f})" if 'score' in result else "") + "\n")
+            write(f"**Chat:** {result.get('chat_name', 'Desconocido')}\n")
+
+            # Escribir información del remitente
+            if result.get('from_me'):
+                write(f"**Remitente:** Yo\n")
+            else:
+                sender_info = result.get('sender', 'Desconocido')
+                phone_info = result.get('phone', 'Desconocido')
+
+                if sender_info == phone_info or sender_info == result.get('sender_id', ''):
+                    write(f"**Remitente:** {phone_info}\n")
+                else:
+                    write(f"**Remitente:** {sender_info}\n")
+                    if phone_info != "Desconocido":
+                        write(f"**Teléfono:** {phone_info}\n")
+
+            write(f"**Fecha:** {result.get('date', 'Desconocida')}\n")
+
+            if 'matched_keywords' in result:
+                write(f"**Palabras clave coincidentes:** {', '.join(result['matched_keywords'])}\n")
+
+            # Incluir estadísticas de palabras si están disponibles
+            if 'word_stats' in result:
+                stats = result['word_stats']
+                write(f"**Densidad de palabras clave:** {stats.get('keyword_density', 0):.2%} ({stats.get('total_keywords', 0)} de {stats.get('total_words', 0)} palabras)\n")
+
+                # Incluir factores adicionales si están disponibles
+                additional_factors = []
+
+                if 'proximity_factor' in stats:
+                    additional_factors.append(f"Proximidad: {stats['proximity_factor']:.2f}")
+
+                if 'position_factor' in stats:
+                    additional_factors.append(f"Posición: {stats['position_factor']:.2f}")
+
+                if 'partial_matches' in stats and stats['partial_matches'] > 0:
+                    additional_factors.append(f"Coincidencias parciales: {stats['partial_matches']}")
+
+                if additional_factors:
+                    write(f"**Factores adicionales:** {' | '.join(additional_factors)}\n")
+
+            write(f"**Mensaje:** {result.get('message', '')}\n\n")
+    else:
+        # Si no es una lista, escribir un mensaje de error
+        write("Error: No se pudieron procesar los resultados en formato adecuado.\n")
+
+    return parts
+
+def _save_json(results, filename):
+    """
+    Guarda resultados como JSON, usando orjson si está disponible.
+
+    Parámetros:
+    - results: Resultados a guardar
+    - filename: Nombre del archivo
+    """
+    blob = _orjson_dumps(results, indent=True)
+    if blob is not None:
+        with open(filename, 'wb') as f:
+            f.write(blob)
+        return
+
+    # Guardar con json estándar, escribiendo los fragmentos codificados directamente en el archivo
+    with open(filename, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        for chunk in _JSON_ENCODER.iterencode(results):
+            f.write(chunk)
+
+def _orjson_dumps(results, indent):
+    """
+    Codifica resultados con orjson (los arrays de NumPy se serializan sin convertirlos a listas).
+
+    Parámetros:
+    - results: Resultados a codificar
+    - indent: Si se debe indentar con 2 espacios
+
+    Retorna:
+    - blob: Bytes JSON, o None si orjson no está disponible o no soporta algún valor
+    """
+    if not ORJSON_AVAILABLE:
+        return None
+
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    try:
+        return orjson.dumps(results, default=str, option=option)
+    except TypeError:
+        # Valores que orjson no soporta (p. ej. enteros de más de 64 bits): usar json estándar
+        return None
+
+def _open_compressed(filename):
+    """
+    Abre un archivo binario de escritura que comprime según la extensión (.gz o .zst).
+
+    Parámetros:
+    - filename: Nombre del archivo
+
+    Retorna:
+    - f: Objeto de archivo binario; al cerrarlo se vacía el compresor y se cierra el archivo
+    """
+    if filename.lower().endswith('.gz'):
+        return gzip.open(filename, 'wb', compresslevel=6)
+
+    if not ZSTD_AVAILABLE:
+        raise ImportError("zstandard no está instalado (pip install zstandard); "
+                          "use .json o .json.gz")
+    return zstandard.ZstdCompressor(level=3).stream_writer(open(filename, 'wb'))
+
+def _save_json_compressed(results, filename):
+    """
+    Guarda resultados como JSON compacto comprimido con gzip o zstd.
+
+    Parámetros:
+    - results: Resultados a guardar
+    - filename: Nombre del archivo (.json.gz o .json.zst)
+    """
+    blob = _orjson_dumps(results, indent=False)
+    with _open_compressed(filename) as raw:
+        if blob is not None:
+            raw.write(blob)
+            return
+
+        # Sin orjson: los fragmentos de json estándar pasan por el compresor a medida que se generan
+        text = io.TextIOWrapper(raw, encoding='utf-8', write_through=False)
+        for chunk in _JSON_ENCODER_COMPACT.iterencode(results):
+            text.write(chunk)
+        text.flush()
+        text.detach()
+
+def _msgpack_default(obj):
+    """
+    Convierte valores que msgpack no soporta: arrays y escalares de NumPy a tipos nativos,
+    el resto (fechas, conjuntos, ...) a texto como en la salida JSON.
+    """
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return str(obj)
+
+def _save_msgpack_compressed(results, filename):
+    """
+    Guarda resultados como MessagePack comprimido con zstd.
+
+    Parámetros:
+    - results: Resultados a guardar
+    - filename: Nombre del archivo (.msgpack.zst)
+    """
+    if not MSGPACK_AVAILABLE:
+        raise ImportError("msgpack no está instalado (pip install msgpack); use .json.zst o .json")
+
+    blob = msgpack.packb(results, default=_msgpack_default, use_bin_type=True,
+                         strict_types=False)
+    with _open_compressed(filename) as f:
+        f.write(blob)
@@ -8,6 +8,7 @@ según diferentes criterios.
 
 import re
 from datetime import datetime
+from functools import lru_cache
 
 
 def get_sort_key_function(sort_by):
@@ -100,9 +101,11 @@ def sort_results(results, sort_criteria=None):
     return sorted_results
 
 
+@lru_cache(maxsize=1)
 def get_available_sort_criteria():
     """
     Obtiene la lista de criterios de ordenación disponibles.
+    El diccionario se construye una sola vez por proceso y se comparte (no debe modificarse).
 
     Retorna:
     - criteria: Diccionario con criterios de ordenación y sus descripciones
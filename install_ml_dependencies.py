@@ -9,6 +9,16 @@ import sys
 import os
 import platform
 
+# Directorio local con ruedas (wheels) precompiladas; si existe, se instala sin acceder a la red
+WHEEL_CACHE = "wheelhouse"
+
+def pip_install_command(*packages):
+    """Construye el comando de pip para instalar los paquetes indicados"""
+    command = [sys.executable, "-m", "pip", "install", "--disable-pip-version-check", "--quiet", *packages]
+    if os.path.isdir(WHEEL_CACHE):
+        command.extend(["--no-index", "--find-links", WHEEL_CACHE])
+    return command
+
 def install_dependencies():
     """Instala las dependencias necesarias para el análisis con ML optimizadas para Intel"""
     # Dependencias básicas
@@ -51,37 +61,47 @@ def install_dependencies():
             print(f"No se pudo detectar la GPU: {e}")
 
     print("Instalando dependencias básicas...")
-    for dep in base_dependencies:
-        print(f"Instalando {dep}...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", dep])
+    print(f"Instalando {', '.join(base_dependencies)}...")
+    subprocess.check_call(pip_install_command(*base_dependencies))
 
     # Instalar PyTorch con soporte para Intel
     print("Instalando PyTorch optimizado...")
     if has_intel_gpu:
         print("Detectada GPU Intel. Instalando PyTorch con soporte para GPU Intel...")
         # PyTorch con soporte para GPU Intel
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "torch", "torchvision", "torchaudio"])
+        subprocess.check_call(pip_install_command("torch", "torchvision", "torchaudio"))
 
         # Intentar instalar extensiones de Intel para PyTorch
         try:
             print("Instalando Intel Extension for PyTorch...")
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "intel-extension-for-pytorch"])
+            subprocess.check_call(pip_install_command("intel-extension-for-pytorch"))
         except Exception as e:
             print(f"No se pudo instalar Intel Extension for PyTorch: {e}")
             print("Continuando con la instalación...")
     else:
         # PyTorch estándar
         print("Instalando PyTorch estándar...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "torch"])
+        subprocess.check_call(pip_install_command("torch"))
 
     # Intentar instalar Intel Extension for Scikit-learn
     try:
         print("Instalando Intel Extension for Scikit-learn...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "scikit-learn-intelex"])
+        subprocess.check_call(pip_install_command("scikit-learn-intelex"))
     except Exception as e:
         print(f"No se pudo instalar Intel Extension for Scikit-learn: {e}")
         print("Continuando con la instalación...")
 
+    # Aceleradores opcionales (JSON, caché comprimida, prefiltro, LDA multiproceso): si alguno
+    # no se instala, el código usa la alternativa más lenta
+    optional_dependencies = ["orjson", "ijson", "pyahocorasick", "zstandard", "msgpack", "blake3", "gensim"]
+    for package in optional_dependencies:
+        try:
+            print(f"Instalando {package} (opcional)...")
+            subprocess.check_call(pip_install_command(package))
+        except Exception as e:
+            print(f"No se pudo instalar {package}: {e}")
+            print("Continuando con la instalación...")
+
     # Descargar modelos de spaCy
     print("Descargando modelo de spaCy para español...")
     subprocess.check_call([sys.executable, "-m", "spacy", "download", "es_core_news_md"])
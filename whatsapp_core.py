@@ -6,16 +6,127 @@ Este módulo contiene funciones centrales compartidas por todas las herramientas
 de análisis y búsqueda de WhatsApp.
 """
 
+import importlib.util
+import io
+import itertools
 import json
+import mmap
 import os
 import re
+import sys
 from datetime import datetime
 import time
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple, Union, Any
 
 # Importar el nuevo sistema de resolución de contactos
 from contact_resolver import get_resolver, ContactResolver
 
+# orjson es opcional: si está instalado se usa para decodificar JSON más rápido
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# ijson es opcional: si está instalado los datos se leen en streaming, chat por chat
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+# Etiquetas fijas de print_results, internadas una sola vez al cargar el módulo
+_L_MATCH = sys.intern("Coincidencias: ")
+_L_CTX = sys.intern("Contexto:\n")
+_L_ME = sys.intern("Yo")
+_L_UNK = sys.intern("Desconocido")
+_L_ARROW_UP = sys.intern("↑ ")
+_L_ARROW_DOWN = sys.intern("↓ ")
+
+# Plantilla precompilada para las líneas de contexto de print_results
+_CTX_FMT = "  {}[{}] {}: {}\n".format
+
+# Prefijo de cada línea de contexto según su tipo
+_CTX_PREFIX = {'previous': _L_ARROW_UP, 'next': _L_ARROW_DOWN}
+
+@lru_cache(maxsize=256)
+def _fmt_kw(keywords):
+    """Formatea la línea de palabras clave coincidentes (memoizada por tupla de palabras clave)"""
+    return _L_MATCH + ", ".join(keywords) + "\n"
+
+def _read_json(file_path):
+    """
+    Lee un archivo JSON completo, con orjson si está disponible.
+    Si orjson rechaza el contenido (p. ej. NaN o enteros muy grandes), se usa json.
+
+    Parámetros:
+    - file_path: Ruta al archivo JSON
+
+    Retorna:
+    - data: Contenido decodificado
+    """
+    if ORJSON_AVAILABLE:
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError("El archivo JSON está vacío")
+            # Mapear el archivo en memoria: orjson lee directamente de la caché de páginas
+            # del sistema, sin copiar el texto completo al heap de Python
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    try:
+                        return orjson.loads(view)
+                    except orjson.JSONDecodeError:
+                        return json.loads(view.tobytes().decode('utf-8'))
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def iter_json_chats(file_path):
+    """
+    Recorre los chats de un archivo JSON de WhatsApp sin cargar el texto completo en memoria.
+    Con ijson el archivo se analiza en streaming; sin él se usa json.load.
+
+    Parámetros:
+    - file_path: Ruta al archivo JSON
+
+    Retorna:
+    - Generador de pares (chat_id, chat_data)
+    """
+    with open(file_path, 'rb') as f:
+        if IJSON_AVAILABLE and _starts_with_object(f):
+            for chat_id, chat_data in ijson.kvitems(f, '', use_float=True):
+                yield chat_id, _intern_message_keys(chat_data)
+            return
+        data = json.load(f)
+    yield from data.items()
+
+def _intern_message_keys(chat_data):
+    """
+    Comparte entre todos los mensajes de un chat los nombres de sus campos.
+    ijson crea una cadena nueva para cada clave de cada mensaje (orjson ya las reutiliza),
+    así que sin esto los nombres de campo ocupan buena parte de la memoria de los datos.
+
+    Parámetros:
+    - chat_data: Datos de un chat tal como los devuelve ijson
+
+    Retorna:
+    - chat_data: Los mismos datos, con las claves de los mensajes internadas
+    """
+    messages = chat_data.get('messages') if isinstance(chat_data, dict) else None
+    if isinstance(messages, dict):
+        intern = sys.intern
+        for msg_id, msg in messages.items():
+            if isinstance(msg, dict):
+                messages[msg_id] = {intern(key): value for key, value in msg.items()}
+    return chat_data
+
+def _starts_with_object(f):
+    """Indica si el archivo binario contiene un objeto JSON en la raíz (deja el cursor al inicio)"""
+    head = f.read(64).lstrip(b'\xef\xbb\xbf \t\r\n')
+    f.seek(0)
+    return head.startswith(b'{')
+
 def load_json_data(file_path):
     """
     Carga datos de WhatsApp desde un archivo JSON.
@@ -28,8 +139,11 @@ def load_json_data(file_path):
     """
     print(f"Cargando datos desde {file_path}...")
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        if IJSON_AVAILABLE and not ORJSON_AVAILABLE:
+            # Construir el diccionario chat por chat, sin mantener el texto del archivo en memoria
+            data = dict(iter_json_chats(file_path))
+        else:
+            data = _read_json(file_path)
         print(f"Datos cargados correctamente. Se encontraron {len(data)} chats.")
         return data
     except Exception as e:
@@ -51,8 +165,7 @@ def load_contacts(file_path):
         return {}
 
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            contacts = json.load(f)
+        contacts = _read_json(file_path)
         print(f"Contactos cargados correctamente. Se encontraron {len(contacts)} contactos.")
         return contacts
     except Exception as e:
@@ -90,6 +203,27 @@ def format_phone_number(phone, contacts=None, data=None, context=None):
             print(f"Error en resolución avanzada: {e}")
             pass
 
+    # Sin contactos el resultado solo depende del número, así que se reutiliza
+    if not contacts and isinstance(phone, str):
+        return _format_phone_cached(phone)
+    return _format_phone_local(phone, contacts)
+
+@lru_cache(maxsize=65536)
+def _format_phone_cached(phone):
+    """Versión memoizada de _format_phone_local para números sin diccionario de contactos"""
+    return _format_phone_local(phone)
+
+def _format_phone_local(phone, contacts=None):
+    """
+    Formatea un número de teléfono sin el resolvedor (implementación original).
+
+    Parámetros:
+    - phone: Número de teléfono a formatear
+    - contacts: Diccionario de contactos (opcional)
+
+    Retorna:
+    - formatted_phone: Número de teléfono formateado o nombre del contacto
+    """
     # Implementación original para compatibilidad
     if not phone or not isinstance(phone, str):
         return "Desconocido"
@@ -899,15 +1033,93 @@ def extract_messages(data, contacts=None, chat_filter=None, start_date=None, end
 
     return all_messages
 
-def print_results(results, show_context=True, show_contact_relevance=False, contacts=None):
+def _write_result_header(write, i, result):
+    """Escribe el encabezado y el mensaje de un resultado de print_results"""
+    # Título del resultado con formato más compacto
+    write(f"Resultado {i}" + (f" ({result.get('score', 0):.1f})" if 'score' in result else "") + "\n")
+
+    # Organizar información en un formato más conciso
+    # 1. Información del chat (siempre visible)
+    chat_name = result.get('chat_name', "")
+    if chat_name is None or chat_name == "None":
+        chat_name = "Chat sin nombre"
+
+    # 2. Información de dirección y tipo (si está disponible)
+    if 'destination_info' in result:
+        dest_info = result['destination_info']
+        direction = dest_info.get('direction', '').capitalize()
+        chat_type = dest_info.get('chat_type')
+
+        # Mostrar tipo y dirección juntos si ambos están disponibles
+        if chat_type == 'group':
+            write(f"Chat: {chat_name} (Grupo) • {direction}\n")
+        elif chat_type == 'individual':
+            recipient = dest_info.get('recipient_name', '')
+            if recipient and recipient != "Yo" and recipient != chat_name:
+                write(f"Chat: {chat_name} • {direction} • Destinatario: {recipient}\n")
+            else:
+                write(f"Chat: {chat_name} • {direction}\n")
+        else:
+            write(f"Chat: {chat_name} • {direction}\n")
+    else:
+        write(f"Chat: {chat_name}\n")
+
+    # 3. Información del remitente (formato compacto)
+    if result.get('from_me'):
+        write("De: Yo\n")
+    else:
+        sender_info = result.get('sender', 'Desconocido')
+        phone_info = result.get('phone', 'Desconocido')
+
+        if sender_info == phone_info or sender_info == result.get('sender_id', ''):
+            write(f"De: {phone_info}\n")
+        else:
+            write(f"De: {sender_info}\n")
+
+    # 4. Fecha del mensaje
+    write(f"Fecha: {result.get('date', 'Desconocido')}\n")
+
+    # 5. Palabras clave coincidentes (si existen)
+    if 'matched_keywords' in result and result['matched_keywords']:
+        write(_fmt_kw(tuple(result['matched_keywords'])))
+
+    # 6. Mensaje con formato destacado
+    write(f"\n{result.get('message', '')}\n\n")
+
+def _write_result_context(write, context):
+    """Escribe el bloque de contexto de un resultado de print_results"""
+    write(_L_CTX)
+    # Enlazar globales a variables locales para el bucle de contexto
+    ctx_fmt = _CTX_FMT
+    ctx_prefix = _CTX_PREFIX.get
+    for ctx in context:
+        ctx_get = ctx.get
+        ctx_type = ctx['type']
+        ctx_date = ctx['date']
+        ctx_message = ctx['message']
+
+        # Formatear remitente para mensajes de contexto (None o vacío se muestra como desconocido)
+        ctx_sender = _L_ME if ctx_get('from_me') else (ctx_get('sender') or _L_UNK)
+
+        write(ctx_fmt(ctx_prefix(ctx_type, "  "), ctx_date, ctx_sender, ctx_message))
+    write("\n")
+
+def _flush_page(buf):
+    """Escribe el contenido del búfer en la salida estándar y lo vacía"""
+    sys.stdout.write(buf.getvalue())
+    buf.seek(0)
+    buf.truncate(0)
+
+def print_results(results, show_context=True, show_contact_relevance=False, contacts=None, page_size=64):
     """
     Imprime resultados de búsqueda en un formato legible y optimizado.
 
     Parámetros:
-    - results: Lista de resultados de búsqueda o diccionario con resultados y relevancia de contactos
+    - results: Lista (o iterador) de resultados de búsqueda o diccionario con resultados y relevancia de contactos
     - show_context: Si se deben mostrar mensajes de contexto
     - show_contact_relevance: Si se debe mostrar la relevancia de contactos (obsoleto - ya no se usa)
     - contacts: Diccionario de contactos (opcional)
+    - page_size: Número de resultados acumulados antes de escribir en la salida estándar
     """
     # Verificar si es un diccionario con resultados y relevancia de contactos
     if isinstance(results, dict) and 'results' in results:
@@ -915,85 +1127,49 @@ def print_results(results, show_context=True, show_contact_relevance=False, cont
     else:
         message_results = results
 
-    if not message_results:
+    if message_results is not None and not hasattr(message_results, '__len__'):
+        # Iterador perezoso: comprobar que haya al menos un resultado sin materializar el resto
+        message_results = iter(message_results)
+        first_result = next(message_results, None)
+        if first_result is None:
+            print("\nNo se encontraron mensajes coincidentes con los criterios de búsqueda.")
+            return
+        message_results = itertools.chain((first_result,), message_results)
+        print("\nMensajes coincidentes:\n")
+    elif not message_results:
         print("\nNo se encontraron mensajes coincidentes con los criterios de búsqueda.")
         return
+    else:
+        print(f"\nSe encontraron {len(message_results)} mensajes coincidentes:\n")
+
+    # Usar línea separadora más sutil (con los saltos de línea ya añadidos)
+    separator = "─" * 50 + "\n\n"
+
+    # Acumular la salida en un búfer y escribirla por páginas de resultados
+    buf = io.StringIO()
+    write = buf.write
+
+    # Bucles especializados según show_context, para no evaluar la condición en cada resultado
+    if show_context:
+        for i, result in enumerate(message_results, 1):
+            _write_result_header(write, i, result)
+            context = result.get('context')
+            if context:
+                _write_result_context(write, context)
+            write(separator)
+
+            if i % page_size == 0:
+                _flush_page(buf)
+    else:
+        for i, result in enumerate(message_results, 1):
+            _write_result_header(write, i, result)
+            write(separator)
 
-    print(f"\nSe encontraron {len(message_results)} mensajes coincidentes:\n")
-
-    # Usar línea separadora más sutil
-    separator = "─" * 50
-
-    for i, result in enumerate(message_results, 1):
-        # Título del resultado con formato más compacto
-        print(f"Resultado {i}" + (f" ({result.get('score', 0):.1f})" if 'score' in result else ""))
-
-        # Organizar información en un formato más conciso
-        # 1. Información del chat (siempre visible)
-        chat_name = result.get('chat_name', "")
-        if chat_name is None or chat_name == "None":
-            chat_name = "Chat sin nombre"
-
-        # 2. Información de dirección y tipo (si está disponible)
-        if 'destination_info' in result:
-            dest_info = result['destination_info']
-            direction = dest_info.get('direction', '').capitalize()
-            chat_type = dest_info.get('chat_type')
-
-            # Mostrar tipo y dirección juntos si ambos están disponibles
-            if chat_type == 'group':
-                print(f"Chat: {chat_name} (Grupo) • {direction}")
-            elif chat_type == 'individual':
-                recipient = dest_info.get('recipient_name', '')
-                if recipient and recipient != "Yo" and recipient != chat_name:
-                    print(f"Chat: {chat_name} • {direction} • Destinatario: {recipient}")
-                else:
-                    print(f"Chat: {chat_name} • {direction}")
-            else:
-                print(f"Chat: {chat_name} • {direction}")
-        else:
-            print(f"Chat: {chat_name}")
-
-        # 3. Información del remitente (formato compacto)
-        if result.get('from_me'):
-            print(f"De: Yo")
-        else:
-            sender_info = result.get('sender', 'Desconocido')
-            phone_info = result.get('phone', 'Desconocido')
-
-            if sender_info == phone_info or sender_info == result.get('sender_id', ''):
-                print(f"De: {phone_info}")
-            else:
-                print(f"De: {sender_info}")
-
-        # 4. Fecha del mensaje
-        print(f"Fecha: {result.get('date', 'Desconocido')}")
-
-        # 5. Palabras clave coincidentes (si existen)
-        if 'matched_keywords' in result and result['matched_keywords']:
-            print(f"Coincidencias: {', '.join(result['matched_keywords'])}")
-
-        # 6. Mensaje con formato destacado
-        print(f"\n{result.get('message', '')}\n")
-
-        # 7. Contexto (si está disponible y se solicita)
-        if show_context and 'context' in result and result['context']:
-            print("Contexto:")
-            for ctx in result['context']:
-                prefix = "↑ " if ctx['type'] == 'previous' else "↓ "
-
-                # Formatear remitente para mensajes de contexto
-                if ctx.get('from_me'):
-                    ctx_sender = "Yo"
-                else:
-                    ctx_sender = ctx.get('sender', 'Desconocido')
-                    if ctx_sender is None:
-                        ctx_sender = "Desconocido"
-
-                print(f"  {prefix}[{ctx['date']}] {ctx_sender}: {ctx['message']}")
-            print()
+            if i % page_size == 0:
+                _flush_page(buf)
 
-        print(separator + "\n")
+    # Escribir los resultados restantes
+    _flush_page(buf)
 
 def save_results_to_file(results, filename, contacts=None):
     """
@@ -1009,14 +1185,19 @@ def save_results_to_file(results, filename, contacts=None):
     """
     # ... (código existente) ...
 
+# Módulos requeridos por las funciones de machine learning
+_ML_MODULES = ("sklearn", "nltk", "spacy", "textblob", "sentence_transformers", "transformers", "torch")
+
+@lru_cache(maxsize=1)
 def check_ml_dependencies():
     """
     Verifica si las dependencias para machine learning están instaladas.
+    Solo localiza los módulos (sin importarlos) y el resultado se calcula una sola vez por proceso.
 
     Retorna:
     - installed: True si están instaladas, False en caso contrario
     """
-    # ... (código existente) ...
+    return all(importlib.util.find_spec(module) is not None for module in _ML_MODULES)
 
 def install_ml_dependencies():
     """
@@ -1025,4 +1206,20 @@ def install_ml_dependencies():
     Retorna:
     - success: True si se instalaron correctamente, False en caso contrario
     """
-    # ... (código existente) ...
+    # Evitar lanzar pip si las dependencias ya se pueden importar
+    if check_ml_dependencies():
+        print("Las dependencias de ML ya están instaladas.")
+        return True
+
+    try:
+        from install_ml_dependencies import install_dependencies
+        install_dependencies()
+    except Exception as e:
+        print(f"Error al instalar dependencias de ML: {e}")
+        return False
+
+    # Invalidar el resultado memoizado (y las cachés del sistema de importación)
+    # para que la próxima verificación vea los paquetes nuevos
+    importlib.invalidate_caches()
+    check_ml_dependencies.cache_clear()
+    return True
@@ -16,17 +16,73 @@ Features:
 """
 
 import argparse
+import gc
+import hashlib
+import heapq
+import importlib.util
+import itertools
+import json
+import multiprocessing
 import os
+import pickle
+import sqlite3
 import sys
 import platform
 import subprocess
+import time
+import numpy as np
 from tqdm import tqdm
-import traceback
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
 
-# Setup Intel optimizations automatically
+def _file_stamp(path):
+    """Cheap identity of a file for cache validation: 'mtime_ns:size', or '' if it is absent"""
+    if not path:
+        return ""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ""
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+# Environment added by oneAPI's setvars.bat, cached per install so warm runs skip the 1-3 s batch file
+ONEAPI_ENV_CACHE = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~"),
+                                "whatsapp_tool", "oneapi_env.json")
+
+
+def _load_oneapi_env(setvars_path):
+    """Return the cached setvars.bat environment, or None if missing or setvars.bat has changed"""
+    try:
+        with open(ONEAPI_ENV_CACHE, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if (cached.get("setvars_path") == setvars_path
+                and cached.get("setvars_mtime") == os.path.getmtime(setvars_path)):
+            return cached["env"]
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    return None
+
+
+def _save_oneapi_env(setvars_path, env):
+    """Cache the environment setvars.bat produced, keyed by its path and modification time"""
+    try:
+        os.makedirs(os.path.dirname(ONEAPI_ENV_CACHE), exist_ok=True)
+        with open(ONEAPI_ENV_CACHE, "w", encoding="utf-8") as f:
+            json.dump({"setvars_path": setvars_path,
+                       "setvars_mtime": os.path.getmtime(setvars_path),
+                       "env": env}, f)
+    except OSError as e:
+        print(f"Warning: Could not cache the oneAPI environment: {e}")
+
+
+# Setup Intel optimizations on first ML use (keyword search and corrections never need them)
+@lru_cache(maxsize=1)
 def setup_intel_optimizations():
-    """Set up Intel optimizations automatically at startup"""
+    """Set up Intel optimizations automatically (once per process, before the ML backends load)"""
     print("Checking for Intel hardware and setting up optimizations...")
 
     # Check if we're running on Intel hardware
@@ -55,31 +111,21 @@ def setup_intel_optimizations():
             if os.path.exists(setvars_path):
                 print("Setting up oneAPI environment...")
 
-                # Create a temporary batch file to capture environment variables
-                temp_batch = "temp_oneapi_env.bat"
-                with open(temp_batch, "w") as f:
-                    f.write(f'@echo off\n')
-                    f.write(f'call "{setvars_path}" > nul\n')
-                    f.write(f'set > oneapi_env.txt\n')
-
-                # Run the batch file to capture environment variables
-                subprocess.run([temp_batch], shell=True)
-
-                # Read the environment variables and set them in the current process
-                if os.path.exists("oneapi_env.txt"):
-                    with open("oneapi_env.txt", "r") as f:
-                        for line in f:
-                            if "=" in line:
-                                name, value = line.strip().split("=", 1)
-                                os.environ[name] = value
-
-                    # Clean up
-                    os.remove("oneapi_env.txt")
-
-                # Clean up
-                if os.path.exists(temp_batch):
-                    os.remove(temp_batch)
-
+                oneapi_env = _load_oneapi_env(setvars_path)
+                if oneapi_env is None:
+                    # Run setvars.bat and dump the resulting environment in one shell, without temp files
+                    result = subprocess.run(f'cmd /c ""{setvars_path}" >nul && set"', shell=True,
+                                            capture_output=True, text=True)
+
+                    # Keep only the variables that setvars added or changed (values may contain '=')
+                    oneapi_env = {}
+                    for line in result.stdout.splitlines():
+                        name, _, value = line.partition("=")
+                        if name and value and os.environ.get(name) != value:
+                            oneapi_env[name] = value
+                    _save_oneapi_env(setvars_path, oneapi_env)
+
+                os.environ.update(oneapi_env)
                 print("Intel oneAPI environment set up successfully.")
 
         # Enable scikit-learn-intelex if available
@@ -99,15 +145,15 @@ def setup_intel_optimizations():
 
     print("Intel optimization setup complete.")
 
-# Run Intel optimization setup at import time
-setup_intel_optimizations()
-
 # Import core functionality
 from whatsapp_core import (
     load_json_data,
     load_contacts,
     format_phone_number,
-    install_ml_dependencies
+    install_ml_dependencies,
+    check_ml_dependencies,
+    create_corrections_file,
+    apply_manual_corrections
 )
 
 # Import Google Contacts functionality
@@ -121,22 +167,291 @@ try:
 except ImportError:
     GOOGLE_CONTACTS_AVAILABLE = False
 
+# BLAKE3 is optional: when installed it hashes the analysis cache fingerprints and search cache keys
+try:
+    import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+
+# zstandard is optional: when installed the cached search results are stored compressed
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
 # Import search functionality
 from chat_search import (
     calculate_relevance_score,
+    compile_keywords,
     extract_messages,
+    iter_messages,
     get_message_context,
+    keyword_candidate_indices,
+    index_candidate_indices,
+    build_keyword_index,
+    extend_keyword_index,
+    finalize_keyword_index,
     print_results,
-    save_results_to_file
+    save_results_to_file,
+    search_command_handler,
+    Filters
 )
+from chat_search.search_core import in_worker_process, mark_worker_process
+from chat_search.search_utils import RESULT_FILE_EXTENSIONS
+from chat_search.sort_utils import get_available_sort_criteria
 
-# Import ML functionality
-from chat_search.search_ml import check_ml_dependencies
-
-# Check if ML dependencies are installed
+# Check if ML dependencies are installed (only located, not imported: chat_search.search_ml and
+# its backends such as spaCy are imported on the first ML analysis, never by keyword search)
 ML_AVAILABLE = check_ml_dependencies()
 
 
+# Sender values that get_available_chats counts as an unknown sender
+_UNKNOWN_SENDERS = frozenset({'', 'Desconocido', 'None', None})
+
+
+# Keyword search results cache: one row per search, the data fingerprint kept apart from the payload
+SEARCH_CACHE_DB = os.path.join("search_cache", "searches.db")
+
+# Cached payloads are zstd frames (level 3) when zstandard is installed, plain pickles otherwise
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_ZSTD_LEVEL = 3
+
+
+# The open search cache connection of this process: {pid: (path, connection)}
+_SEARCH_CACHE_CONNECTION = {}
+
+
+def _search_cache_connection():
+    """Return the search results cache connection, kept open for the rest of the session"""
+    path = os.path.abspath(SEARCH_CACHE_DB)
+    pid = os.getpid()
+    cached = _SEARCH_CACHE_CONNECTION.get(pid)
+    if cached is not None and cached[0] == path:
+        return cached[1]
+
+    # Keyed by process: a forked worker opens its own connection and forgets the one inherited
+    # from the parent without closing it (it still belongs to the parent); a connection of this
+    # process to a previous path is closed
+    if cached is not None:
+        cached[1].close()
+    _SEARCH_CACHE_CONNECTION.clear()
+    connection = _open_search_cache(path)
+    _SEARCH_CACHE_CONNECTION[pid] = (path, connection)
+    return connection
+
+
+def _open_search_cache(path):
+    """Open the search results cache at path in WAL mode, creating its table on first use"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS searches ("
+        "key TEXT PRIMARY KEY, fingerprint TEXT, results BLOB, ts REAL)"
+    )
+    return connection
+
+
+def _dump_search_results(results):
+    """Serialize search results for the cache (pickle, compressed with zstd when available)"""
+    blob = pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL)
+    if ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(blob)
+    return blob
+
+
+def _load_search_results(blob):
+    """Deserialize a search cache payload (compressed or from before compression was used)"""
+    if blob[:4] == _ZSTD_MAGIC:
+        blob = zstandard.ZstdDecompressor().decompress(blob)
+    return pickle.loads(blob)
+
+
+def _store_cached_search(cache_key, fingerprint, results):
+    """Save the results of a search together with the data fingerprint they were computed from"""
+    try:
+        with _search_cache_connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO searches (key, fingerprint, results, ts) VALUES (?, ?, ?, ?)",
+                (cache_key, fingerprint, _dump_search_results(results), datetime.now().timestamp())
+            )
+        print(f"Search results cached to {SEARCH_CACHE_DB}")
+    except Exception as e:
+        print(f"Warning: Could not cache results: {e}")
+
+
+# Messages per hash update when fingerprinting the messages of a cached analysis
+_FINGERPRINT_CHUNK = 4096
+
+# Cached analysis results expire after ANALYSIS_CACHE_TTL seconds without a hit; only the most
+# recently used ANALYSIS_CACHE_MAX_FILES are kept (like the semantic search cache)
+ANALYSIS_CACHE_TTL = 7 * 24 * 3600
+ANALYSIS_CACHE_MAX_FILES = 100
+
+
+def _prune_analysis_cache(cache_dir):
+    """Delete expired analysis cache files, then the least recently used beyond the cap"""
+    try:
+        entries = []
+        for entry in os.scandir(cache_dir):
+            if entry.name.startswith("analysis_") and entry.name.endswith(".pkl"):
+                entries.append((entry.stat().st_mtime, entry.path))
+    except OSError:
+        return
+
+    entries.sort(reverse=True)
+    expired_before = time.time() - ANALYSIS_CACHE_TTL
+    for rank, (mtime, path) in enumerate(entries):
+        if rank >= ANALYSIS_CACHE_MAX_FILES or mtime < expired_before:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Already removed (e.g. by a concurrent analysis stage)
+
+
+def _topics_backend():
+    """LDA backend extract_topics runs with: 'gensim' (LdaMulticore) or 'sklearn'"""
+    # search_ml picks the backend when it is imported; until then, probe gensim the same way
+    search_ml = sys.modules.get('chat_search.search_ml')
+    if search_ml is not None:
+        gensim_available = search_ml.GENSIM_AVAILABLE
+    else:
+        gensim_available = importlib.util.find_spec("gensim") is not None
+    return 'gensim' if gensim_available else 'sklearn'
+
+
+# Tool, messages, shared bag of words and per-stage core budget for complete_analysis worker
+# processes (inherited through fork, so the corpus is never pickled to the workers)
+_ANALYSIS_STATE = None
+
+# Stages that accept the bag of words complete_analysis computes once
+_ANALYSIS_BOW_STAGES = frozenset({'extract_topics', 'cluster_messages'})
+
+# Field of each stage's per-message results that complete_analysis tallies
+_ANALYSIS_STAGE_FIELDS = {'analyze_sentiment': 'sentiment', 'cluster_messages': 'cluster'}
+
+
+def _run_analysis_stage(method, kwargs):
+    """Run one complete_analysis stage on the inherited tool and messages inside a worker process"""
+    tool, messages, bow, cores = _ANALYSIS_STATE
+    # The stages run side by side: keep each one's own parallelism within its share of the cores
+    from chat_search import search_ml
+    search_ml.set_core_budget(cores)
+    if method in _ANALYSIS_BOW_STAGES:
+        kwargs = {**kwargs, 'bow': bow}
+    result = getattr(tool, method)(messages=messages, **kwargs)
+    # Entity results are not used by complete_analysis; avoid sending them back
+    if method == 'extract_entities':
+        return None
+    # Send back only the tally of the field that is used instead of pickling every message again
+    field = _ANALYSIS_STAGE_FIELDS.get(method)
+    if field:
+        return Counter(msg[field] for msg in result)
+    return result
+
+
+# Tool and search arguments shared with analyze_sales_prospects worker processes (inherited
+# through fork, like _ANALYSIS_STATE)
+_CATEGORY_SEARCH_STATE = None
+
+
+def _run_category_search(keywords):
+    """Run one analyze_sales_prospects category search on the inherited tool in a worker process"""
+    tool, search_kwargs = _CATEGORY_SEARCH_STATE
+    # The categories already use every core: the search inside runs serially (no nested pools),
+    # and leaves the shared SQLite search cache to the parent process
+    mark_worker_process()
+    results = tool.search(keywords=keywords, **dict(search_kwargs, use_cache=False))
+    # Only the contact relevance is aggregated; avoid sending the messages and their context back
+    if isinstance(results, dict):
+        return {'contact_relevance': results.get('contact_relevance')}
+    return results
+
+
+def _search_categories(tool, categories, search_kwargs):
+    """
+    Yield (category name, search results) for each category, in order.
+    With several categories (and fork available) the searches run in parallel worker processes.
+    """
+    global _CATEGORY_SEARCH_STATE
+    workers = min(len(categories), os.cpu_count() or 1)
+    if workers < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        for category_name, keywords in categories.items():
+            print(f"\nAnalizando prospectos para categoría: {category_name}...")
+            yield category_name, tool.search(keywords=keywords, **search_kwargs)
+        return
+
+    # Preprocess once here so that every worker inherits the result instead of redoing it
+    if search_kwargs.get('preprocess_data', True):
+        tool._get_preprocessed_data()
+
+    print(f"\nAnalizando {len(categories)} categorías en {workers} procesos...")
+    _CATEGORY_SEARCH_STATE = (tool, search_kwargs)
+    # Move the existing objects out of the garbage collector's reach: collections in the workers
+    # would otherwise write to every inherited object and copy the shared corpus pages
+    gc.freeze()
+    try:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context('fork')) as executor:
+            results = list(executor.map(_run_category_search, categories.values()))
+    finally:
+        gc.unfreeze()
+        _CATEGORY_SEARCH_STATE = None
+    yield from zip(categories, results)
+
+
+# Extracted messages prefiltered at a time while search streams them (only candidates are kept)
+_EXTRACT_CHUNK = 4096
+
+
+def _iter_chunks(iterable, size):
+    """Yield successive lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Candidate messages from which keyword scoring is spread over forked worker processes
+_PARALLEL_SCORE_MIN = 20000
+
+# Texts, keywords and threshold shared with scoring worker processes (inherited through fork)
+_SCORE_STATE = None
+
+
+def _score_candidates(indices, texts, texts_lower, keywords, min_score, plan):
+    """
+    Score a batch of candidate messages and keep the ones that pass the threshold.
+    Returns (index, score, matched_keywords, keyword_counts, word_stats) tuples in input order.
+    """
+    scored = []
+    for idx in indices:
+        score, matched_keywords, keyword_counts, word_stats = calculate_relevance_score(
+            texts[idx], keywords, message_lower=texts_lower[idx], plan=plan)
+        if score >= min_score and matched_keywords:
+            scored.append((idx, score, matched_keywords, keyword_counts, word_stats))
+    return scored
+
+
+def _score_candidates_worker(indices):
+    """Score one batch inside a worker process using the inherited _SCORE_STATE"""
+    return _score_candidates(indices, *_SCORE_STATE)
+
+
+def _accumulate_relevance(entry, score, word_stats, keyword_counts):
+    """Add one matching message to a contact/chat relevance aggregate in place"""
+    entry['score'] += score
+    entry['message_count'] += 1
+    entry['total_words'] += word_stats['total_words']
+    entry['total_keywords'] += word_stats['total_keywords']
+
+    entry['keyword_counts'].update(keyword_counts)
+
+
 class WhatsAppUnifiedTool:
     """Unified WhatsApp Chat Analysis Tool"""
 
@@ -152,6 +467,42 @@ class WhatsAppUnifiedTool:
         self.embeddings_model = None
         self.embeddings_cache_file = None
 
+        # Huella del archivo de datos (mtime:tamaño:chats) usada para validar la caché de búsquedas
+        self._data_fingerprint = None
+
+        # Huella de los archivos de contactos, y el diccionario de contactos al que corresponde
+        self._contacts_fingerprint = ""
+        self._contacts_fingerprint_of = id(self.contacts)
+
+        # Datos preprocesados para búsqueda; se rehacen si cambian los datos, los contactos
+        # o el archivo de correcciones manuales
+        self._preprocessed = None
+        self._preprocessed_key = None
+
+        # LRU de embeddings por contenido del mensaje (texto -> vector float32)
+        self.embeddings_lru = OrderedDict()
+        self.embeddings_lru_max = 10000
+
+        # LRU de embeddings de consultas semánticas ((modelo, consulta) -> vector float32)
+        self.query_embeddings_lru = OrderedDict()
+        self.query_embeddings_lru_max = 256
+
+        # Funciones de chat_search.search_ml, importadas al primer uso
+        self._ml_funcs = None
+
+        # Caché de get_available_chats y tabla teléfono -> nombre de contacto
+        self._chats_cache = None
+        self._chats_cache_key = None
+        self._contact_display = {}
+
+        # Índice FTS5 de palabras clave: se construye al repetir una búsqueda sobre el mismo conjunto de mensajes
+        self._keyword_index = None
+        self._keyword_index_key = None
+        self._keyword_index_seen = None
+
+        # Versión de los datos sobre los que se busca; cambia al recargarlos, modificarlos o preprocesarlos
+        self._search_data_version = 0
+
         # Directorio para caché de embeddings
         self.cache_dir = "embeddings_cache"
         if not os.path.exists(self.cache_dir):
@@ -171,8 +522,31 @@ class WhatsAppUnifiedTool:
         """Load WhatsApp chat data from a JSON file"""
         self.data_file = file_path
         self.data = load_json_data(file_path)
+        self._chats_cache = None
+        self._keyword_index = None
+        self._preprocessed = None
+        self._search_data_version += 1
+
+        try:
+            stat = os.stat(file_path)
+            self._data_fingerprint = f"{stat.st_mtime_ns}:{stat.st_size}:{len(self.data or ())}"
+        except OSError:
+            self._data_fingerprint = None
+
         return self.data is not None
 
+    def mark_data_modified(self):
+        """Disable the on-disk search cache after self.data is changed in memory"""
+        self._data_fingerprint = None
+        self._chats_cache = None
+        self._keyword_index = None
+        self._preprocessed = None
+        self._search_data_version += 1
+
+    def clear_query_cache(self):
+        """Forget the embeddings of previous semantic search queries"""
+        self.query_embeddings_lru.clear()
+
     def load_contacts(self, file_path):
         """Load contact information from a JSON file"""
         self.contacts_file = file_path
@@ -182,6 +556,7 @@ class WhatsAppUnifiedTool:
         if self.google_contacts:
             self.contacts = merge_contacts(self.contacts, self.google_contacts)
 
+        self._index_contacts()
         return len(self.contacts) > 0
 
     def load_google_contacts(self, file_path):
@@ -196,20 +571,61 @@ class WhatsAppUnifiedTool:
         # Merge with existing contacts if any
         if self.contacts:
             self.contacts = merge_contacts(self.contacts, self.google_contacts)
+            self._index_contacts()
 
         return len(self.google_contacts) > 0
 
+    def _index_contacts(self):
+        """Build the phone -> display name lookup and drop cached chat listings"""
+        self._contact_display = {
+            phone: info['display_name']
+            for phone, info in self.contacts.items()
+            if isinstance(info, dict) and info.get('display_name')
+        }
+        self._chats_cache = None
+        self._preprocessed = None
 
+        google_file = self.google_contacts_file if self.google_contacts else None
+        self._contacts_fingerprint = (f"{_file_stamp(self.contacts_file)}:{_file_stamp(google_file)}:"
+                                      f"{len(self.contacts)}")
+        self._contacts_fingerprint_of = id(self.contacts)
+
+    def _get_preprocessed_data(self):
+        """
+        Return self.data preprocessed for search, reusing the previous result while the data,
+        the contacts and the manual corrections file are unchanged.
+        """
+        if self._preprocessed is None or self._preprocessed_key != self._preprocess_key():
+            print("Preprocesando datos para mejorar la búsqueda...")
+            from whatsapp_core import preprocess_data_for_search
+            self._preprocessed = preprocess_data_for_search(self.data, self.contacts)
+            self._search_data_version += 1
+            # Taken afterwards: preprocessing creates the corrections file when it is missing
+            self._preprocessed_key = self._preprocess_key()
+            print("Preprocesamiento completado.")
+        return self._preprocessed
+
+    def _preprocess_key(self):
+        """Identify the inputs of preprocess_data_for_search (data, contacts, corrections file)"""
+        try:
+            corrections_mtime = os.stat("contact_corrections.json").st_mtime_ns
+        except OSError:
+            corrections_mtime = None
+        return (id(self.data), id(self.contacts), corrections_mtime)
 
     def get_available_chats(self):
-        """Get a list of available chats"""
+        """Get a list of available chats (cached until data or contacts change)"""
         if not self.data:
             return []
 
+        cache_key = (id(self.data), id(self.contacts))
+        if self._chats_cache is not None and self._chats_cache_key == cache_key:
+            return list(self._chats_cache)
+
         chats = []
         for chat_id, chat_data in self.data.items():
             # Extraer número de teléfono del chat_id (eliminar @s.whatsapp.net)
-            phone_raw = chat_id.split('@')[0] if '@' in chat_id else chat_id
+            phone_raw = chat_id.partition('@')[0]
 
             # Intentar usar el resolvedor avanzado si está disponible
             try:
@@ -230,15 +646,8 @@ class WhatsAppUnifiedTool:
                 # Aplicar formato al número de teléfono para asegurar que incluya código de país
                 formatted_phone = format_phone_number(chat_id)
 
-                # Obtener nombre del chat con mejor formato
-                chat_name = None
-                contact_info = None
-
-                # Primero intentar buscar directamente en los contactos
-                if self.contacts and phone_raw in self.contacts:
-                    contact_info = self.contacts[phone_raw]
-                    if contact_info.get('display_name'):
-                        chat_name = contact_info.get('display_name')
+                # Obtener nombre del chat: primero buscar directamente en los contactos
+                chat_name = self._contact_display.get(phone_raw)
 
                 # Si no se encontró nombre en los contactos, usar el nombre guardado en los datos
                 if not chat_name:
@@ -259,14 +668,12 @@ class WhatsAppUnifiedTool:
                     display_name = formatted_phone
 
             # Contar mensajes
-            message_count = len(chat_data.get('messages', {}))
+            messages = chat_data.get('messages', {})
+            message_count = len(messages)
 
             # Verificar si hay mensajes con remitentes desconocidos
-            unknown_senders = 0
-            for msg_id, msg in chat_data.get('messages', {}).items():
-                sender = msg.get('sender', '')
-                if sender == 'Desconocido' or sender == 'None' or not sender:
-                    unknown_senders += 1
+            unknown_senders = sum(1 for msg in messages.values()
+                                  if msg.get('sender') in _UNKNOWN_SENDERS)
 
             chats.append({
                 'id': chat_id,
@@ -279,12 +686,15 @@ class WhatsAppUnifiedTool:
 
         # Ordenar por nombre
         chats.sort(key=lambda x: x['name'])
-        return chats
+
+        self._chats_cache = chats
+        self._chats_cache_key = cache_key
+        return list(chats)
 
     def search(self, keywords=None, min_score=10, max_results=20, start_date=None,
               end_date=None, chat_filter=None, sender_filter=None, phone_filter=None,
               calculate_contact_relevance=False, preprocess_data=True, use_cache=True,
-              sort_criteria=None):
+              sort_criteria=None, top_k=None):
         """
         Search through messages using keywords and filters.
         Optimized for performance with large datasets.
@@ -304,15 +714,11 @@ class WhatsAppUnifiedTool:
         - sort_criteria: List of criteria to sort results by (up to 3)
                         Options: 'relevance' (default), 'date_asc', 'date_desc', 'sender',
                         'chat', 'length_asc', 'length_desc', 'keyword_density', 'keyword_count'
+        - top_k: Keep only the top_k contacts and chats by relevance (None keeps them all)
 
         Returns:
         - List of matching messages or dictionary with results and relevance information
         """
-        import hashlib
-        import os
-        import pickle
-        import time
-
         if not self.data:
             print("No data loaded. Please load data first.")
             return []
@@ -328,42 +734,71 @@ class WhatsAppUnifiedTool:
         print(f"Searching for keywords: {', '.join(keywords)}")
 
         # Create a cache key based on search parameters
-        cache_key = hashlib.md5(
+        key_source = (
             f"{str(keywords)}_{min_score}_{max_results}_{start_date}_{end_date}_"
-            f"{chat_filter}_{sender_filter}_{phone_filter}_{calculate_contact_relevance}".encode()
-        ).hexdigest()
-
-        cache_file = os.path.join("search_cache", f"search_{cache_key}.pkl")
-
-        # Check if we can use cached results
-        if use_cache and os.path.exists(cache_file):
+            f"{chat_filter}_{sender_filter}_{phone_filter}_{calculate_contact_relevance}_{top_k}".encode()
+        )
+        cache_key = (blake3.blake3(key_source).hexdigest(length=16) if BLAKE3_AVAILABLE
+                     else hashlib.blake2b(key_source, digest_size=16).hexdigest())
+
+        # The cache is validated against the data and contacts files (and, when preprocessing, the
+        # manual corrections file); data or contacts edited in memory are never cached
+        data_fingerprint = None
+        if self._data_fingerprint is not None and id(self.contacts) == self._contacts_fingerprint_of:
+            corrections = _file_stamp("contact_corrections.json") if preprocess_data else "-"
+            data_fingerprint = f"{self._data_fingerprint}|{self._contacts_fingerprint}|{corrections}"
+        if data_fingerprint is None:
+            use_cache = False
+
+        # Check if we can use cached results (the payload is only read when the fingerprint matches)
+        if use_cache:
             try:
-                print("Loading results from cache...")
-                with open(cache_file, 'rb') as f:
-                    cached_data = pickle.load(f)
-                    # Verify cache is still valid (data hasn't changed)
-                    if cached_data.get('data_hash') == hashlib.md5(str(self.data).encode()).hexdigest():
+                connection = _search_cache_connection()
+                row = connection.execute(
+                    "SELECT fingerprint FROM searches WHERE key = ?", (cache_key,)
+                ).fetchone()
+                if row is not None:
+                    print("Loading results from cache...")
+                    if row[0] == data_fingerprint:
+                        blob = connection.execute(
+                            "SELECT results FROM searches WHERE key = ?", (cache_key,)
+                        ).fetchone()[0]
                         print("Cache hit! Using cached results.")
-                        return cached_data.get('results')
-                    else:
-                        print("Cache invalid (data changed). Performing new search...")
+                        return _load_search_results(blob)
+                    print("Cache invalid (data changed). Performing new search...")
             except Exception as e:
                 print(f"Error loading cache: {e}. Performing new search...")
 
-        # Ensure cache directory exists
-        os.makedirs("search_cache", exist_ok=True)
-
         # Preprocesar datos para mejorar la búsqueda si se solicita
         search_data = self.data
         if preprocess_data:
-            print("Preprocesando datos para mejorar la búsqueda...")
-            from whatsapp_core import preprocess_data_for_search
-            search_data = preprocess_data_for_search(self.data, self.contacts)
-            print("Preprocesamiento completado.")
-
-        # Extract messages based on filters
+            search_data = self._get_preprocessed_data()
+
+        # Identificador del conjunto de mensajes (datos, contactos y filtros) para el índice FTS5.
+        # El índice se construye la segunda vez que se busca sobre el mismo conjunto, así que
+        # las búsquedas únicas siguen usando el recorrido por lotes
+        index_key = (self._search_data_version, id(self.contacts), preprocess_data, chat_filter,
+                     start_date, end_date, sender_filter, phone_filter)
+        index = self._keyword_index if self._keyword_index_key == index_key else None
+        indexed = index_candidate_indices(index, keywords) if index is not None else None
+        build_index = index is None and self._keyword_index_seen == index_key
+        self._keyword_index_seen = index_key
+        new_index = None
+        if build_index:
+            print("Building keyword index for repeated searches...")
+            new_index = build_keyword_index()
+
+        # Extract messages based on filters, streaming them in chunks: only the messages that pass
+        # the keyword prefilter are kept, and each chunk goes into the FTS5 index as it streams,
+        # so the full message list is never held in memory.
+        # Columna de textos: la fase de puntuación solo recorre esta lista y
+        # accede al diccionario completo del mensaje únicamente si supera el umbral
         start_time = time.time()
-        all_messages = extract_messages(
+        messages = []
+        texts = []
+        texts_lower = []
+        total_messages = 0
+        extracted = iter_messages(
             search_data,
             contacts=self.contacts,
             chat_filter=chat_filter,
@@ -372,143 +807,169 @@ class WhatsAppUnifiedTool:
             sender_filter=sender_filter,
             phone_filter=phone_filter
         )
+        for chunk in _iter_chunks(extracted, _EXTRACT_CHUNK):
+            # Convertir cada mensaje a minúsculas una sola vez (prefiltro, índice y puntuación)
+            chunk_lower = [(msg['message'] or '').lower() for msg in chunk]
+            if new_index is not None:
+                new_index = extend_keyword_index(new_index, chunk_lower, total_messages)
+
+            # Descartar los mensajes que no contienen ninguna palabra clave (índice FTS5 o recorrido)
+            if indexed is not None:
+                low, high = indexed.searchsorted([total_messages, total_messages + len(chunk)])
+                selected = indexed[low:high] - total_messages
+            else:
+                selected = keyword_candidate_indices(chunk_lower, keywords)
+            for i in selected.tolist():
+                messages.append(chunk[i])
+                texts.append(chunk[i]['message'])
+                texts_lower.append(chunk_lower[i])
+            total_messages += len(chunk)
+
         extract_time = time.time() - start_time
         print(f"Message extraction completed in {extract_time:.2f} seconds.")
 
-        if not all_messages:
+        if build_index:
+            self._keyword_index = finalize_keyword_index(new_index) if new_index is not None else None
+            self._keyword_index_key = index_key
+
+        if not total_messages:
             print("No messages found with the specified filters.")
             return []
 
-        print(f"Processing {len(all_messages)} messages...")
-        results = []
+        print(f"Processing {total_messages} messages...")
+        print(f"{len(messages)} candidate messages after keyword prefilter.")
+        candidates = range(len(messages))
+
+        # Min-heap acotado con los mejores resultados por puntuación:
+        # (score, -orden, índice, matched_keywords, keyword_counts, word_stats).
+        # El diccionario de cada resultado solo se construye para las entradas que quedan al final.
+        # Se guardan el doble de max_results para que sort_criteria tenga margen al reordenar.
+        heap = []
+        heap_size = max_results * 2
+        seq = 0
 
         # Para calcular la relevancia de contactos
         contact_relevance = {}
         chat_relevance = {}
 
-        # Process messages in batches for better performance
+        # Batches are the unit of work for the scoring processes and of progress updates;
+        # they are sliced lazily, as they are consumed
         batch_size = 100  # Process 100 messages at a time
-        total_batches = (len(all_messages) + batch_size - 1) // batch_size
+        total_batches = (len(candidates) + batch_size - 1) // batch_size
+        batches = (candidates[i:i + batch_size] for i in range(0, len(candidates), batch_size))
 
         start_time = time.time()
 
-        # Process each message in batches
-        for batch_idx in tqdm(range(total_batches), desc="Processing batches"):
-            batch_start = batch_idx * batch_size
-            batch_end = min(batch_start + batch_size, len(all_messages))
-            batch = all_messages[batch_start:batch_end]
-
-            batch_results = []
-
-            # Process each message in the current batch
-            for msg in batch:
-                # Calculate relevance score with the updated function
-                score, matched_keywords, keyword_counts, word_stats = calculate_relevance_score(msg['message'], keywords)
-
-                # Skip if score is below threshold
-                if score < min_score or not matched_keywords:
-                    continue
+        # Local bindings for the per-message loop
+        heappush = heapq.heappush
+        heappushpop = heapq.heappushpop
+        contacts = self.contacts
+
+        # Scoring is independent per message: with many candidates, score the batches in
+        # forked processes (they inherit the texts through _SCORE_STATE) and merge the
+        # matches here in batch order, so the heap and relevance dicts keep a single writer
+        global _SCORE_STATE
+        plan = compile_keywords(keywords)  # Keyword regexes and fragments, built once per search
+        workers = os.cpu_count() or 1
+        executor = None
+        if (workers > 1 and not in_worker_process() and len(candidates) >= _PARALLEL_SCORE_MIN
+                and 'fork' in multiprocessing.get_all_start_methods()):
+            _SCORE_STATE = (texts, texts_lower, keywords, min_score, plan)
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           mp_context=multiprocessing.get_context('fork'))
+            scored_batches = executor.map(_score_candidates_worker, batches,
+                                          chunksize=max(1, total_batches // (workers * 4)))
+        else:
+            scored_batches = (_score_candidates(batch, texts, texts_lower, keywords, min_score, plan)
+                              for batch in batches)
 
-                # Add to batch results without context (will add context later for top results only)
-                batch_results.append({
-                    **msg,
-                    'score': score,
-                    'matched_keywords': matched_keywords,
-                    'word_stats': word_stats,
-                    'keyword_counts': keyword_counts,  # Store for later use
-                    'context': None  # Will be populated later for top results
-                })
-
-                # Actualizar relevancia de contactos si se solicita
-                if calculate_contact_relevance:
-                    # Obtener información del remitente
-                    sender_id = msg.get('sender_id', '')
-                    chat_id = msg.get('chat_id', '')
-
-                    # Actualizar relevancia del contacto
-                    if sender_id:
-                        # Extraer número de teléfono del sender_id (eliminar @s.whatsapp.net)
-                        phone_raw = sender_id.split('@')[0] if '@' in sender_id else sender_id
-
-                        if sender_id not in contact_relevance:
-                            contact_relevance[sender_id] = {
-                                'score': 0,
-                                'message_count': 0,
-                                'keyword_counts': {},
-                                'total_words': 0,
-                                'total_keywords': 0,
-                                'display_name': msg.get('sender', sender_id),
-                                'phone': phone_raw
-                            }
-
-                        # Actualizar puntuación y conteo
-                        contact_relevance[sender_id]['score'] += score
-                        contact_relevance[sender_id]['message_count'] += 1
-
-                        # Actualizar estadísticas de palabras
-                        contact_relevance[sender_id]['total_words'] += word_stats['total_words']
-                        contact_relevance[sender_id]['total_keywords'] += word_stats['total_keywords']
-
-                        # Actualizar conteo de palabras clave
-                        for keyword, count in keyword_counts.items():
-                            if keyword not in contact_relevance[sender_id]['keyword_counts']:
-                                contact_relevance[sender_id]['keyword_counts'][keyword] = 0
-                            contact_relevance[sender_id]['keyword_counts'][keyword] += count
-
-                    # Actualizar relevancia del chat
-                    if chat_id:
-                        if chat_id not in chat_relevance:
-                            # Obtener nombre del chat
-                            chat_name = chat_id
-                            if self.contacts:
-                                # Extraer número de teléfono del chat_id
-                                chat_phone = chat_id.split('@')[0] if '@' in chat_id else chat_id
-                                if chat_phone in self.contacts:
-                                    contact = self.contacts[chat_phone]
-                                    if contact.get('display_name'):
-                                        chat_name = contact.get('display_name')
-
-                            chat_relevance[chat_id] = {
-                                'score': 0,
-                                'message_count': 0,
-                                'keyword_counts': {},
-                                'total_words': 0,
-                                'total_keywords': 0,
-                                'display_name': chat_name,
-                                'phone': chat_phone if '@' in chat_id else chat_id
-                            }
-
-                        # Actualizar puntuación y conteo
-                        chat_relevance[chat_id]['score'] += score
-                        chat_relevance[chat_id]['message_count'] += 1
-
-                        # Actualizar estadísticas de palabras
-                        chat_relevance[chat_id]['total_words'] += word_stats['total_words']
-                        chat_relevance[chat_id]['total_keywords'] += word_stats['total_keywords']
-
-                        # Actualizar conteo de palabras clave
-                        for keyword, count in keyword_counts.items():
-                            if keyword not in chat_relevance[chat_id]['keyword_counts']:
-                                chat_relevance[chat_id]['keyword_counts'][keyword] = 0
-                            chat_relevance[chat_id]['keyword_counts'][keyword] += count
-
-            # Add batch results to overall results
-            results.extend(batch_results)
-
-            # Sort and trim results after each batch
-            if results:
-                # Use default sorting by relevance for intermediate results
-                results.sort(key=lambda x: x['score'], reverse=True)
-                results = results[:max_results * 2]  # Keep twice as many as needed for now
+        try:
+            # Refresh the progress bar at most ~200 times and twice a second
+            for scored in tqdm(scored_batches, total=total_batches, desc="Processing batches",
+                               miniters=max(1, total_batches // 200), mininterval=0.5):
+                # Only messages above the threshold with at least one keyword come back
+                for idx, score, matched_keywords, keyword_counts, word_stats in scored:
+                    msg = messages[idx]
+
+                    # Once the heap is full, a score not above its minimum would be popped right
+                    # away (ties lose to earlier messages), so it is not pushed; with max_results <= 0
+                    # nothing is kept (the relevance below is still accumulated)
+                    if heap_size > 0 and (len(heap) < heap_size or score > heap[0][0]):
+                        # -seq is unique, so tuple comparison never reaches the later fields
+                        entry = (score, -seq, idx, matched_keywords, keyword_counts, word_stats)
+                        seq += 1
+                        if len(heap) < heap_size:
+                            heappush(heap, entry)
+                        else:
+                            heappushpop(heap, entry)
+
+                    # Actualizar relevancia de contactos si se solicita
+                    if calculate_contact_relevance:
+                        # Obtener información del remitente (extract_messages siempre incluye estas claves)
+                        sender_id = msg['sender_id']
+                        chat_id = msg['chat_id']
+
+                        # Actualizar relevancia del contacto
+                        if sender_id:
+                            rec = contact_relevance.get(sender_id)
+                            if rec is None:
+                                rec = contact_relevance[sender_id] = {
+                                    'score': 0,
+                                    'message_count': 0,
+                                    'keyword_counts': Counter(),
+                                    'total_words': 0,
+                                    'total_keywords': 0,
+                                    'display_name': msg['sender'],
+                                    'phone': msg['sender_phone']
+                                }
+                            _accumulate_relevance(rec, score, word_stats, keyword_counts)
+
+                        # Actualizar relevancia del chat
+                        if chat_id:
+                            rec = chat_relevance.get(chat_id)
+                            if rec is None:
+                                # Obtener nombre del chat (el teléfono ya viene extraído en el mensaje)
+                                chat_phone = msg['chat_phone']
+                                contact = contacts.get(chat_phone) if contacts else None
+                                chat_name = (contact and contact.get('display_name')) or chat_id
+
+                                rec = chat_relevance[chat_id] = {
+                                    'score': 0,
+                                    'message_count': 0,
+                                    'keyword_counts': Counter(),
+                                    'total_words': 0,
+                                    'total_keywords': 0,
+                                    'display_name': chat_name,
+                                    'phone': chat_phone
+                                }
+                            _accumulate_relevance(rec, score, word_stats, keyword_counts)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+                _SCORE_STATE = None
+
+        # Sort by relevance (ties keep message order)
+        heap.sort(reverse=True)
+
+        # Build the result records only for the surviving entries (without context: it is
+        # added later for the top results only)
+        results = [
+            {
+                **messages[idx],
+                'score': score,
+                'matched_keywords': matched_keywords,
+                'word_stats': word_stats,
+                'keyword_counts': keyword_counts,  # Store for later use
+                'context': None  # Will be populated later for top results
+            }
+            for score, _, idx, matched_keywords, keyword_counts, word_stats in heap
+        ]
 
         # Apply custom sorting if specified
         if sort_criteria:
             # Import sort utilities
             from chat_search.sort_utils import sort_results
             results = sort_results(results, sort_criteria)
-        else:
-            # Default sort by relevance
-            results.sort(key=lambda x: x['score'], reverse=True)
 
         # Limit to max_results
         results = results[:max_results]
@@ -529,6 +990,18 @@ class WhatsAppUnifiedTool:
             # Obtener la marca de tiempo actual para calcular la recencia
             current_timestamp = datetime.now().timestamp()
 
+            # Mensaje más reciente de cada contacto y de cada chat entre los resultados (una sola pasada)
+            latest_by_contact = {}
+            latest_by_chat = {}
+            for msg in results:
+                timestamp = msg.get('timestamp', 0)
+                sender_id = msg.get('sender_id')
+                if sender_id not in latest_by_contact or timestamp > latest_by_contact[sender_id]:
+                    latest_by_contact[sender_id] = timestamp
+                chat_id = msg.get('chat_id')
+                if chat_id not in latest_by_chat or timestamp > latest_by_chat[chat_id]:
+                    latest_by_chat[chat_id] = timestamp
+
             # Normalizar puntuaciones de contactos y calcular métricas adicionales
             for contact_id, data in contact_relevance.items():
                 if data['message_count'] > 0:
@@ -545,16 +1018,9 @@ class WhatsAppUnifiedTool:
                     total_keywords = len(keywords)
                     data['keyword_diversity'] = unique_keywords / total_keywords if total_keywords > 0 else 0
 
-                    # Calcular factor de recencia basado en las marcas de tiempo de los mensajes
-                    # Buscar los mensajes más recientes de este contacto
-                    contact_messages = [msg for msg in results if msg.get('sender_id') == contact_id]
-                    if contact_messages:
-                        # Ordenar por timestamp (más reciente primero)
-                        contact_messages.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
-                        # Tomar el mensaje más reciente
-                        latest_msg = contact_messages[0]
-                        latest_timestamp = latest_msg.get('timestamp', 0)
-
+                    # Calcular factor de recencia basado en el mensaje más reciente de este contacto
+                    latest_timestamp = latest_by_contact.get(contact_id)
+                    if latest_timestamp is not None:
                         # Calcular recencia (1.0 = muy reciente, 0.0 = muy antiguo)
                         # Considerar mensajes de hasta 90 días (7776000 segundos)
                         time_diff = current_timestamp - latest_timestamp
@@ -595,14 +1061,8 @@ class WhatsAppUnifiedTool:
                     data['keyword_diversity'] = unique_keywords / total_keywords if total_keywords > 0 else 0
 
                     # Calcular factor de recencia
-                    chat_messages = [msg for msg in results if msg.get('chat_id') == chat_id]
-                    if chat_messages:
-                        # Ordenar por timestamp (más reciente primero)
-                        chat_messages.sort(key=lambda x: x.get('timestamp', 0), reverse=True)
-                        # Tomar el mensaje más reciente
-                        latest_msg = chat_messages[0]
-                        latest_timestamp = latest_msg.get('timestamp', 0)
-
+                    latest_timestamp = latest_by_chat.get(chat_id)
+                    if latest_timestamp is not None:
                         # Calcular recencia
                         time_diff = current_timestamp - latest_timestamp
                         recency_factor = max(0.0, 1.0 - (time_diff / 7776000))
@@ -633,19 +1093,17 @@ class WhatsAppUnifiedTool:
                     key=lambda x: x[1]['final_score']
                 )
 
-            # Ordenar contactos por puntuación final
-            sorted_contacts = sorted(
-                contact_relevance.items(),
-                key=lambda x: x[1]['final_score'],
-                reverse=True
-            )
+            # Ordenar contactos y chats por puntuación final; con top_k solo se
+            # seleccionan los k mejores con un heap en lugar de ordenar todos
+            def by_final_score(item):
+                return item[1]['final_score']
 
-            # Ordenar chats por puntuación final
-            sorted_chats = sorted(
-                chat_relevance.items(),
-                key=lambda x: x[1]['final_score'],
-                reverse=True
-            )
+            if top_k is None:
+                sorted_contacts = sorted(contact_relevance.items(), key=by_final_score, reverse=True)
+                sorted_chats = sorted(chat_relevance.items(), key=by_final_score, reverse=True)
+            else:
+                sorted_contacts = heapq.nlargest(top_k, contact_relevance.items(), key=by_final_score)
+                sorted_chats = heapq.nlargest(top_k, chat_relevance.items(), key=by_final_score)
 
             # Prepare results
             final_results = {
@@ -658,19 +1116,7 @@ class WhatsAppUnifiedTool:
 
             # Save results to cache if caching is enabled
             if use_cache:
-                try:
-                    # Create cache data with a hash of the current data for validation
-                    cache_data = {
-                        'results': final_results,
-                        'data_hash': hashlib.md5(str(self.data).encode()).hexdigest(),
-                        'timestamp': time.time()
-                    }
-
-                    with open(cache_file, 'wb') as f:
-                        pickle.dump(cache_data, f)
-                    print(f"Search results cached to {cache_file}")
-                except Exception as e:
-                    print(f"Warning: Could not cache results: {e}")
+                _store_cached_search(cache_key, data_fingerprint, final_results)
 
             return final_results
 
@@ -685,50 +1131,127 @@ class WhatsAppUnifiedTool:
 
         # Save simple results to cache if caching is enabled
         if use_cache:
+            _store_cached_search(cache_key, data_fingerprint, simple_results)
+
+        return simple_results
+
+    # ML Analysis Functions
+    def _ml_functions(self):
+        """Import the ML module once and return its analysis functions by name"""
+        if self._ml_funcs is None:
+            setup_intel_optimizations()
+            from chat_search import search_ml
+            self._ml_funcs = {
+                'analyze_sentiment': search_ml.analyze_sentiment,
+                'extract_topics': search_ml.extract_topics,
+                'semantic_search': search_ml.semantic_search,
+                'extract_entities': search_ml.extract_entities,
+                'cluster_messages': search_ml.cluster_messages,
+                'vectorize_messages': search_ml.vectorize_messages,
+            }
+        return self._ml_funcs
+
+    def _analysis_cache_file(self, name, params, messages):
+        """Return the cache file for an analysis of exactly these messages with these parameters"""
+        digest = blake3.blake3() if BLAKE3_AVAILABLE else hashlib.blake2b(digest_size=16)
+        digest.update(repr((name, params)).encode())
+        # One update per chunk of messages instead of one per message
+        for start in range(0, len(messages), _FINGERPRINT_CHUNK):
+            digest.update("".join([
+                f"{msg.get('chat_id')}\x1f{msg.get('msg_id')}\x1f{msg.get('timestamp')}\x1f"
+                f"{msg.get('sender')}\x1f{msg.get('message')}\x1e"
+                for msg in messages[start:start + _FINGERPRINT_CHUNK]
+            ]).encode())
+        key = digest.hexdigest(length=16) if BLAKE3_AVAILABLE else digest.hexdigest()
+        return os.path.join(self.cache_dir, f"analysis_{name}_{key}.pkl")
+
+    def _cached_analysis(self, name, params, messages, filters, use_cache, compute):
+        """
+        Run an ML analysis through a disk cache keyed by its parameters and the analyzed messages.
+        compute(messages) performs the analysis when there is no cached result.
+        """
+        if not use_cache or not ML_AVAILABLE:
+            return compute(messages)
+
+        # Hash the messages actually analyzed, so edits to the data or contacts invalidate the cache
+        if not messages:
+            messages = self._get_filtered_messages(filters)
+        if not messages:
+            return compute(messages)
+
+        cache_file = self._analysis_cache_file(name, params, messages)
+        if os.path.exists(cache_file):
             try:
-                # Create cache data with a hash of the current data for validation
-                cache_data = {
-                    'results': simple_results,
-                    'data_hash': hashlib.md5(str(self.data).encode()).hexdigest(),
-                    'timestamp': time.time()
-                }
+                with open(cache_file, 'rb') as f:
+                    results = pickle.load(f)
+                # The modification time is the last use: a hit keeps the entry from expiring
+                os.utime(cache_file)
+                print(f"Loaded cached {name} results from {cache_file}")
+                return results
+            except Exception as e:
+                print(f"Error loading cached {name} results: {e}")
 
+        results = compute(messages)
+
+        # Empty results come from missing dependencies or errors; don't cache them
+        if results[0] if isinstance(results, tuple) else results:
+            try:
                 with open(cache_file, 'wb') as f:
-                    pickle.dump(cache_data, f)
-                print(f"Search results cached to {cache_file}")
+                    pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
             except Exception as e:
-                print(f"Warning: Could not cache results: {e}")
-
-        return simple_results
+                print(f"Warning: Could not cache {name} results: {e}")
+            _prune_analysis_cache(self.cache_dir)
+        return results
 
-    # ML Analysis Functions
-    def analyze_sentiment(self, messages=None, filters=None):
+    def analyze_sentiment(self, messages=None, filters=None, use_cache=True):
         """Analyze sentiment of messages"""
-        from chat_search.search_ml import analyze_sentiment
-        return analyze_sentiment(self, messages, filters)
+        return self._cached_analysis(
+            'sentiment', (), messages, filters, use_cache,
+            lambda msgs: self._ml_functions()['analyze_sentiment'](self, msgs, filters)
+        )
 
-    def extract_topics(self, messages=None, num_topics=5, filters=None):
+    def extract_topics(self, messages=None, num_topics=5, filters=None, workers=None, passes=4,
+                       use_cache=True, bow=None):
         """Extract main topics from messages using LDA"""
-        from chat_search.search_ml import extract_topics
-        return extract_topics(self, messages, num_topics, filters)
+        return self._cached_analysis(
+            'topics', (num_topics, passes, _topics_backend()), messages, filters, use_cache,
+            lambda msgs: self._ml_functions()['extract_topics'](self, msgs, num_topics, filters,
+                                                                workers, passes, bow)
+        )
 
-    def semantic_search(self, query, messages=None, num_results=10, filters=None, use_cache=True):
+    def semantic_search(self, query, messages=None, num_results=10, filters=None, use_cache=True,
+                        cache_threshold=None, batch_size=None):
         """Perform semantic search using sentence embeddings with caching support"""
-        from chat_search.search_ml import semantic_search
-        return semantic_search(self, query, messages, num_results, filters, use_cache)
+        kwargs = {} if cache_threshold is None else {'cache_threshold': cache_threshold}
+        if batch_size is not None:
+            kwargs['batch_size'] = batch_size
+        return self._ml_functions()['semantic_search'](self, query, messages, num_results, filters,
+                                                       use_cache, **kwargs)
 
-    def extract_entities(self, messages=None, filters=None):
+    def extract_entities(self, messages=None, filters=None, batch_size=64, use_cache=True):
         """Extract named entities from messages using spaCy"""
-        from chat_search.search_ml import extract_entities
-        return extract_entities(self, messages, filters)
+        return self._cached_analysis(
+            'entities', (), messages, filters, use_cache,
+            lambda msgs: self._ml_functions()['extract_entities'](self, msgs, filters, batch_size)
+        )
 
-    def cluster_messages(self, messages=None, num_clusters=5, filters=None):
+    def cluster_messages(self, messages=None, num_clusters=5, filters=None, use_cache=True,
+                         bow=None):
         """Group similar messages using K-means clustering"""
-        from chat_search.search_ml import cluster_messages
-        return cluster_messages(self, messages, num_clusters, filters)
+        return self._cached_analysis(
+            'clusters', (num_clusters,), messages, filters, use_cache,
+            lambda msgs: self._ml_functions()['cluster_messages'](self, msgs, num_clusters, filters,
+                                                                  bow)
+        )
 
-    def complete_analysis(self, filters=None, num_topics=5, num_clusters=5):
-        """Run a complete analysis including all ML features"""
+    def complete_analysis(self, filters=None, num_topics=5, num_clusters=5, parallel=True,
+                          use_cache=True):
+        """
+        Run a complete analysis including all ML features.
+        With parallel=True (and fork available), sentiment, topics, entities and clustering
+        run in worker processes while the semantic search example runs in this process.
+        use_cache is passed to every stage (cached analysis results and embeddings).
+        """
         if not ML_AVAILABLE:
             print("ML dependencies not available. Please install them first.")
             return {}
@@ -742,43 +1265,86 @@ class WhatsAppUnifiedTool:
 
         print(f"Running complete analysis on {len(messages)} messages...")
 
-        # Sentiment analysis
-        print("\n=== Sentiment Analysis ===")
-        sentiment_results = self.analyze_sentiment(messages)
-
-        # Topic extraction
-        print("\n=== Topic Extraction ===")
-        topics, certainties = self.extract_topics(messages, num_topics=num_topics)
+        # Topics and clustering share one bag of words instead of each vectorizing the messages
+        try:
+            bow = self._ml_functions()['vectorize_messages'](messages)
+        except Exception as e:
+            print(f"Could not vectorize messages once for all stages: {e}")
+            bow = None
 
-        # Semantic search (example query)
-        print("\n=== Semantic Search Example ===")
         query = "important message"
-        semantic_results = self.semantic_search(query, messages, num_results=5)
-
-        # Entity extraction
-        print("\n=== Entity Extraction ===")
-        self.extract_entities(messages)  # We don't use the results directly in this method
-
-        # Message clustering
-        print("\n=== Message Clustering ===")
-        clustered_messages = self.cluster_messages(messages, num_clusters=num_clusters)
-
-        # Compile results
-        sentiments = [r['sentiment'] for r in sentiment_results]
-
-        # Count messages per cluster
-        clusters = {}
-        for msg in clustered_messages:
-            cluster = msg['cluster']
-            if cluster not in clusters:
-                clusters[cluster] = 0
-            clusters[cluster] += 1
+        workers = min(4, os.cpu_count() or 1)
+        if parallel and workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            # The stages are independent given the same messages; forked workers inherit
+            # the tool and the messages through _ANALYSIS_STATE instead of pickling them.
+            # The stage workers and this process (semantic search) share the cores evenly
+            from chat_search import search_ml
+            cores = max(1, (os.cpu_count() or 1) // (workers + 1))
+            global _ANALYSIS_STATE
+            _ANALYSIS_STATE = (self, messages, bow, cores)
+            previous_budget = search_ml.set_core_budget(cores)
+            try:
+                print(f"Running sentiment, topics, entities and clustering in {workers} processes...")
+                with ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=multiprocessing.get_context('fork')) as executor:
+                    sentiment_future = executor.submit(
+                        _run_analysis_stage, 'analyze_sentiment', {'use_cache': use_cache})
+                    topics_future = executor.submit(
+                        _run_analysis_stage, 'extract_topics',
+                        {'num_topics': num_topics, 'use_cache': use_cache})
+                    # We don't use the entity results directly in this method
+                    entities_future = executor.submit(
+                        _run_analysis_stage, 'extract_entities', {'use_cache': use_cache})
+                    clusters_future = executor.submit(
+                        _run_analysis_stage, 'cluster_messages',
+                        {'num_clusters': num_clusters, 'use_cache': use_cache})
+
+                    # Semantic search (example query) uses this process's model and caches
+                    print("\n=== Semantic Search Example ===")
+                    semantic_results = self.semantic_search(query, messages, num_results=5,
+                                                            use_cache=use_cache)
+
+                    sentiment_counts = sentiment_future.result()
+                    topics, certainties = topics_future.result()
+                    entities_future.result()
+                    cluster_counts = clusters_future.result()
+            finally:
+                _ANALYSIS_STATE = None
+                search_ml.set_core_budget(previous_budget)
+        else:
+            # Sentiment analysis
+            print("\n=== Sentiment Analysis ===")
+            sentiment_counts = Counter(
+                r['sentiment'] for r in self.analyze_sentiment(messages, use_cache=use_cache))
+
+            # Topic extraction
+            print("\n=== Topic Extraction ===")
+            topics, certainties = self.extract_topics(messages, num_topics=num_topics,
+                                                      use_cache=use_cache, bow=bow)
+
+            # Semantic search (example query)
+            print("\n=== Semantic Search Example ===")
+            semantic_results = self.semantic_search(query, messages, num_results=5,
+                                                    use_cache=use_cache)
+
+            # Entity extraction
+            print("\n=== Entity Extraction ===")
+            # We don't use the results directly in this method
+            self.extract_entities(messages, use_cache=use_cache)
+
+            # Message clustering
+            print("\n=== Message Clustering ===")
+            cluster_counts = Counter(
+                msg['cluster'] for msg in self.cluster_messages(messages, num_clusters=num_clusters,
+                                                                use_cache=use_cache, bow=bow)
+            )
 
+        # Compile results (sentiment and cluster results are reduced to per-value counts)
         return {
             'sentiment_analysis': {
-                'positive': sentiments.count('positive'),
-                'negative': sentiments.count('negative'),
-                'neutral': sentiments.count('neutral')
+                'positive': sentiment_counts['positive'],
+                'negative': sentiment_counts['negative'],
+                'neutral': sentiment_counts['neutral']
             },
             'topics': topics,
             'topic_certainties': certainties,
@@ -795,25 +1361,22 @@ class WhatsAppUnifiedTool:
             },
             'clusters': {
                 'count': num_clusters,
-                'distribution': {str(cluster): count for cluster, count in clusters.items()}
+                'distribution': {str(cluster): count for cluster, count in cluster_counts.items()}
             }
         }
 
     def _get_filtered_messages(self, filters=None):
         """Extract messages using the specified filters"""
-        from chat_search import extract_messages
-
-        if not filters:
-            filters = {}
+        filters = Filters.coerce(filters)
 
         return extract_messages(
             self.data,
             contacts=self.contacts,
-            chat_filter=filters.get('chat'),
-            start_date=filters.get('start_date'),
-            end_date=filters.get('end_date'),
-            sender_filter=filters.get('sender'),
-            phone_filter=filters.get('phone')
+            chat_filter=filters.chat,
+            start_date=filters.start_date,
+            end_date=filters.end_date,
+            sender_filter=filters.sender,
+            phone_filter=filters.phone
         )
 
 
@@ -839,10 +1402,7 @@ def analyze_relevant_contacts(tool):
     min_score = float(input("Puntuación mínima de relevancia (0-100, default 5): ") or 5)
     max_results = int(input("Número máximo de contactos a mostrar (default 20): ") or 20)
 
-    # Solicitar criterios de ordenación
-    from chat_search.sort_utils import get_available_sort_criteria
-
-    # Mostrar criterios disponibles
+    # Solicitar criterios de ordenación: mostrar criterios disponibles
     print("\nCriterios de ordenación disponibles:")
     criteria_dict = get_available_sort_criteria()
     for i, (key, desc) in enumerate(criteria_dict.items(), 1):
@@ -931,9 +1491,9 @@ def analyze_relevant_contacts(tool):
 
         # Mostrar palabras clave más frecuentes
         if 'keyword_counts' in data and data['keyword_counts']:
-            sorted_keywords = sorted(data['keyword_counts'].items(), key=lambda x: x[1], reverse=True)
+            top_keywords = heapq.nlargest(5, data['keyword_counts'].items(), key=itemgetter(1))
             print("   Palabras clave más frecuentes:")
-            for keyword, count in sorted_keywords[:5]:  # Mostrar las 5 más frecuentes
+            for keyword, count in top_keywords:  # Mostrar las 5 más frecuentes
                 print(f"     - {keyword}: {count} veces")
 
     # Preguntar si se desea exportar los resultados
@@ -942,7 +1502,7 @@ def analyze_relevant_contacts(tool):
         filename = input("Ingresa el nombre del archivo: ")
         if not filename:
             filename = "contactos_relevantes.json"
-        elif not (filename.endswith('.json') or filename.endswith('.md')):
+        elif not filename.endswith(RESULT_FILE_EXTENSIONS):
             filename += ".json"
 
         # Exportar resultados
@@ -953,8 +1513,8 @@ def analyze_relevant_contacts(tool):
         for contact_id, data in contact_relevance:
             contact_dict[contact_id] = data
 
-        save_results_to_file({'contact_relevance': contact_dict}, filename, contacts=tool.contacts)
-        print(f"Resultados exportados a {filename}")
+        save_results_to_file({'contact_relevance': contact_dict}, filename, contacts=tool.contacts,
+                             background=True)
 
 def analyze_messages(tool):
     """
@@ -1003,10 +1563,7 @@ def analyze_messages(tool):
         min_score = float(input("Puntuación mínima de relevancia (0-100, default 5): ") or 5)
         max_results = int(input("Número máximo de mensajes a mostrar (default 50): ") or 50)
 
-        # Solicitar criterios de ordenación
-        from chat_search.sort_utils import get_available_sort_criteria
-
-        # Mostrar criterios disponibles
+        # Solicitar criterios de ordenación: mostrar criterios disponibles
         print("\nCriterios de ordenación disponibles:")
         criteria_dict = get_available_sort_criteria()
         for i, (key, desc) in enumerate(criteria_dict.items(), 1):
@@ -1082,30 +1639,18 @@ def analyze_messages(tool):
     # Mostrar estadísticas de los mensajes
     print(f"\nSe encontraron {len(messages)} mensajes.")
 
-    # Agrupar por chat
-    chats = {}
-    for msg in messages:
-        chat_name = msg.get('chat_name', 'Desconocido')
-        if chat_name not in chats:
-            chats[chat_name] = 0
-        chats[chat_name] += 1
-
-    # Agrupar por remitente
-    senders = {}
-    for msg in messages:
-        sender = msg.get('sender', 'Desconocido')
-        if sender not in senders:
-            senders[sender] = 0
-        senders[sender] += 1
+    # Agrupar por chat y por remitente
+    chats = Counter(msg.get('chat_name', 'Desconocido') for msg in messages)
+    senders = Counter(msg.get('sender', 'Desconocido') for msg in messages)
 
     # Mostrar distribución por chat
     print("\nDistribución por chat:")
-    for chat, count in sorted(chats.items(), key=lambda x: x[1], reverse=True):
+    for chat, count in chats.most_common():
         print(f"  - {chat}: {count} mensajes")
 
     # Mostrar distribución por remitente
     print("\nDistribución por remitente:")
-    for sender, count in sorted(senders.items(), key=lambda x: x[1], reverse=True):
+    for sender, count in senders.most_common():
         print(f"  - {sender}: {count} mensajes")
 
     # Preguntar si se desea ver los mensajes
@@ -1121,13 +1666,12 @@ def analyze_messages(tool):
         filename = input("Ingresa el nombre del archivo: ")
         if not filename:
             filename = "mensajes_filtrados.json"
-        elif not (filename.endswith('.json') or filename.endswith('.md')):
+        elif not filename.endswith(RESULT_FILE_EXTENSIONS):
             filename += ".json"
 
         # Exportar resultados
         from chat_search import save_results_to_file
-        save_results_to_file(messages, filename, contacts=tool.contacts)
-        print(f"Mensajes exportados a {filename}")
+        save_results_to_file(messages, filename, contacts=tool.contacts, background=True)
 
 def analyze_relevant_chats(tool):
     """
@@ -1150,10 +1694,7 @@ def analyze_relevant_chats(tool):
     min_score = float(input("Puntuación mínima de relevancia (0-100, default 5): ") or 5)
     max_results = int(input("Número máximo de chats a mostrar (default 20): ") or 20)
 
-    # Solicitar criterios de ordenación
-    from chat_search.sort_utils import get_available_sort_criteria
-
-    # Mostrar criterios disponibles
+    # Solicitar criterios de ordenación: mostrar criterios disponibles
     print("\nCriterios de ordenación disponibles:")
     criteria_dict = get_available_sort_criteria()
     for i, (key, desc) in enumerate(criteria_dict.items(), 1):
@@ -1239,17 +1780,18 @@ def analyze_relevant_chats(tool):
 
         # Mostrar palabras clave más frecuentes
         if 'keyword_counts' in data and data['keyword_counts']:
-            sorted_keywords = sorted(data['keyword_counts'].items(), key=lambda x: x[1], reverse=True)
+            top_keywords = heapq.nlargest(5, data['keyword_counts'].items(), key=itemgetter(1))
             print("   Palabras clave más frecuentes:")
-            for keyword, count in sorted_keywords[:5]:  # Mostrar las 5 más frecuentes
+            for keyword, count in top_keywords:  # Mostrar las 5 más frecuentes
                 print(f"     - {keyword}: {count} veces")
 
     # Preguntar si se desea ver mensajes de un chat específico
     view_option = input("\n¿Deseas ver mensajes de un chat específico? (s/n): ")
     if view_option.lower() == 's':
-        chat_index = int(input(f"Ingresa el número del chat (1-{min(max_results, total_chats)}): "))
+        shown_chats = min(max_results, total_chats)
+        chat_index = int(input(f"Ingresa el número del chat (1-{shown_chats}): "))
 
-        if 1 <= chat_index <= min(max_results, total_chats):
+        if 1 <= chat_index <= shown_chats:
             # Obtener el chat seleccionado
             selected_chat_id, selected_chat_data = chat_relevance[chat_index - 1]
 
@@ -1277,7 +1819,7 @@ def analyze_relevant_chats(tool):
         filename = input("Ingresa el nombre del archivo: ")
         if not filename:
             filename = "chats_relevantes.json"
-        elif not (filename.endswith('.json') or filename.endswith('.md')):
+        elif not filename.endswith(RESULT_FILE_EXTENSIONS):
             filename += ".json"
 
         # Exportar resultados
@@ -1288,8 +1830,137 @@ def analyze_relevant_chats(tool):
         for chat_id, data in chat_relevance:
             chat_dict[chat_id] = data
 
-        save_results_to_file({'chat_relevance': chat_dict}, filename, contacts=tool.contacts)
-        print(f"Resultados exportados a {filename}")
+        save_results_to_file({'chat_relevance': chat_dict}, filename, contacts=tool.contacts,
+                             background=True)
+
+
+# Modelo de potencial de compra de un prospecto: cada factor se limita a 0-100 y se pondera:
+# 1. Puntuación total de relevancia (40%)
+# 2. Densidad de palabras clave (30%)
+# 3. Número de categorías de interés (20%)
+# 4. Número total de mensajes relevantes (10%)
+_POTENTIAL_MAX_FACTOR = 100
+_POTENTIAL_WEIGHTS = (0.4, 0.3, 0.2, 0.1)  # relevancia, densidad, categorías, mensajes
+_POTENTIAL_SCORE_DIVISOR = 10  # Normalizar la puntuación total a 0-100
+_POTENTIAL_DENSITY_BOOST = 5  # La densidad (en %) se multiplica por 5 para dar más peso
+_POTENTIAL_CATEGORY_POINTS = 25  # Puntos por categoría
+_POTENTIAL_MESSAGE_POINTS = 2  # Puntos por mensaje
+
+# Umbrales de potencial de compra (ordenados) y el nivel que corresponde a cada tramo
+_POTENTIAL_THRESHOLDS = np.array([25, 50, 75], dtype=np.float64)
+_POTENTIAL_LEVELS = np.array(["MUY BAJO", "BAJO", "MEDIO", "ALTO"])
+
+
+def run_sales_prospects(tool, categories, start_date=None, end_date=None, min_score=5,
+                        sort_criteria=None):
+    """
+    Calcula los prospectos de ventas sin interacción con el usuario.
+
+    Parámetros:
+    - tool: Instancia de WhatsAppUnifiedTool con los datos cargados
+    - categories: Diccionario {categoría: [palabras clave]}
+    - start_date, end_date: Filtros de fecha opcionales (YYYY-MM-DD)
+    - min_score: Puntuación mínima de relevancia de los mensajes
+    - sort_criteria: Criterios de ordenación para las búsquedas por categoría
+
+    Retorna:
+    - Diccionario {contact_id: datos} con 'potential_score' y 'potential_level' calculados
+      (vacío si no hay prospectos); el orden lo decide quien lo consume
+    """
+    # Preparar resultados por categoría (los prospectos se crean al aparecer por primera vez)
+    all_prospects = defaultdict(lambda: {
+        'display_name': None,
+        'phone': None,
+        'total_score': 0,
+        'message_count': 0,
+        'categories': {},
+        'keyword_density': 0,
+        'last_interaction': None  # Se llenará después si es posible
+    })
+    density_sums = defaultdict(float)
+
+    # Búsqueda con cálculo de relevancia de contactos activado (igual para cada categoría)
+    search_kwargs = {
+        'min_score': min_score,
+        'max_results': 100,  # Usar un valor alto para capturar más mensajes
+        'start_date': start_date,
+        'end_date': end_date,
+        'calculate_contact_relevance': True,
+        'preprocess_data': True,
+        'sort_criteria': sort_criteria
+    }
+
+    # Analizar cada categoría (las búsquedas son independientes y pueden ir en paralelo)
+    for category_name, results in _search_categories(tool, categories, search_kwargs):
+        # Verificar si hay resultados
+        if not isinstance(results, dict) or 'contact_relevance' not in results or not results['contact_relevance']:
+            print(f"No se encontraron prospectos para la categoría '{category_name}'.")
+            continue
+
+        # Actualizar el diccionario global de prospectos
+        for contact_id, data in results['contact_relevance']:
+            prospect = all_prospects[contact_id]
+            if prospect['display_name'] is None:
+                # Nombre y teléfono de la primera categoría en la que aparece el contacto
+                prospect['display_name'] = data['display_name']
+                prospect['phone'] = data['phone']
+
+            # Actualizar datos del prospecto para esta categoría
+            prospect['categories'][category_name] = {
+                'score': data['score'],
+                'message_count': data['message_count'],
+                'keyword_density': data.get('keyword_density', 0),
+                'keyword_counts': data.get('keyword_counts', {})
+            }
+
+            # Actualizar puntuación total y conteo de mensajes
+            prospect['total_score'] += data['score']
+            prospect['message_count'] += data['message_count']
+
+            # Acumular la densidad ponderada por mensajes; el promedio se calcula al final
+            density_sums[contact_id] += data.get('keyword_density', 0) * data['message_count']
+
+    # Densidad de palabras clave: promedio ponderado por el número de mensajes de cada categoría
+    all_prospects = dict(all_prospects)
+    for contact_id, prospect in all_prospects.items():
+        if prospect['message_count']:
+            prospect['keyword_density'] = density_sums[contact_id] / prospect['message_count']
+
+    if not all_prospects:
+        return all_prospects
+
+    # Calcular puntuación de potencial de compra de todos los prospectos a la vez, por columnas
+    prospects = list(all_prospects.values())
+    count = len(prospects)
+    total_scores = np.fromiter((p['total_score'] for p in prospects), dtype=np.float64, count=count)
+    densities = np.fromiter((p['keyword_density'] for p in prospects), dtype=np.float64, count=count)
+    num_categories = np.fromiter((len(p['categories']) for p in prospects), dtype=np.float64, count=count)
+    message_counts = np.fromiter((p['message_count'] for p in prospects), dtype=np.float64, count=count)
+
+    relevance_factor = np.minimum(_POTENTIAL_MAX_FACTOR, total_scores / _POTENTIAL_SCORE_DIVISOR)
+    density_factor = np.minimum(_POTENTIAL_MAX_FACTOR, densities * 100 * _POTENTIAL_DENSITY_BOOST)
+    categories_factor = np.minimum(_POTENTIAL_MAX_FACTOR, num_categories * _POTENTIAL_CATEGORY_POINTS)
+    messages_factor = np.minimum(_POTENTIAL_MAX_FACTOR, message_counts * _POTENTIAL_MESSAGE_POINTS)
+
+    # Calcular puntuación final ponderada
+    relevance_weight, density_weight, categories_weight, messages_weight = _POTENTIAL_WEIGHTS
+    potential_scores = (
+        relevance_factor * relevance_weight +
+        density_factor * density_weight +
+        categories_factor * categories_weight +
+        messages_factor * messages_weight
+    )
+
+    # Asignar nivel de potencial: número de umbrales alcanzados (puntuación >= umbral)
+    potential_levels = _POTENTIAL_LEVELS[np.searchsorted(_POTENTIAL_THRESHOLDS, potential_scores, side='right')]
+
+    # Guardar puntuación y nivel (como tipos nativos de Python para la exportación)
+    for data, potential_score, potential_level in zip(prospects, potential_scores.tolist(),
+                                                      potential_levels.tolist()):
+        data['potential_score'] = potential_score
+        data['potential_level'] = potential_level
+
+    return all_prospects
 
 
 def analyze_sales_prospects(tool):
@@ -1333,10 +2004,7 @@ def analyze_sales_prospects(tool):
     min_score = float(input("Puntuación mínima de relevancia (0-100, default 5): ") or 5)
     max_results = int(input("Número máximo de prospectos a mostrar (default 20): ") or 20)
 
-    # Solicitar criterios de ordenación
-    from chat_search.sort_utils import get_available_sort_criteria
-
-    # Mostrar criterios disponibles
+    # Solicitar criterios de ordenación: mostrar criterios disponibles
     print("\nCriterios de ordenación disponibles:")
     criteria_dict = get_available_sort_criteria()
     for i, (key, desc) in enumerate(criteria_dict.items(), 1):
@@ -1379,125 +2047,28 @@ def analyze_sales_prospects(tool):
     if not end_date:
         end_date = None
 
-    # Preparar resultados por categoría
-    all_prospects = {}
-    category_results = {}
-
-    # Analizar cada categoría
-    for category_name, keywords in categories.items():
-        print(f"\nAnalizando prospectos para categoría: {category_name}...")
-
-        # Realizar búsqueda con cálculo de relevancia de contactos activado
-        results = tool.search(
-            keywords=keywords,
-            min_score=min_score,
-            max_results=100,  # Usar un valor alto para capturar más mensajes
-            start_date=start_date,
-            end_date=end_date,
-            calculate_contact_relevance=True,
-            preprocess_data=True,
-            sort_criteria=sort_criteria
-        )
-
-        # Verificar si hay resultados
-        if not isinstance(results, dict) or 'contact_relevance' not in results or not results['contact_relevance']:
-            print(f"No se encontraron prospectos para la categoría '{category_name}'.")
-            continue
-
-        # Guardar resultados de esta categoría
-        category_results[category_name] = results['contact_relevance']
-
-        # Actualizar el diccionario global de prospectos
-        for contact_id, data in results['contact_relevance']:
-            if contact_id not in all_prospects:
-                all_prospects[contact_id] = {
-                    'display_name': data['display_name'],
-                    'phone': data['phone'],
-                    'total_score': 0,
-                    'message_count': 0,
-                    'categories': {},
-                    'keyword_density': 0,
-                    'last_interaction': None  # Se llenará después si es posible
-                }
-
-            # Actualizar datos del prospecto para esta categoría
-            all_prospects[contact_id]['categories'][category_name] = {
-                'score': data['score'],
-                'message_count': data['message_count'],
-                'keyword_density': data.get('keyword_density', 0),
-                'keyword_counts': data.get('keyword_counts', {})
-            }
-
-            # Actualizar puntuación total y conteo de mensajes
-            all_prospects[contact_id]['total_score'] += data['score']
-            all_prospects[contact_id]['message_count'] += data['message_count']
-
-            # Actualizar densidad de palabras clave (promedio ponderado)
-            if 'keyword_density' in data:
-                current_density = all_prospects[contact_id]['keyword_density']
-                current_messages = all_prospects[contact_id]['message_count'] - data['message_count']
-                new_density = ((current_density * current_messages) +
-                              (data['keyword_density'] * data['message_count'])) / all_prospects[contact_id]['message_count']
-                all_prospects[contact_id]['keyword_density'] = new_density
+    # Calcular prospectos (la lógica no interactiva está en run_sales_prospects)
+    all_prospects = run_sales_prospects(tool, categories, start_date, end_date, min_score, sort_criteria)
 
     # Verificar si se encontraron prospectos
     if not all_prospects:
         print("\nNo se encontraron prospectos para ninguna categoría.")
         return
 
-    # Calcular puntuación de potencial de compra
-    for contact_id, data in all_prospects.items():
-        # Factores para la puntuación de potencial:
-        # 1. Puntuación total de relevancia (40%)
-        # 2. Densidad de palabras clave (30%)
-        # 3. Número de categorías de interés (20%)
-        # 4. Número total de mensajes relevantes (10%)
-
-        relevance_factor = min(100, data['total_score'] / 10)  # Normalizar a 0-100
-        density_factor = min(100, data['keyword_density'] * 100 * 5)  # Multiplicar por 5 para dar más peso
-        categories_factor = min(100, len(data['categories']) * 25)  # 25 puntos por categoría
-        messages_factor = min(100, data['message_count'] * 2)  # 2 puntos por mensaje
-
-        # Calcular puntuación final ponderada
-        potential_score = (
-            relevance_factor * 0.4 +
-            density_factor * 0.3 +
-            categories_factor * 0.2 +
-            messages_factor * 0.1
-        )
-
-        # Asignar nivel de potencial
-        if potential_score >= 75:
-            potential_level = "ALTO"
-        elif potential_score >= 50:
-            potential_level = "MEDIO"
-        elif potential_score >= 25:
-            potential_level = "BAJO"
-        else:
-            potential_level = "MUY BAJO"
-
-        # Guardar puntuación y nivel
-        data['potential_score'] = potential_score
-        data['potential_level'] = potential_level
-
-    # Ordenar prospectos por puntuación de potencial
-    sorted_prospects = sorted(
-        all_prospects.items(),
-        key=lambda x: x[1]['potential_score'],
-        reverse=True
-    )
-
     # Mostrar resultados
     print("\n" + "=" * 80)
     print("RESULTADOS: PROSPECTOS DE VENTAS")
     print("=" * 80)
 
-    total_prospects = len(sorted_prospects)
+    total_prospects = len(all_prospects)
     print(f"\nSe encontraron {total_prospects} prospectos potenciales.")
 
+    # Solo se muestran los max_results mejores: seleccionarlos con un heap en lugar de ordenar todos
+    top_prospects = heapq.nlargest(max_results, all_prospects.items(), key=lambda x: x[1]['potential_score'])
+
     # Mostrar los prospectos más relevantes
     print("\nProspectos con mayor potencial de compra:")
-    for i, (contact_id, data) in enumerate(sorted_prospects[:max_results], 1):
+    for i, (contact_id, data) in enumerate(top_prospects, 1):
         print(f"\n{i}. {data['display_name']} ({data['phone']})")
         print(f"   Potencial de compra: {data['potential_level']} ({data['potential_score']:.1f}/100)")
         print(f"   Mensajes relevantes: {data['message_count']}")
@@ -1516,27 +2087,25 @@ def analyze_sales_prospects(tool):
     # Preguntar si se desea ver mensajes de un prospecto específico
     view_option = input("\n¿Deseas ver mensajes de un prospecto específico? (s/n): ")
     if view_option.lower() == 's':
-        prospect_index = int(input(f"Ingresa el número del prospecto (1-{min(max_results, total_prospects)}): "))
+        # Solo se puede elegir entre los prospectos mostrados
+        shown_prospects = len(top_prospects)
+        prospect_index = int(input(f"Ingresa el número del prospecto (1-{shown_prospects}): "))
 
-        if 1 <= prospect_index <= min(max_results, total_prospects):
+        if 1 <= prospect_index <= shown_prospects:
             # Obtener el prospecto seleccionado
-            _, selected_data = sorted_prospects[prospect_index - 1]
+            _, selected_data = top_prospects[prospect_index - 1]
 
-            # Preguntar por categoría específica
+            # Preguntar por categoría específica (la misma lista sirve para mostrar y para resolver el número)
+            category_names = list(selected_data['categories'])
             print("\nCategorías disponibles:")
-            for i, category_name in enumerate(selected_data['categories'].keys(), 1):
+            for i, category_name in enumerate(category_names, 1):
                 print(f"{i}. {category_name}")
 
             category_index = int(input("Ingresa el número de la categoría (o 0 para todas): "))
 
             if category_index == 0:
-                # Buscar mensajes para todas las categorías
-                all_keywords = []
-                for keywords in categories.values():
-                    all_keywords.extend(keywords)
-
-                # Eliminar duplicados
-                all_keywords = list(set(all_keywords))
+                # Buscar mensajes para todas las categorías (palabras clave sin duplicados)
+                all_keywords = list(set().union(*categories.values()))
 
                 # Extraer mensajes del contacto con todas las palabras clave
                 contact_messages = tool.search(
@@ -1551,7 +2120,6 @@ def analyze_sales_prospects(tool):
                 )
             else:
                 # Obtener categoría seleccionada
-                category_names = list(selected_data['categories'].keys())
                 if 1 <= category_index <= len(category_names):
                     selected_category = category_names[category_index - 1]
 
@@ -1585,19 +2153,20 @@ def analyze_sales_prospects(tool):
         filename = input("Ingresa el nombre del archivo: ")
         if not filename:
             filename = "prospectos_ventas.json"
-        elif not (filename.endswith('.json') or filename.endswith('.md')):
+        elif not filename.endswith(RESULT_FILE_EXTENSIONS):
             filename += ".json"
 
         # Exportar resultados
         from chat_search import save_results_to_file
 
-        # Convertir la lista de tuplas a un diccionario para evitar errores de índice
-        prospects_dict = {}
-        for contact_id, data in sorted_prospects:
-            prospects_dict[contact_id] = data
-
+        # Exportar los prospectos ordenados por puntuación de potencial; el diccionario
+        # comparte los datos de all_prospects (solo se crea un índice nuevo con otro orden)
         export_data = {
-            'prospects': prospects_dict,
+            'prospects': dict(sorted(
+                all_prospects.items(),
+                key=lambda x: x[1]['potential_score'],
+                reverse=True
+            )),
             'categories': categories,
             'analysis_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'filters': {
@@ -1606,8 +2175,286 @@ def analyze_sales_prospects(tool):
                 'min_score': min_score
             }
         }
-        save_results_to_file(export_data, filename, contacts=tool.contacts)
-        print(f"Resultados exportados a {filename}")
+        save_results_to_file(export_data, filename, contacts=tool.contacts, background=True)
+
+# Interactive menu handlers: each takes the tool and runs one menu option
+def _m_search(tool):
+    """Search by keywords using the search_interactive_handler from chat_search module"""
+    from chat_search import search_interactive_handler
+    search_interactive_handler(tool)
+
+
+def _m_list_chats(tool):
+    """List available chats"""
+    chats = tool.get_available_chats()
+
+    print("\nAvailable Chats:")
+    for i, chat in enumerate(chats, 1):
+        print(f"{i}. {chat['name']} ({chat['message_count']} messages)")
+
+
+def _m_sentiment(tool):
+    """Analyze sentiment"""
+    # Ask for filters
+    chat_filter = input("Filter by chat name (optional): ")
+    start_date = input("Start date (YYYY-MM-DD, optional): ")
+    end_date = input("End date (YYYY-MM-DD, optional): ")
+
+    # Clean up filters
+    filters = Filters(chat=chat_filter or None, start_date=start_date or None,
+                      end_date=end_date or None)
+
+    # Perform sentiment analysis
+    results = tool.analyze_sentiment(filters=filters)
+
+    # Ask if user wants to save results
+    save_option = input("Do you want to save these results to a file? (y/n): ")
+    if save_option.lower() == 'y':
+        filename = input("Enter filename to save results: ")
+        save_results_to_file(results, filename, contacts=tool.contacts, background=True)
+
+
+def _m_topics(tool):
+    """Extract topics"""
+    # Ask for filters
+    chat_filter = input("Filter by chat name (optional): ")
+    start_date = input("Start date (YYYY-MM-DD, optional): ")
+    end_date = input("End date (YYYY-MM-DD, optional): ")
+    num_topics = int(input("Number of topics to extract (default 5): ") or 5)
+
+    # Clean up filters
+    filters = Filters(chat=chat_filter or None, start_date=start_date or None,
+                      end_date=end_date or None)
+
+    # Extract topics
+    topics, certainties = tool.extract_topics(
+        num_topics=num_topics,
+        filters=filters
+    )
+
+    # Ask if user wants to save results
+    save_option = input("Do you want to save these results to a file? (y/n): ")
+    if save_option.lower() == 'y':
+        filename = input("Enter filename to save results: ")
+        save_results_to_file({
+            'topics': topics,
+            'certainties': certainties
+        }, filename, contacts=tool.contacts, background=True)
+
+
+def _m_semantic(tool):
+    """Semantic search"""
+    # Ask for query and filters
+    query = input("Enter search query: ")
+
+    chat_filter = input("Filter by chat name (optional): ")
+    start_date = input("Start date (YYYY-MM-DD, optional): ")
+    end_date = input("End date (YYYY-MM-DD, optional): ")
+    num_results = int(input("Number of results to show (default 10): ") or 10)
+    use_cache = input("Use embeddings cache if available? (y/n, default y): ").lower() != 'n'
+
+    # Clean up filters
+    filters = Filters(chat=chat_filter or None, start_date=start_date or None,
+                      end_date=end_date or None)
+
+    # Perform semantic search
+    results = tool.semantic_search(
+        query=query,
+        num_results=num_results,
+        filters=filters,
+        use_cache=use_cache
+    )
+
+    # Show results
+    print_results(results, show_context=True, contacts=tool.contacts)
+
+    # Ask if user wants to save results
+    save_option = input("Do you want to save these results to a file? (y/n): ")
+    if save_option.lower() == 'y':
+        filename = input("Enter filename to save results: ")
+        save_results_to_file(results, filename, contacts=tool.contacts, background=True)
+
+
+def _m_entities(tool):
+    """Extract entities"""
+    # Ask for filters
+    chat_filter = input("Filter by chat name (optional): ")
+    start_date = input("Start date (YYYY-MM-DD, optional): ")
+    end_date = input("End date (YYYY-MM-DD, optional): ")
+
+    # Clean up filters
+    filters = Filters(chat=chat_filter or None, start_date=start_date or None,
+                      end_date=end_date or None)
+
+    # Extract entities
+    results = tool.extract_entities(filters=filters)
+
+    # Ask if user wants to save results
+    save_option = input("Do you want to save these results to a file? (y/n): ")
+    if save_option.lower() == 'y':
+        filename = input("Enter filename to save results: ")
+        save_results_to_file(results, filename, contacts=tool.contacts, background=True)
+
+
+def _m_clusters(tool):
+    """Cluster messages"""
+    # Ask for filters
+    chat_filter = input("Filter by chat name (optional): ")
+    start_date = input("Start date (YYYY-MM-DD, optional): ")
+    end_date = input("End date (YYYY-MM-DD, optional): ")
+    num_clusters = int(input("Number of clusters to create (default 5): ") or 5)
+
+    # Clean up filters
+    filters = Filters(chat=chat_filter or None, start_date=start_date or None,
+                      end_date=end_date or None)
+
+    # Cluster messages
+    results = tool.cluster_messages(
+        num_clusters=num_clusters,
+        filters=filters
+    )
+
+    # Ask if user wants to save results
+    save_option = input("Do you want to save these results to a file? (y/n): ")
+    if save_option.lower() == 'y':
+        filename = input("Enter filename to save results: ")
+        save_results_to_file(results, filename, contacts=tool.contacts, background=True)
+
+
+def _m_complete_analysis(tool):
+    """Run complete analysis"""
+    # Ask for filters
+    chat_filter = input("Filter by chat name (optional): ")
+    start_date = input("Start date (YYYY-MM-DD, optional): ")
+    end_date = input("End date (YYYY-MM-DD, optional): ")
+    num_topics = int(input("Number of topics to extract (default 5): ") or 5)
+    num_clusters = int(input("Number of clusters to create (default 5): ") or 5)
+
+    # Clean up filters
+    filters = Filters(chat=chat_filter or None, start_date=start_date or None,
+                      end_date=end_date or None)
+
+    # Run complete analysis
+    results = tool.complete_analysis(
+        filters=filters,
+        num_topics=num_topics,
+        num_clusters=num_clusters
+    )
+
+    # Ask if user wants to save results
+    save_option = input("Do you want to save these results to a file? (y/n): ")
+    if save_option.lower() == 'y':
+        filename = input("Enter filename to save results: ")
+        save_results_to_file(results, filename, contacts=tool.contacts, background=True)
+
+
+def _m_corrections(tool):
+    """Manage contact corrections"""
+    print("\n=== Manage Contact Corrections ===")
+    print("1. Create/Update corrections file")
+    print("2. Apply corrections to data")
+    print("3. Back to main menu")
+
+    subchoice = input("\nEnter your choice (1-3): ")
+
+    if subchoice == '1':
+        # Create/Update corrections file
+        from whatsapp_core import create_corrections_file
+        success = create_corrections_file(tool.data, tool.contacts)
+        if success:
+            print("Corrections file created/updated successfully.")
+            print("Edit the file 'contact_corrections.json' to add your corrections.")
+        else:
+            print("Failed to create/update corrections file.")
+
+    elif subchoice == '2':
+        # Apply corrections to data
+        from whatsapp_core import apply_manual_corrections
+        tool.data = apply_manual_corrections(tool.data)
+        tool.mark_data_modified()
+        print("Corrections applied to data.")
+
+    elif subchoice == '3':
+        # Back to main menu
+        return
+
+    else:
+        print("Invalid choice. Please enter a number between 1 and 3.")
+
+
+def _m_google_contacts(tool):
+    """Manage Google Contacts"""
+    print("\n=== Manage Google Contacts ===")
+    print("1. Load Google Contacts CSV file")
+    print("2. Show loaded Google Contacts")
+    print("3. Back to main menu")
+
+    subchoice = input("\nEnter your choice (1-3): ")
+
+    if subchoice == '1':
+        # Load Google Contacts CSV file
+        if not GOOGLE_CONTACTS_AVAILABLE:
+            print("Google Contacts support is not available. Make sure google_contacts.py is in the same directory.")
+            return
+
+        file_path = input("Enter path to Google Contacts CSV file: ")
+        if file_path:
+            success = tool.load_google_contacts(file_path)
+            if success:
+                print(f"Successfully loaded {len(tool.google_contacts)} contacts from Google Contacts CSV.")
+            else:
+                print("Failed to load Google Contacts CSV file.")
+        else:
+            print("No file path provided.")
+
+    elif subchoice == '2':
+        # Show loaded Google Contacts
+        if not tool.google_contacts:
+            print("No Google Contacts loaded. Use option 1 to load a Google Contacts CSV file.")
+            return
+
+        print(f"\nLoaded {len(tool.google_contacts)} Google Contacts:")
+
+        # Show a sample of contacts
+        sample_size = min(10, len(tool.google_contacts))
+        sample_contacts = list(itertools.islice(tool.google_contacts.items(), sample_size))
+
+        for i, (phone, contact) in enumerate(sample_contacts, 1):
+            print(f"\n{i}. {contact['display_name']}")
+            print(f"   Phone: {contact.get('phone', 'N/A')}")
+            print(f"   Raw Phone: {contact.get('phone_raw', 'N/A')}")
+
+        if len(tool.google_contacts) > sample_size:
+            print(f"\n... and {len(tool.google_contacts) - sample_size} more contacts.")
+
+    elif subchoice == '3':
+        # Back to main menu
+        return
+
+    else:
+        print("Invalid choice. Please enter a number between 1 and 3.")
+
+
+MENU_HANDLERS = {
+    '1': _m_search,
+    '2': _m_list_chats,
+    '3': _m_sentiment,
+    '4': _m_topics,
+    '5': _m_semantic,
+    '6': _m_entities,
+    '7': _m_clusters,
+    '8': _m_complete_analysis,
+    '9': _m_corrections,
+    '10': analyze_relevant_contacts,
+    '11': analyze_messages,
+    '12': analyze_relevant_chats,
+    '13': analyze_sales_prospects,
+    '14': _m_google_contacts,
+}
+
+# Opciones del menú que necesitan las dependencias de ML
+ML_MENU_CHOICES = frozenset({'3', '4', '5', '6', '7', '8'})
+
 
 def interactive_mode(tool):
     """Run the tool in interactive mode"""
@@ -1631,347 +2478,143 @@ def interactive_mode(tool):
 
         choice = input("\nEnter your choice (1-15): ")
 
-        if choice == '1':
-            # Search by keywords using the search_interactive_handler from chat_search module
-            from chat_search import search_interactive_handler
-            search_interactive_handler(tool)
-
-        elif choice == '2':
-            # List available chats
-            chats = tool.get_available_chats()
-
-            print("\nAvailable Chats:")
-            for i, chat in enumerate(chats, 1):
-                print(f"{i}. {chat['name']} ({chat['message_count']} messages)")
-
-        elif choice == '3':
-            # Analyze sentiment
-            if not ML_AVAILABLE:
-                print("ML dependencies not available. Please install them first.")
-                install_option = input("Do you want to install ML dependencies now? (y/n): ")
-                if install_option.lower() == 'y':
-                    install_ml_dependencies()
-                continue
-
-            # Ask for filters
-            chat_filter = input("Filter by chat name (optional): ")
-            start_date = input("Start date (YYYY-MM-DD, optional): ")
-            end_date = input("End date (YYYY-MM-DD, optional): ")
-
-            # Clean up filters
-            filters = {}
-            if chat_filter:
-                filters['chat'] = chat_filter
-            if start_date:
-                filters['start_date'] = start_date
-            if end_date:
-                filters['end_date'] = end_date
-
-            # Perform sentiment analysis
-            results = tool.analyze_sentiment(filters=filters)
-
-            # Ask if user wants to save results
-            save_option = input("Do you want to save these results to a file? (y/n): ")
-            if save_option.lower() == 'y':
-                filename = input("Enter filename to save results: ")
-                save_results_to_file(results, filename, contacts=tool.contacts)
-
-        elif choice == '4':
-            # Extract topics
-            if not ML_AVAILABLE:
-                print("ML dependencies not available. Please install them first.")
-                install_option = input("Do you want to install ML dependencies now? (y/n): ")
-                if install_option.lower() == 'y':
-                    install_ml_dependencies()
-                continue
-
-            # Ask for filters
-            chat_filter = input("Filter by chat name (optional): ")
-            start_date = input("Start date (YYYY-MM-DD, optional): ")
-            end_date = input("End date (YYYY-MM-DD, optional): ")
-            num_topics = int(input("Number of topics to extract (default 5): ") or 5)
-
-            # Clean up filters
-            filters = {}
-            if chat_filter:
-                filters['chat'] = chat_filter
-            if start_date:
-                filters['start_date'] = start_date
-            if end_date:
-                filters['end_date'] = end_date
-
-            # Extract topics
-            topics, certainties = tool.extract_topics(
-                num_topics=num_topics,
-                filters=filters
-            )
-
-            # Ask if user wants to save results
-            save_option = input("Do you want to save these results to a file? (y/n): ")
-            if save_option.lower() == 'y':
-                filename = input("Enter filename to save results: ")
-                save_results_to_file({
-                    'topics': topics,
-                    'certainties': certainties
-                }, filename, contacts=tool.contacts)
-
-        elif choice == '5':
-            # Semantic search
-            if not ML_AVAILABLE:
-                print("ML dependencies not available. Please install them first.")
-                install_option = input("Do you want to install ML dependencies now? (y/n): ")
-                if install_option.lower() == 'y':
-                    install_ml_dependencies()
-                continue
-
-            # Ask for query and filters
-            query = input("Enter search query: ")
-
-            chat_filter = input("Filter by chat name (optional): ")
-            start_date = input("Start date (YYYY-MM-DD, optional): ")
-            end_date = input("End date (YYYY-MM-DD, optional): ")
-            num_results = int(input("Number of results to show (default 10): ") or 10)
-            use_cache = input("Use embeddings cache if available? (y/n, default y): ").lower() != 'n'
-
-            # Clean up filters
-            filters = {}
-            if chat_filter:
-                filters['chat'] = chat_filter
-            if start_date:
-                filters['start_date'] = start_date
-            if end_date:
-                filters['end_date'] = end_date
-
-            # Perform semantic search
-            results = tool.semantic_search(
-                query=query,
-                num_results=num_results,
-                filters=filters,
-                use_cache=use_cache
-            )
+        if choice == '15':
+            # Exit
+            print("Goodbye!")
+            break
 
-            # Show results
-            print_results(results, show_context=True, contacts=tool.contacts)
-
-            # Ask if user wants to save results
-            save_option = input("Do you want to save these results to a file? (y/n): ")
-            if save_option.lower() == 'y':
-                filename = input("Enter filename to save results: ")
-                save_results_to_file(results, filename, contacts=tool.contacts)
-
-        elif choice == '6':
-            # Extract entities
-            if not ML_AVAILABLE:
-                print("ML dependencies not available. Please install them first.")
-                install_option = input("Do you want to install ML dependencies now? (y/n): ")
-                if install_option.lower() == 'y':
-                    install_ml_dependencies()
-                continue
+        handler = MENU_HANDLERS.get(choice)
+        if handler is None:
+            print("Invalid choice. Please enter a number between 1 and 15.")
+        elif choice in ML_MENU_CHOICES and not ML_AVAILABLE:
+            print("ML dependencies not available. Please install them first.")
+            install_option = input("Do you want to install ML dependencies now? (y/n): ")
+            if install_option.lower() == 'y':
+                install_ml_dependencies()
+        else:
+            handler(tool)
 
-            # Ask for filters
-            chat_filter = input("Filter by chat name (optional): ")
-            start_date = input("Start date (YYYY-MM-DD, optional): ")
-            end_date = input("End date (YYYY-MM-DD, optional): ")
-
-            # Clean up filters
-            filters = {}
-            if chat_filter:
-                filters['chat'] = chat_filter
-            if start_date:
-                filters['start_date'] = start_date
-            if end_date:
-                filters['end_date'] = end_date
-
-            # Extract entities
-            results = tool.extract_entities(filters=filters)
-
-            # Ask if user wants to save results
-            save_option = input("Do you want to save these results to a file? (y/n): ")
-            if save_option.lower() == 'y':
-                filename = input("Enter filename to save results: ")
-                save_results_to_file(results, filename, contacts=tool.contacts)
-
-        elif choice == '7':
-            # Cluster messages
-            if not ML_AVAILABLE:
-                print("ML dependencies not available. Please install them first.")
-                install_option = input("Do you want to install ML dependencies now? (y/n): ")
-                if install_option.lower() == 'y':
-                    install_ml_dependencies()
-                continue
 
-            # Ask for filters
-            chat_filter = input("Filter by chat name (optional): ")
-            start_date = input("Start date (YYYY-MM-DD, optional): ")
-            end_date = input("End date (YYYY-MM-DD, optional): ")
-            num_clusters = int(input("Number of clusters to create (default 5): ") or 5)
-
-            # Clean up filters
-            filters = {}
-            if chat_filter:
-                filters['chat'] = chat_filter
-            if start_date:
-                filters['start_date'] = start_date
-            if end_date:
-                filters['end_date'] = end_date
-
-            # Cluster messages
-            results = tool.cluster_messages(
-                num_clusters=num_clusters,
-                filters=filters
-            )
+# Command-line mode handlers: each takes (tool, args, filters) and returns the results to save
+def _h_search(tool, args, filters):
+    return search_command_handler(tool, args)
 
-            # Ask if user wants to save results
-            save_option = input("Do you want to save these results to a file? (y/n): ")
-            if save_option.lower() == 'y':
-                filename = input("Enter filename to save results: ")
-                save_results_to_file(results, filename, contacts=tool.contacts)
-
-        elif choice == '8':
-            # Run complete analysis
-            if not ML_AVAILABLE:
-                print("ML dependencies not available. Please install them first.")
-                install_option = input("Do you want to install ML dependencies now? (y/n): ")
-                if install_option.lower() == 'y':
-                    install_ml_dependencies()
-                continue
 
-            # Ask for filters
-            chat_filter = input("Filter by chat name (optional): ")
-            start_date = input("Start date (YYYY-MM-DD, optional): ")
-            end_date = input("End date (YYYY-MM-DD, optional): ")
-            num_topics = int(input("Number of topics to extract (default 5): ") or 5)
-            num_clusters = int(input("Number of clusters to create (default 5): ") or 5)
-
-            # Clean up filters
-            filters = {}
-            if chat_filter:
-                filters['chat'] = chat_filter
-            if start_date:
-                filters['start_date'] = start_date
-            if end_date:
-                filters['end_date'] = end_date
-
-            # Run complete analysis
-            results = tool.complete_analysis(
-                filters=filters,
-                num_topics=num_topics,
-                num_clusters=num_clusters
-            )
+def _h_sentiment(tool, args, filters):
+    return tool.analyze_sentiment(filters=filters, use_cache=args.use_cache)
 
-            # Ask if user wants to save results
-            save_option = input("Do you want to save these results to a file? (y/n): ")
-            if save_option.lower() == 'y':
-                filename = input("Enter filename to save results: ")
-                save_results_to_file(results, filename, contacts=tool.contacts)
-
-        elif choice == '9':
-            # Manage contact corrections
-            print("\n=== Manage Contact Corrections ===")
-            print("1. Create/Update corrections file")
-            print("2. Apply corrections to data")
-            print("3. Back to main menu")
-
-            subchoice = input("\nEnter your choice (1-3): ")
-
-            if subchoice == '1':
-                # Create/Update corrections file
-                from whatsapp_core import create_corrections_file
-                success = create_corrections_file(tool.data, tool.contacts)
-                if success:
-                    print("Corrections file created/updated successfully.")
-                    print("Edit the file 'contact_corrections.json' to add your corrections.")
-                else:
-                    print("Failed to create/update corrections file.")
 
-            elif subchoice == '2':
-                # Apply corrections to data
-                from whatsapp_core import apply_manual_corrections
-                tool.data = apply_manual_corrections(tool.data)
-                print("Corrections applied to data.")
+def _h_topics(tool, args, filters):
+    topics, certainties = tool.extract_topics(
+        num_topics=args.num_topics,
+        filters=filters,
+        workers=args.lda_workers,
+        passes=args.lda_passes,
+        use_cache=args.use_cache
+    )
+    return {
+        'topics': topics,
+        'certainties': certainties
+    }
 
-            elif subchoice == '3':
-                # Back to main menu
-                continue
 
-            else:
-                print("Invalid choice. Please enter a number between 1 and 3.")
+def _h_semantic(tool, args, filters):
+    if not args.query:
+        print("Error: --query must be specified for semantic search mode.")
+        return None
 
-        elif choice == '10':
-            # Analyze relevant contacts
-            analyze_relevant_contacts(tool)
+    results = tool.semantic_search(
+        query=args.query,
+        num_results=args.max_results,
+        filters=filters,
+        use_cache=args.use_cache,
+        cache_threshold=args.cache_threshold,
+        batch_size=args.embed_batch_size
+    )
 
-        elif choice == '11':
-            # Analyze messages
-            analyze_messages(tool)
+    print_results(results, show_context=True, contacts=tool.contacts)
+    return results
 
-        elif choice == '12':
-            # Analyze relevant chats
-            analyze_relevant_chats(tool)
 
-        elif choice == '13':
-            # Analizar prospectos de ventas
-            analyze_sales_prospects(tool)
+def _h_entities(tool, args, filters):
+    return tool.extract_entities(filters=filters, batch_size=args.spacy_batch_size,
+                                 use_cache=args.use_cache)
 
-        elif choice == '14':
-            # Manage Google Contacts
-            print("\n=== Manage Google Contacts ===")
-            print("1. Load Google Contacts CSV file")
-            print("2. Show loaded Google Contacts")
-            print("3. Back to main menu")
 
-            subchoice = input("\nEnter your choice (1-3): ")
+def _h_clusters(tool, args, filters):
+    return tool.cluster_messages(
+        num_clusters=args.num_clusters,
+        filters=filters,
+        use_cache=args.use_cache
+    )
 
-            if subchoice == '1':
-                # Load Google Contacts CSV file
-                if not GOOGLE_CONTACTS_AVAILABLE:
-                    print("Google Contacts support is not available. Make sure google_contacts.py is in the same directory.")
-                    continue
 
-                file_path = input("Enter path to Google Contacts CSV file: ")
-                if file_path:
-                    success = tool.load_google_contacts(file_path)
-                    if success:
-                        print(f"Successfully loaded {len(tool.google_contacts)} contacts from Google Contacts CSV.")
-                    else:
-                        print("Failed to load Google Contacts CSV file.")
-                else:
-                    print("No file path provided.")
+def _h_all(tool, args, filters):
+    return tool.complete_analysis(
+        filters=filters,
+        num_topics=args.num_topics,
+        num_clusters=args.num_clusters,
+        use_cache=args.use_cache
+    )
 
-            elif subchoice == '2':
-                # Show loaded Google Contacts
-                if not tool.google_contacts:
-                    print("No Google Contacts loaded. Use option 1 to load a Google Contacts CSV file.")
-                    continue
 
-                print(f"\nLoaded {len(tool.google_contacts)} Google Contacts:")
+def _h_corrections(tool, args, filters):
+    if args.create_corrections:
+        print("Creating/updating corrections file...")
+        success = create_corrections_file(tool.data, tool.contacts)
+        if success:
+            print("Corrections file created/updated successfully.")
+            print("Edit the file 'contact_corrections.json' to add your corrections.")
+        else:
+            print("Failed to create/update corrections file.")
 
-                # Show a sample of contacts
-                sample_size = min(10, len(tool.google_contacts))
-                sample_contacts = list(tool.google_contacts.items())[:sample_size]
+    if args.apply_corrections:
+        print("Applying corrections to data...")
+        tool.data = apply_manual_corrections(tool.data)
+        tool.mark_data_modified()
+        print("Corrections applied to data.")
 
-                for i, (phone, contact) in enumerate(sample_contacts, 1):
-                    print(f"\n{i}. {contact['display_name']}")
-                    print(f"   Phone: {contact.get('phone', 'N/A')}")
-                    print(f"   Raw Phone: {contact.get('phone_raw', 'N/A')}")
+    # Si no se especificó ninguna acción, mostrar ayuda
+    if not args.create_corrections and not args.apply_corrections:
+        print("Error: For corrections mode, specify at least one of --create-corrections or --apply-corrections")
 
-                if len(tool.google_contacts) > sample_size:
-                    print(f"\n... and {len(tool.google_contacts) - sample_size} more contacts.")
+    # No hay resultados para guardar en este modo
+    return None
 
-            elif subchoice == '3':
-                # Back to main menu
-                continue
 
-            else:
-                print("Invalid choice. Please enter a number between 1 and 3.")
+MODE_HANDLERS = {
+    'search': _h_search,
+    'sentiment': _h_sentiment,
+    'topics': _h_topics,
+    'semantic': _h_semantic,
+    'entities': _h_entities,
+    'clusters': _h_clusters,
+    'all': _h_all,
+    'corrections': _h_corrections,
+}
 
-        elif choice == '15':
-            # Exit
-            print("Goodbye!")
-            break
 
-        else:
-            print("Invalid choice. Please enter a number between 1 and 15.")
+def _positive_int(value):
+    """argparse type for options that must be a positive integer"""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value!r}")
+    return number
+
+
+def _env_positive_int(name, default):
+    """Read a positive integer default from an environment variable, falling back on invalid values"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return _positive_int(value)
+    except argparse.ArgumentTypeError:
+        print(f"Ignoring {name}={value!r}: not a positive integer, using {default}")
+        return default
 
 
 def main():
@@ -1990,13 +2633,15 @@ def main():
                        help='Path to Google Contacts CSV export file')
     parser.add_argument('--interactive', '-i', action='store_true',
                        help='Run in interactive mode')
+    parser.add_argument('--debug', action='store_true',
+                       help='Print the full traceback when a mode fails')
 
     # Output option
-    parser.add_argument('--output', '-o', help='Save results to file')
+    parser.add_argument('--output', '-o',
+                       help='Save results to file (.json, .md, .json.gz, .json.zst or .msgpack.zst)')
 
     # Mode selection
-    parser.add_argument('--mode', choices=['search', 'sentiment', 'topics', 'semantic',
-                                         'entities', 'clusters', 'all', 'corrections'],
+    parser.add_argument('--mode', choices=list(MODE_HANDLERS),
                        help='Analysis mode (required unless in interactive mode)')
 
     # Search options
@@ -2022,12 +2667,27 @@ def main():
     parser.add_argument('--query', '-q', help='Query for semantic search')
     parser.add_argument('--num-topics', '-t', type=int, default=5,
                        help='Number of topics to extract')
+    parser.add_argument('--lda-workers', type=int, default=None,
+                       help='Worker processes for gensim LDA topic extraction (default: CPU count - 1)')
+    parser.add_argument('--lda-passes', type=int, default=4,
+                       help='Training passes for gensim LDA topic extraction')
     parser.add_argument('--num-clusters', type=int, default=5,
                        help='Number of clusters to create')
     parser.add_argument('--use-cache', action='store_true', default=True,
-                       help='Use embeddings cache for semantic search if available')
+                       help='Use embeddings cache for semantic search and cached results of '
+                            'sentiment, topics, entities and clusters if available')
     parser.add_argument('--no-cache', action='store_false', dest='use_cache',
-                       help='Do not use embeddings cache for semantic search')
+                       help='Do not use embeddings cache or cached analysis results')
+    parser.add_argument('--cache-threshold', type=float, default=None,
+                       help='Cosine similarity (0-1) above which a previous semantic query\'s '
+                            'cached results are reused (default: 0.95)')
+    parser.add_argument('--embed-batch-size', type=int, default=None,
+                       help='Messages per sentence-transformer forward pass in semantic search '
+                            '(default: 256 on GPU, 32 on CPU)')
+    parser.add_argument('--spacy-batch-size', type=_positive_int,
+                       default=_env_positive_int('WACE_SPACY_BATCH_SIZE', 64),
+                       help='Messages per spaCy batch for entity extraction '
+                            '(default: $WACE_SPACY_BATCH_SIZE or 64)')
 
     # Filter options
     parser.add_argument('--chat', help='Filter by chat name')
@@ -2045,6 +2705,13 @@ def main():
     # Parse arguments
     args = parser.parse_args()
 
+    # Validate the mode before loading any data or backend
+    if not args.interactive and not args.mode:
+        print("Error: --mode must be specified when not in interactive mode.")
+        parser.print_help()
+        return
+    handler = None if args.interactive else MODE_HANDLERS[args.mode]
+
     # Check if ML dependencies should be installed
     if args.mode in ['sentiment', 'topics', 'semantic', 'entities', 'clusters', 'all']:
         if not ML_AVAILABLE:
@@ -2065,101 +2732,27 @@ def main():
         interactive_mode(tool)
         return
 
-    # If not in interactive mode, a mode must be specified
-    if not args.mode:
-        print("Error: --mode must be specified when not in interactive mode.")
-        parser.print_help()
-        return
-
     # Get filters from command line arguments
-    filters = {
-        'chat': args.chat,
-        'sender': args.sender,
-        'phone': args.phone,
-        'start_date': args.start_date,
-        'end_date': args.end_date
-    }
+    filters = Filters(
+        chat=args.chat,
+        sender=args.sender,
+        phone=args.phone,
+        start_date=args.start_date,
+        end_date=args.end_date
+    )
 
     # Run in the selected mode
     results = None
 
     try:
-        if args.mode == 'search':
-            from chat_search import search_command_handler
-            results = search_command_handler(tool, args)
-
-        elif args.mode == 'sentiment':
-            results = tool.analyze_sentiment(filters=filters)
-
-        elif args.mode == 'topics':
-            topics, certainties = tool.extract_topics(
-                num_topics=args.num_topics,
-                filters=filters
-            )
-            results = {
-                'topics': topics,
-                'certainties': certainties
-            }
-
-        elif args.mode == 'semantic':
-            if not args.query:
-                print("Error: --query must be specified for semantic search mode.")
-                return
-
-            results = tool.semantic_search(
-                query=args.query,
-                num_results=args.max_results,
-                filters=filters,
-                use_cache=args.use_cache
-            )
-
-            print_results(results, show_context=True, contacts=tool.contacts)
-
-        elif args.mode == 'entities':
-            results = tool.extract_entities(filters=filters)
-
-        elif args.mode == 'clusters':
-            results = tool.cluster_messages(
-                num_clusters=args.num_clusters,
-                filters=filters
-            )
-
-        elif args.mode == 'all':
-            results = tool.complete_analysis(
-                filters=filters,
-                num_topics=args.num_topics,
-                num_clusters=args.num_clusters
-            )
-
-        elif args.mode == 'corrections':
-            from whatsapp_core import create_corrections_file, apply_manual_corrections
-
-            if args.create_corrections:
-                print("Creating/updating corrections file...")
-                success = create_corrections_file(tool.data, tool.contacts)
-                if success:
-                    print("Corrections file created/updated successfully.")
-                    print("Edit the file 'contact_corrections.json' to add your corrections.")
-                else:
-                    print("Failed to create/update corrections file.")
-
-            if args.apply_corrections:
-                print("Applying corrections to data...")
-                tool.data = apply_manual_corrections(tool.data)
-                print("Corrections applied to data.")
-
-            # Si no se especificó ninguna acción, mostrar ayuda
-            if not args.create_corrections and not args.apply_corrections:
-                print("Error: For corrections mode, specify at least one of --create-corrections or --apply-corrections")
-                return
-
-            # No hay resultados para guardar en este modo
-            results = None
+        results = handler(tool, args, filters)
 
     except Exception as e:
         print(f"Error: {str(e)}")
-        traceback.print_exc()
-        return
+        if args.debug:
+            import traceback
+            traceback.print_exc()
+        sys.exit(1)
 
     # Save results if output file specified
     if args.output and results: